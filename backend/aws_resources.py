@@ -0,0 +1,85 @@
+"""ウォームコンテナで再利用するAWSリソース
+
+boto3のリソース作成は数十〜数百msかかるため、Lambdaのコンテナが生きている間は
+モジュール変数に保持して使い回す。
+"""
+
+import threading
+import time
+from typing import Any, Dict, List
+
+# batch_get_item で1回に読み込めるキーの数
+BATCH_GET_MAX_KEYS = 100
+# 未処理のキー（UnprocessedKeys）を読み直す回数
+BATCH_GET_MAX_ATTEMPTS = 5
+
+_lock = threading.Lock()
+_resources: Dict[str, Any] = {}
+_tables: Dict[str, Any] = {}
+
+
+def dynamodb_resource() -> Any:
+    """DynamoDBリソースを返す（初回のみ作成）"""
+    with _lock:
+        if "dynamodb" not in _resources:
+            import boto3
+
+            _resources["dynamodb"] = boto3.resource("dynamodb")
+        return _resources["dynamodb"]
+
+
+def dynamodb_table(name: str) -> Any:
+    """DynamoDBテーブルを返す（テーブル名ごとに初回のみ作成）"""
+    table = _tables.get(name)
+    if table is None:
+        resource = dynamodb_resource()
+        with _lock:
+            table = _tables.setdefault(name, resource.Table(name))
+    return table
+
+
+def batch_get_items(table_name: str, keys: List[str]) -> List[Dict]:
+    """パーティションキー cache_key のアイテムを batch_get_item でまとめて読み込む
+
+    BATCH_GET_MAX_KEYS 件ずつ読み込み、スロットリングで未処理になったキーは
+    間隔を空けて読み直す。読み直しても残ったキーは結果に含まれない。
+
+    Returns:
+        見つかったアイテム（順不同）
+    """
+    import metrics
+    from logger import log
+
+    keys = list(dict.fromkeys(keys))
+    resource = dynamodb_resource()
+    items: List[Dict] = []
+    for start in range(0, len(keys), BATCH_GET_MAX_KEYS):
+        request = {
+            table_name: {
+                "Keys": [
+                    {"cache_key": key}
+                    for key in keys[start : start + BATCH_GET_MAX_KEYS]
+                ]
+            }
+        }
+        for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+            response = resource.batch_get_item(RequestItems=request)
+            items.extend(response.get("Responses", {}).get(table_name, []))
+            request = response.get("UnprocessedKeys") or {}
+            if not request:
+                break
+            metrics.increment("dynamodb_unprocessed_retries")
+            time.sleep(0.05 * 2**attempt)
+        else:
+            log.warning(
+                "batch_get_item で未処理のキーが残った: %d件",
+                len(request[table_name]["Keys"]),
+            )
+    return items
+
+
+def reset() -> None:
+    """保持しているリソースを破棄（認証情報やリージョンを切り替えた場合に使う）"""
+    with _lock:
+        _resources.clear()
+        _tables.clear()
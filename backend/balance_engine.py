@@ -0,0 +1,225 @@
+"""チーム分け・ロール割り当ての全探索エンジン
+
+10人を5人ずつに分ける組み合わせは252通り、5人に5ロールを割り当てる順列は
+120通りしかないため、インデックス表を事前計算しておきNumPyで一括評価する。
+"""
+
+from functools import lru_cache
+from itertools import combinations, permutations
+from typing import List, Tuple
+
+import numpy as np
+
+TEAM_SIZE = 5
+N_PLAYERS = TEAM_SIZE * 2
+
+# 10人から5人を選ぶ全組み合わせ（252 x 5）。行番号を「分け方ID」として扱う
+SUBSET_TABLE = np.array(
+    list(combinations(range(N_PLAYERS), TEAM_SIZE)), dtype=np.intp
+)
+N_SPLITS = len(SUBSET_TABLE)
+
+# 分け方ごとのチームA所属マスク（252 x 10）
+SPLIT_MASKS = np.zeros((N_SPLITS, N_PLAYERS), dtype=bool)
+SPLIT_MASKS[np.arange(N_SPLITS)[:, None], SUBSET_TABLE] = True
+
+# チームA=+1, チームB=-1 の符号表。差分計算を行列積1回で済ませる
+SPLIT_SIGNS = np.where(SPLIT_MASKS, 1.0, -1.0)
+
+# 各分け方の補集合（チームAとBを入れ替えた分け方）のID
+_SPLIT_BITS = SPLIT_MASKS @ (1 << np.arange(N_PLAYERS))
+_BITS_TO_SPLIT = {int(bits): split_id for split_id, bits in enumerate(_SPLIT_BITS)}
+COMPLEMENT_IDS = np.array(
+    [_BITS_TO_SPLIT[int(bits) ^ ((1 << N_PLAYERS) - 1)] for bits in _SPLIT_BITS],
+    dtype=np.intp,
+)
+
+# 5人へのロール割り当ての全順列（120 x 5）。
+# ROLE_PERMUTATIONS[p, i] はプレイヤーiに割り当てるロールのインデックス
+ROLE_PERMUTATIONS = np.array(list(permutations(range(TEAM_SIZE))), dtype=np.intp)
+
+
+def feasible_mask(components: List[Tuple[List[int], List[int]]]) -> np.ndarray:
+    """チーム制約を満たす分け方のマスクを返す
+
+    制約ブロックの連結成分ごとに「どちらの側をチームAに入れるか」だけを列挙し、
+    5人ちょうどになる組み合わせの分け方IDを立てる。
+
+    Args:
+        components: team_constraints.ConstraintPlan.components と同じ形式の
+            (片側のプレイヤーインデックス, 反対側のプレイヤーインデックス) のリスト
+    """
+    key = tuple(
+        sorted(
+            (sum(1 << i for i in side0), sum(1 << i for i in side1))
+            for side0, side1 in components
+        )
+    )
+    return _feasible_mask(key)
+
+
+@lru_cache(maxsize=1024)
+def _feasible_mask(component_bits: Tuple[Tuple[int, int], ...]) -> np.ndarray:
+    team_a_bits = {0}
+    for side_bits in component_bits:
+        team_a_bits = {
+            bits | side
+            for bits in team_a_bits
+            for side in side_bits
+            if (bits | side).bit_count() <= TEAM_SIZE
+        }
+
+    feasible = np.zeros(N_SPLITS, dtype=bool)
+    for bits in team_a_bits:
+        if bits.bit_count() == TEAM_SIZE:
+            feasible[_BITS_TO_SPLIT[bits]] = True
+    feasible.flags.writeable = False
+    return feasible
+
+
+def score_splits(
+    rank_scores: np.ndarray,
+    role_scores: np.ndarray,
+    assignment_noise: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """全ての分け方のランク差・ロール差・目的関数値を計算
+
+    Args:
+        rank_scores: プレイヤーごとのランクスコア（10,）
+        role_scores: プレイヤーごとのロール習熟度合計（10,）
+        assignment_noise: プレイヤーとチームの組み合わせごとのノイズ（10, 2）
+
+    Returns:
+        (ランク差, ロール差, 目的関数値) それぞれ (252,)
+    """
+    rank_diff = SPLIT_SIGNS @ rank_scores
+    role_diff = SPLIT_SIGNS @ role_scores
+    objective = np.abs(rank_diff) + np.abs(role_diff) + _split_noise(assignment_noise)
+    return rank_diff, role_diff, objective
+
+
+def _split_noise(assignment_noise: np.ndarray) -> np.ndarray:
+    """プレイヤーとチームの組み合わせごとのノイズを分け方ごとに合計"""
+    return (
+        SPLIT_MASKS @ assignment_noise[:, 0] + ~SPLIT_MASKS @ assignment_noise[:, 1]
+    )
+
+
+def candidate_mask(
+    rank_diff: np.ndarray,
+    role_diff: np.ndarray,
+    feasible: np.ndarray,
+    rank_limit: float,
+    role_limit: float,
+) -> np.ndarray:
+    """選択候補となる分け方のマスクを返す
+
+    ランク差・ロール差の上限を満たす分け方が無い場合は、
+    チーム制約のみを満たす分け方を候補とする。
+    """
+    if not feasible.any():
+        raise ValueError("No team split satisfies the team constraint groups")
+
+    within_limits = (
+        feasible
+        & (np.abs(rank_diff) <= rank_limit)
+        & (np.abs(role_diff) <= role_limit)
+    )
+    return within_limits if within_limits.any() else feasible
+
+
+def swap_distance(split_id: int, other_ids: np.ndarray) -> np.ndarray:
+    """分け方同士の距離（チームを入れ替わるプレイヤーのペア数）を計算
+
+    チームAとBを入れ替えただけの分け方は距離0になる。
+    """
+    overlap = (SPLIT_MASKS[other_ids] & SPLIT_MASKS[split_id]).sum(axis=1)
+    return np.minimum(overlap, TEAM_SIZE - overlap)
+
+
+def rank_splits(
+    objective: np.ndarray,
+    candidates: np.ndarray,
+    k: int,
+    min_swaps: int = 1,
+) -> List[int]:
+    """目的関数の小さい順に、互いに異なる分け方IDを最大k個返す
+
+    Args:
+        objective: 分け方ごとの目的関数値（252,）
+        candidates: 選択候補のマスク（252,）
+        k: 返す分け方の最大数
+        min_swaps: 選択済みの分け方との最小距離。
+            2以上にすると1ペアの入れ替えだけの分け方を除外する
+    """
+    order = np.argsort(np.where(candidates, objective, np.inf), kind="stable")
+
+    chosen: List[int] = []
+    for split_id in order[: int(candidates.sum())]:
+        if chosen and swap_distance(split_id, np.array(chosen)).min() < min_swaps:
+            continue
+        chosen.append(int(split_id))
+        if len(chosen) == k:
+            break
+    return chosen
+
+
+def best_role_assignments(score_matrices: np.ndarray) -> np.ndarray:
+    """複数チームの最適なロール割り当てを一括で求める
+
+    Args:
+        score_matrices: チームごとのスコア行列（チーム数, 5, 5）。
+            [t, i, j] はチームtのプレイヤーiをロールjに割り当てた場合のスコア
+
+    Returns:
+        チームごとの各プレイヤーのロールインデックス（チーム数, 5）。
+        同点の場合は辞書順で最初の順列を選ぶ
+    """
+    players = np.arange(TEAM_SIZE)
+    # (チーム数, 120, 5) -> (チーム数, 120)
+    totals = score_matrices[:, players, ROLE_PERMUTATIONS].sum(axis=2)
+    return ROLE_PERMUTATIONS[np.argmax(totals, axis=1)]
+
+
+# ジョイントモードでロール適性の合計（両チームのラインナップスコアの和）に掛ける重み。
+# チーム間の差を優先しつつ、同程度の差なら両チームとも役割が揃う分け方を選ぶ
+JOINT_COVERAGE_WEIGHT = 0.25
+
+
+def best_lineup_table(score_matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """5人組み合わせごとの最適ロール割り当てスコアを計算
+
+    Args:
+        score_matrix: プレイヤーとロールのスコア行列（10, 5）
+
+    Returns:
+        (ラインナップスコア (252,), 最適な順列ID (252,))
+    """
+    players = np.arange(TEAM_SIZE)
+    # (252, 5, 5) -> (252, 120)
+    subset_matrices = score_matrix[SUBSET_TABLE]
+    totals = subset_matrices[:, players, ROLE_PERMUTATIONS].sum(axis=2)
+    best_permutations = np.argmax(totals, axis=1)
+    return totals[np.arange(N_SPLITS), best_permutations], best_permutations
+
+
+def score_joint_splits(
+    rank_scores: np.ndarray,
+    lineup_scores: np.ndarray,
+    assignment_noise: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ラインナップスコアを使って全ての分け方を評価
+
+    Returns:
+        (ランク差, ラインナップスコア差, 目的関数値) それぞれ (252,)
+    """
+    rank_diff = SPLIT_SIGNS @ rank_scores
+    lineup_b = lineup_scores[COMPLEMENT_IDS]
+    role_diff = lineup_scores - lineup_b
+    objective = (
+        np.abs(rank_diff)
+        + np.abs(role_diff)
+        - JOINT_COVERAGE_WEIGHT * (lineup_scores + lineup_b)
+        + _split_noise(assignment_noise)
+    )
+    return rank_diff, role_diff, objective
@@ -1,7 +1,19 @@
 import random
-from typing import Dict, List, Tuple
+import time
+from typing import Dict, List, Optional, Tuple, Union
 from pydantic import BaseModel
-import pulp
+import numpy as np
+
+import balance_engine
+import solvers
+from roster import (
+    PREFERRED_ROLE_BONUS,
+    ROLES,
+    UNPREFERRED_ROLE_PENALTY,
+    CompactRoster,
+    rank_score,
+)
+from team_constraints import presolve_constraints
 
 class RoleProficiency(BaseModel):
     TOP: int
@@ -35,41 +47,27 @@ class TeamStats(BaseModel):
     topRoles: Dict[str, int]
     commonChampions: List[ChampionStats]
 
+class BalanceOption(BaseModel):
+    teamA: List[Summoner]
+    teamB: List[Summoner]
+    teamAStats: TeamStats
+    teamBStats: TeamStats
+    rankDiff: float
+    roleDiff: float
+
 def get_rank_score(rank: str) -> float:
     """ランクを数値スコアに変換"""
-    rank_values = {
-        "IRON": 0,
-        "BRONZE": 4,
-        "SILVER": 8,
-        "GOLD": 12,
-        "PLATINUM": 16,
-        "EMERALD": 20,
-        "DIAMOND": 24,
-        "MASTER": 28,
-        "GRANDMASTER": 30,
-        "CHALLENGER": 31,
-    }
-
-    if rank == "UNRANKED":
-        return 0
+    return rank_score(rank)
 
-    tier = rank.split(" ")[0]
-    division = rank.split(" ")[1] if " " in rank else "0"
-    division = (
-        division.replace("IV", "4")
-        .replace("III", "3")
-        .replace("II", "2")
-        .replace("I", "1")
-    )
-
-    base_score = rank_values.get(tier, 0)
-    if division.isdigit():
-        division_score = 4 - int(division)
-        return base_score + division_score
-    return base_score
+def calculate_team_stats(
+    team: List[Summoner], roster: Optional[CompactRoster] = None
+) -> TeamStats:
+    """チームの統計情報を計算
 
-def calculate_team_stats(team: List[Summoner]) -> TeamStats:
-    """チームの統計情報を計算"""
+    Args:
+        team: チームメンバー
+        roster: team を含むロスター（省略時は team から作成）
+    """
     if not team:
         return TeamStats(
             avgRank="UNRANKED",
@@ -78,9 +76,10 @@ def calculate_team_stats(team: List[Summoner]) -> TeamStats:
             commonChampions=[]
         )
 
+    team_roster = roster.subset(team) if roster else CompactRoster.from_summoners(team)
+
     # 平均ランクスコアの計算
-    rank_scores = [get_rank_score(s.rank.combined) for s in team]
-    avg_rank_score = sum(rank_scores) / len(rank_scores)
+    avg_rank_score = float(team_roster.rank_scores.mean())
 
     # 平均ランクの決定
     rank_boundaries = {
@@ -111,10 +110,10 @@ def calculate_team_stats(team: List[Summoner]) -> TeamStats:
 
     # 得意ロールの集計
     top_roles = {"MID": 0, "TOP": 0, "JUNGLE": 0, "BOT": 0, "SUPPORT": 0}
-    for member in team:
-        for role, level in member.roleProficiency.dict().items():
-            if level > 2:  # レベル3以上を得意とみなす
-                top_roles[role] = top_roles.get(role, 0) + 1
+    # レベル3以上を得意とみなす
+    strong_counts = (team_roster.proficiency > 2).sum(axis=0)
+    for role, count in zip(ROLES, strong_counts.tolist()):
+        top_roles[role] += count
 
     return TeamStats(
         avgRank=avg_rank,
@@ -123,10 +122,134 @@ def calculate_team_stats(team: List[Summoner]) -> TeamStats:
         commonChampions=[]  # チャンピオンデータは移行後の実装で追加予定
     )
 
+BALANCE_MODES = ("standard", "joint")
+
+
+def _validate_balance_args(
+    summoners: List[Summoner], randomness: float, mode: str
+) -> None:
+    """チーム分けの引数を検証"""
+    if len(summoners) != 10:
+        raise ValueError("Need exactly 10 summoners")
+    if not 0 <= randomness <= 100:
+        raise ValueError("Randomness must be between 0 and 100")
+    if mode not in BALANCE_MODES:
+        raise ValueError(f"Unknown balance mode: {mode}")
+
+
+def _noisy_scores(
+    roster: CompactRoster, randomness: float, rng: Optional[random.Random] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """ランダム性に基づいてノイズを加えたスコアを生成
+
+    Args:
+        rng: 乱数生成器（省略時は random モジュールの共有の生成器）
+
+    Returns:
+        (ランクスコア, ロールノイズ, ロール習熟度合計, プレイヤーとチームの組み合わせごとのノイズ)
+    """
+    if rng is None:
+        rng = random
+    noise_scale = randomness / 100.0
+    n = len(roster)
+    rank_noise = np.array([rng.gauss(0, noise_scale * 10) for i in range(n)])
+    role_noise = np.array([rng.gauss(0, noise_scale * 5) for i in range(n)])
+    # 目的関数に加算するノイズ
+    assignment_noise = np.array(
+        [[rng.gauss(0, noise_scale) for j in range(2)] for i in range(n)]
+    )
+    return (
+        roster.rank_scores + rank_noise,
+        role_noise,
+        roster.role_totals + role_noise,
+        assignment_noise,
+    )
+
+
+def _diff_limits(randomness: float) -> Tuple[float, float]:
+    """チーム間のランク差・ロール差の上限"""
+    noise_scale = randomness / 100.0
+    return 20 * (1 + noise_scale), 10 * (1 + noise_scale)
+
+
+def _rank_exact_splits(
+    roster: CompactRoster,
+    randomness: float,
+    team_constraint_groups: List[Dict],
+    mode: str,
+    k: int,
+    min_swaps: int = 1,
+    rng: Optional[random.Random] = None,
+) -> Tuple[List[int], Optional[np.ndarray]]:
+    """全探索で良い順に分け方IDを求める
+
+    Returns:
+        (分け方IDのリスト, ジョイントモードの場合は組み合わせごとの最適な順列ID)
+    """
+    rank_scores, role_noise, role_scores, assignment_noise = _noisy_scores(
+        roster, randomness, rng
+    )
+    plan = presolve_constraints(
+        [s.id for s in roster.summoners], team_constraint_groups
+    )
+    rank_limit, role_limit = _diff_limits(randomness)
+
+    best_permutations = None
+    if mode == "joint":
+        # ロールごとのスコアにプレイヤー単位のノイズを加える
+        score_matrix = roster.assignment_scores + role_noise[:, None]
+        lineup_scores, best_permutations = balance_engine.best_lineup_table(
+            score_matrix
+        )
+        rank_diff, role_diff, objective = balance_engine.score_joint_splits(
+            rank_scores, lineup_scores, assignment_noise
+        )
+    else:
+        rank_diff, role_diff, objective = balance_engine.score_splits(
+            rank_scores, role_scores, assignment_noise
+        )
+
+    candidates = balance_engine.candidate_mask(
+        rank_diff,
+        role_diff,
+        balance_engine.feasible_mask(plan.components),
+        rank_limit,
+        role_limit,
+    )
+    split_ids = balance_engine.rank_splits(objective, candidates, k, min_swaps)
+    return split_ids, best_permutations
+
+
+def _apply_split(
+    summoners: List[Summoner],
+    split_id: int,
+    best_permutations: Optional[np.ndarray] = None,
+) -> Tuple[List[Summoner], List[Summoner]]:
+    """分け方IDに従ってチームを振り分け（ジョイントモードではロールも適用）"""
+    in_team_a = balance_engine.SPLIT_MASKS[split_id].tolist()
+    team_a = [s for s, is_a in zip(summoners, in_team_a) if is_a]
+    team_b = [s for s, is_a in zip(summoners, in_team_a) if not is_a]
+
+    if best_permutations is not None:
+        team_ids = (split_id, balance_engine.COMPLEMENT_IDS[split_id])
+        for team, team_id in zip((team_a, team_b), team_ids):
+            role_indices = balance_engine.ROLE_PERMUTATIONS[best_permutations[team_id]]
+            for player, role_idx in zip(team, role_indices.tolist()):
+                player.assignedRole = ROLES[role_idx]
+
+    return team_a, team_b
+
+
 def balance_teams(
     summoners: List[Summoner],
     randomness: float = 0.0,
-    team_constraint_groups: List[Dict] = None
+    team_constraint_groups: List[Dict] = None,
+    backend: Union[str, List[str], None] = None,
+    mode: str = "standard",
+    time_limit: Optional[float] = None,
+    report: Optional[Dict] = None,
+    roster: Optional[CompactRoster] = None,
+    rng: Optional[random.Random] = None,
 ) -> Tuple[List[Summoner], List[Summoner]]:
     """チーム分け最適化（ランダム性付き + チーム制約）
 
@@ -136,130 +259,169 @@ def balance_teams(
         team_constraint_groups: チーム制約グループのリスト
             例: [{"id": "group1", "summonerIds": ["sid_01", "sid_02"], "type": "same"}]
             type: "same" (同じチーム) or "opposite" (違うチーム)
+        backend: ソルバーのフォールバック順（"exact", "cbc", "highs" または
+            そのリスト・カンマ区切り）。Noneの場合は環境変数 BALANCE_SOLVER_CHAIN
+        mode: "standard" (ロール習熟度の合計で均衡) or
+            "joint" (5人組み合わせごとの最適ロール割り当てスコアで均衡し、
+            ロールも同時に割り当てる。exact バックエンドのみ対応)
+        time_limit: ソルバー全体の制限時間（秒）
+        report: 指定した場合、使用したソルバーの情報を "split" キーに書き込む
+        roster: summoners から作成済みのロスター（省略時は作成する）
+        rng: ノイズ用の乱数生成器。シードを固定した random.Random を渡すと結果が再現する
     """
-    if len(summoners) != 10:
-        raise ValueError("Need exactly 10 summoners")
-    if not 0 <= randomness <= 100:
-        raise ValueError("Randomness must be between 0 and 100")
+    _validate_balance_args(summoners, randomness, mode)
+    chain = solvers.resolve_chain(backend)
+    time_limit = solvers.resolve_time_limit(time_limit)
+    if roster is None:
+        roster = CompactRoster.from_summoners(summoners)
 
     if team_constraint_groups is None:
         team_constraint_groups = []
 
-    # ランダム性に基づいてスコアにノイズを追加
-    noise_scale = randomness / 100.0
-    rank_scores = [
-        get_rank_score(s.rank.combined) + random.gauss(0, noise_scale * 10)
-        for s in summoners
-    ]
-    role_scores = [
-        sum(s.roleProficiency.dict().values()) + random.gauss(0, noise_scale * 5)
-        for s in summoners
-    ]
-
-    # 線形計画問題の設定
-    prob = pulp.LpProblem("TeamBalancer", pulp.LpMinimize)
-    x = pulp.LpVariable.dicts(
-        "team_assignment",
-        ((i, j) for i in range(10) for j in range(2)),
-        cat="Binary"
-    )
-
-    # 制約条件1: 各プレイヤーは1つのチームのみに所属
-    for i in range(10):
-        prob += pulp.lpSum(x[i, j] for j in range(2)) == 1
-
-    # 制約条件2: 各チーム5人
-    for j in range(2):
-        prob += pulp.lpSum(x[i, j] for i in range(10)) == 5
-
-    # 制約条件3: チーム制約グループの処理
-    summoner_id_to_index = {s.id: i for i, s in enumerate(summoners)}
-
-    for group in team_constraint_groups:
-        summoner_ids = group.get("summonerIds", [])
-        constraint_type = group.get("type", "same")  # デフォルトは"same"
-
-        if len(summoner_ids) < 2:
-            continue  # グループに2人未満の場合はスキップ
-
-        # グループ内のサモナーのインデックスを取得
-        group_indices = []
-        for summoner_id in summoner_ids:
-            if summoner_id in summoner_id_to_index:
-                group_indices.append(summoner_id_to_index[summoner_id])
-
-        if len(group_indices) < 2:
-            continue  # 有効なサモナーが2人未満の場合はスキップ
-
-        if constraint_type == "same":
-            # 同じチーム制約: グループの最初のメンバーと他のメンバーが同じチームになるように制約
-            first_member = group_indices[0]
-            for member in group_indices[1:]:
-                # 両方がチームAまたは両方がチームBに割り当てられる
-                # x[first, 0] == x[member, 0] を実現
-                prob += x[first_member, 0] == x[member, 0]
-
-        elif constraint_type == "opposite":
-            # 違うチーム制約: 2人が違うチームに割り当てられる
-            if len(group_indices) == 2:
-                member1, member2 = group_indices[0], group_indices[1]
-                # 片方がチームA、もう片方がチームBに割り当てられる
-                # x[member1, 0] + x[member2, 0] == 1 を実現
-                prob += x[member1, 0] + x[member2, 0] == 1
-
-    # チーム間の差分計算
-    rank_diff = pulp.lpSum(
-        rank_scores[i] * x[i, 0] for i in range(10)
-    ) - pulp.lpSum(rank_scores[i] * x[i, 1] for i in range(10))
-    
-    role_diff = pulp.lpSum(
-        role_scores[i] * x[i, 0] for i in range(10)
-    ) - pulp.lpSum(role_scores[i] * x[i, 1] for i in range(10))
-
-    # 制約条件4: チーム間のランク差を制限
-    rank_limit = 20 * (1 + noise_scale)
-    prob += rank_diff <= rank_limit
-    prob += rank_diff >= -rank_limit
-
-    # 制約条件5: チーム間のロール習熟度差を制限
-    role_limit = 10 * (1 + noise_scale)
-    prob += role_diff <= role_limit
-    prob += role_diff >= -role_limit
-
-    # 目的関数のための補助変数
-    rank_diff_pos = pulp.LpVariable("rank_diff_pos", 0)
-    rank_diff_neg = pulp.LpVariable("rank_diff_neg", 0)
-    role_diff_pos = pulp.LpVariable("role_diff_pos", 0)
-    role_diff_neg = pulp.LpVariable("role_diff_neg", 0)
-
-    prob += rank_diff == rank_diff_pos - rank_diff_neg
-    prob += role_diff == role_diff_pos - role_diff_neg
-
-    # 目的関数
-    prob += (
-        rank_diff_pos
-        + rank_diff_neg
-        + role_diff_pos
-        + role_diff_neg
-        + pulp.lpSum(
-            random.gauss(0, noise_scale) * x[i, j]
-            for i in range(10) for j in range(2)
+    if mode == "joint":
+        if "exact" not in chain:
+            raise ValueError("Joint mode requires the exact backend")
+        started_at = time.perf_counter()
+        split_ids, best_permutations = _rank_exact_splits(
+            roster, randomness, team_constraint_groups, mode, k=1, rng=rng
         )
+        if report is not None:
+            report["split"] = report["roles"] = {
+                "backend": "exact",
+                "elapsedMs": (time.perf_counter() - started_at) * 1000,
+                "fallbacks": [],
+            }
+        return _apply_split(summoners, split_ids[0], best_permutations)
+
+    rank_scores, _, role_scores, assignment_noise = _noisy_scores(
+        roster, randomness, rng
     )
-
-    # 最適化問題を解く
-    prob.solve()
+    rank_limit, role_limit = _diff_limits(randomness)
+    problem = solvers.SplitProblem(
+        rank_scores,
+        role_scores,
+        assignment_noise,
+        presolve_constraints([s.id for s in summoners], team_constraint_groups),
+        rank_limit,
+        role_limit,
+    )
+    in_team_a, solver_info = solvers.run_with_fallback(
+        solvers.SPLIT_SOLVERS, chain, problem, time_limit
+    )
+    if report is not None:
+        report["split"] = solver_info
 
     # チームの振り分け
-    team_a = []
-    team_b = []
-    for i in range(10):
-        if pulp.value(x[i, 0]) == 1:
-            team_a.append(summoners[i])
+    team_a = [s for s, is_a in zip(summoners, in_team_a) if is_a]
+    team_b = [s for s, is_a in zip(summoners, in_team_a) if not is_a]
+    return team_a, team_b
+
+
+def balance_teams_top_k(
+    summoners: List[Summoner],
+    k: int = 3,
+    randomness: float = 0.0,
+    team_constraint_groups: List[Dict] = None,
+    mode: str = "standard",
+    diversify: bool = False,
+    assign_roles: bool = True,
+    report: Optional[Dict] = None,
+    roster: Optional[CompactRoster] = None,
+    rng: Optional[random.Random] = None,
+) -> List[BalanceOption]:
+    """良い順に互いに異なるチーム分けを最大k個求める
+
+    Args:
+        summoners: サモナーリスト（10人）
+        k: 返すチーム分けの最大数
+        randomness: ランダム性（0-100）
+        team_constraint_groups: チーム制約グループのリスト（balance_teams と同じ形式）
+        mode: "standard" or "joint"（balance_teams と同じ）
+        diversify: Trueの場合、1ペアの入れ替えだけで済む分け方同士を候補から除く
+        assign_roles: ロールを割り当てるか
+        report: 指定した場合、使用したソルバーの情報を書き込む
+            （チーム分けは常に全探索エンジン）
+        roster: summoners から作成済みのロスター（省略時は作成する）
+        rng: ノイズ用の乱数生成器。シードを固定した random.Random を渡すと結果が再現する
+    """
+    _validate_balance_args(summoners, randomness, mode)
+    if not 1 <= k <= balance_engine.N_SPLITS // 2:
+        raise ValueError(f"k must be between 1 and {balance_engine.N_SPLITS // 2}")
+
+    if team_constraint_groups is None:
+        team_constraint_groups = []
+    if roster is None:
+        roster = CompactRoster.from_summoners(summoners)
+
+    started_at = time.perf_counter()
+    split_ids, best_permutations = _rank_exact_splits(
+        roster,
+        randomness,
+        team_constraint_groups,
+        mode,
+        k=k,
+        min_swaps=2 if diversify else 1,
+        rng=rng,
+    )
+    if report is not None:
+        report["split"] = {
+            "backend": "exact",
+            "elapsedMs": (time.perf_counter() - started_at) * 1000,
+            "fallbacks": [],
+        }
+        if mode == "joint":
+            report["roles"] = report["split"]
+
+    # 選択肢ごとにロールが異なるため、サモナーを複製して振り分ける
+    teams = []
+    copies = []
+    for split_id in split_ids:
+        option_copies = [s.model_copy(deep=True) for s in summoners]
+        copies.extend(option_copies)
+        teams.extend(_apply_split(option_copies, split_id, best_permutations))
+    # 複製全体を1つのロスターとして扱い、配列は元のロスターから作る
+    copies_roster = roster.take(list(range(len(summoners))) * len(split_ids)).rebind(
+        copies
+    )
+
+    if not assign_roles:
+        for team in teams:
+            for s in team:
+                s.assignedRole = None
+    elif mode != "joint":
+        teams = assign_roles_to_teams(teams, report=report, roster=copies_roster)
+
+    options = []
+    for team_a, team_b in zip(teams[0::2], teams[1::2]):
+        roster_a = copies_roster.subset(team_a)
+        roster_b = copies_roster.subset(team_b)
+        rank_diff = float(roster_a.rank_scores.sum() - roster_b.rank_scores.sum())
+        if mode == "joint" and assign_roles:
+            role_diff = _lineup_score(roster_a) - _lineup_score(roster_b)
         else:
-            team_b.append(summoners[i])
+            role_diff = float(roster_a.role_totals.sum() - roster_b.role_totals.sum())
+
+        options.append(
+            BalanceOption(
+                teamA=team_a,
+                teamB=team_b,
+                teamAStats=calculate_team_stats(team_a, roster_a),
+                teamBStats=calculate_team_stats(team_b, roster_b),
+                rankDiff=rank_diff,
+                roleDiff=role_diff,
+            )
+        )
+
+    return options
+
+
+def _lineup_score(team_roster: CompactRoster) -> float:
+    """割り当て済みロールでのチームのスコア合計"""
+    role_indices = [ROLES.index(s.assignedRole) for s in team_roster.summoners]
+    return float(
+        team_roster.assignment_scores[np.arange(len(team_roster)), role_indices].sum()
+    )
 
-    return team_a, team_b
 
 def normalize_rank_format(summoners: List[Summoner]) -> List[Summoner]:
     """ランク形式を標準化"""
@@ -279,70 +441,67 @@ def normalize_rank_format(summoners: List[Summoner]) -> List[Summoner]:
 
     return summoners
 
-def assign_roles_to_team(team: List[Summoner]) -> List[Summoner]:
-    """チームメンバーにロールを割り当て（線形計画法）"""
-    if len(team) != 5:
-        raise ValueError("Team must have exactly 5 members")
+def get_assignment_score(player: Summoner, role: str) -> float:
+    """プレイヤーとロールの組み合わせのスコアを計算"""
+    # ベーススコア: ロール熟練度
+    base_score = getattr(player.roleProficiency, role)
 
-    roles = ["TOP", "JUNGLE", "MID", "BOT", "SUPPORT"]
-    n_players = len(team)
+    # 希望ロールボーナス
+    preference_bonus = 0
+    if player.preferredRoles and role in player.preferredRoles:
+        # 希望ロールの場合、大きなボーナス
+        preference_bonus = PREFERRED_ROLE_BONUS
+    elif player.preferredRoles and len(player.preferredRoles) > 0:
+        # 希望ロールがあるが該当しない場合、ペナルティ
+        preference_bonus = UNPREFERRED_ROLE_PENALTY
 
-    # 線形計画問題の設定
-    prob = pulp.LpProblem("RoleAssignment", pulp.LpMaximize)
+    return base_score + preference_bonus
 
-    # 変数定義: x[i, j] = プレイヤーiがロールjに割り当てられるか（0 or 1）
-    x = pulp.LpVariable.dicts(
-        "assignment",
-        ((i, j) for i in range(n_players) for j in range(5)),
-        cat="Binary"
-    )
 
-    # スコア計算関数
-    def get_assignment_score(player_idx: int, role_idx: int) -> float:
-        """プレイヤーとロールの組み合わせのスコアを計算"""
-        player = team[player_idx]
-        role = roles[role_idx]
-
-        # ベーススコア: ロール熟練度
-        base_score = getattr(player.roleProficiency, role)
-
-        # 希望ロールボーナス
-        preference_bonus = 0
-        if player.preferredRoles and role in player.preferredRoles:
-            # 希望ロールの場合、大きなボーナス
-            preference_bonus = 10
-        elif player.preferredRoles and len(player.preferredRoles) > 0:
-            # 希望ロールがあるが該当しない場合、ペナルティ
-            preference_bonus = -5
-
-        return base_score + preference_bonus
-
-    # 制約条件1: 各プレイヤーは1つのロールのみ
-    for i in range(n_players):
-        prob += pulp.lpSum(x[i, j] for j in range(5)) == 1
-
-    # 制約条件2: 各ロールに1人のみ
-    for j in range(5):
-        prob += pulp.lpSum(x[i, j] for i in range(n_players)) == 1
-
-    # 目的関数: 総スコアを最大化
-    prob += pulp.lpSum(
-        get_assignment_score(i, j) * x[i, j]
-        for i in range(n_players)
-        for j in range(5)
-    )
+def assign_roles_to_teams(
+    teams: List[List[Summoner]],
+    backend: Union[str, List[str], None] = None,
+    time_limit: Optional[float] = None,
+    report: Optional[Dict] = None,
+    roster: Optional[CompactRoster] = None,
+) -> List[List[Summoner]]:
+    """複数チームのメンバーにロールを一括で割り当て
 
-    # 最適化問題を解く
-    prob.solve(pulp.PULP_CBC_CMD(msg=0))
+    Args:
+        teams: チームのリスト（各5人）
+        backend: ソルバーのフォールバック順（balance_teams と同じ）
+        time_limit: ソルバー全体の制限時間（秒）
+        report: 指定した場合、使用したソルバーの情報を "roles" キーに書き込む
+        roster: チームメンバーを含むロスター（省略時はチームごとに作成）
+    """
+    if any(len(team) != 5 for team in teams):
+        raise ValueError("Team must have exactly 5 members")
+    chain = solvers.resolve_chain(backend)
+    time_limit = solvers.resolve_time_limit(time_limit)
+
+    if roster is None:
+        roster = CompactRoster.from_summoners([s for team in teams for s in team])
+    score_matrices = np.array(
+        [roster.subset(team).assignment_scores for team in teams]
+    ).reshape(len(teams), 5, 5)
+    assignments, solver_info = solvers.run_with_fallback(
+        solvers.ROLE_SOLVERS, chain, score_matrices, time_limit
+    )
+    if report is not None:
+        report["roles"] = solver_info
 
     # 結果を適用
-    assigned_team = []
-    for i in range(n_players):
-        player = team[i]
-        for j in range(5):
-            if pulp.value(x[i, j]) == 1:
-                player.assignedRole = roles[j]
-                break
-        assigned_team.append(player)
-
-    return assigned_team
+    assigned_teams = []
+    for team, role_indices in zip(teams, assignments):
+        for player, role_idx in zip(team, role_indices):
+            player.assignedRole = ROLES[role_idx]
+        assigned_teams.append(list(team))
+
+    return assigned_teams
+
+
+def assign_roles_to_team(
+    team: List[Summoner], backend: Union[str, List[str], None] = None
+) -> List[Summoner]:
+    """チームメンバーにロールを割り当て"""
+    return assign_roles_to_teams([team], backend)[0]
@@ -0,0 +1,454 @@
+"""チーム分け・ロール割り当て・リクエスト処理のベンチマーク
+
+合成ロスター（ランクの散らばり、ロール習熟度の傾向、希望ロールの密度、
+チーム制約グループの密度）を生成し、各処理の p50/p99 レイテンシと
+スループット、チーム分けの目的関数値を計測してJSONで保存する。
+レスポンスのJSONエンコード方式ごとの比較（encoders/*）も含む。
+
+使い方:
+    python benchmark.py --output bench.json
+    python benchmark.py --output bench.json --baseline baseline.json
+"""
+
+import argparse
+import decimal
+import json
+import os
+import platform
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+import json_encoder
+import lambda_function
+from balance_logic import (
+    ROLES,
+    Rank,
+    RoleProficiency,
+    Summoner,
+    assign_roles_to_team,
+    balance_teams,
+    calculate_team_stats,
+    get_assignment_score,
+    get_rank_score,
+)
+from result_cache import get_result_cache
+from summoner_storage import serialize_dynamodb_item
+
+TIERS = ["IRON", "BRONZE", "SILVER", "GOLD", "PLATINUM", "EMERALD", "DIAMOND"]
+APEX_TIERS = ["MASTER", "GRANDMASTER", "CHALLENGER"]
+DIVISIONS = ["IV", "III", "II", "I"]
+
+# ランクの散らばり: 段位リスト（下位→上位）の中で選ぶ範囲
+RANK_SPREADS = ("narrow", "wide", "bimodal")
+# ロール習熟度の傾向
+PROFICIENCY_PATTERNS = ("uniform", "specialist", "flex")
+
+# 既定のシナリオ（ランクの散らばり, 習熟度の傾向, 希望ロールの密度, 制約グループの密度）
+DEFAULT_SCENARIOS = [
+    ("narrow", "uniform", 0.0, 0.0),
+    ("wide", "uniform", 0.5, 0.0),
+    ("wide", "specialist", 1.0, 0.0),
+    ("bimodal", "flex", 0.5, 0.0),
+    ("wide", "uniform", 0.5, 0.5),
+    ("bimodal", "specialist", 1.0, 1.0),
+]
+
+# 基準値からの悪化とみなすレイテンシの比率
+DEFAULT_TOLERANCE = 0.2
+
+
+def _all_ranks() -> List[str]:
+    """下位から上位の順に並べたランク文字列"""
+    return [f"{tier} {division}" for tier in TIERS for division in DIVISIONS] + APEX_TIERS
+
+
+def generate_roster(
+    rng: random.Random,
+    rank_spread: str = "wide",
+    proficiency: str = "uniform",
+    preference_density: float = 0.5,
+    n: int = 10,
+) -> List[Summoner]:
+    """合成ロスターを生成
+
+    Args:
+        rng: 乱数生成器
+        rank_spread: "narrow"（近いランクのみ）, "wide"（全ランク）,
+            "bimodal"（低ランクと高ランクの2極）
+        proficiency: "uniform"（0-5一様）, "specialist"（1ロールだけ高い）,
+            "flex"（全ロールそこそこ）
+        preference_density: 希望ロールを持つプレイヤーの割合
+        n: 人数
+    """
+    if rank_spread not in RANK_SPREADS:
+        raise ValueError(f"Unknown rank spread: {rank_spread}")
+    if proficiency not in PROFICIENCY_PATTERNS:
+        raise ValueError(f"Unknown proficiency pattern: {proficiency}")
+
+    ranks = _all_ranks()
+    center = rng.randrange(len(ranks))
+    summoners = []
+    for i in range(n):
+        if rank_spread == "narrow":
+            rank = ranks[min(max(center + rng.randint(-2, 2), 0), len(ranks) - 1)]
+        elif rank_spread == "bimodal":
+            rank = rng.choice(ranks[:8] if rng.random() < 0.5 else ranks[-8:])
+        else:
+            rank = rng.choice(ranks)
+        tier, _, division = rank.partition(" ")
+
+        if proficiency == "specialist":
+            main_role = rng.choice(ROLES)
+            levels = {
+                role: rng.randint(4, 5) if role == main_role else rng.randint(0, 2)
+                for role in ROLES
+            }
+        elif proficiency == "flex":
+            levels = {role: rng.randint(2, 4) for role in ROLES}
+        else:
+            levels = {role: rng.randint(0, 5) for role in ROLES}
+
+        preferred = (
+            rng.sample(ROLES, rng.randint(1, 2))
+            if rng.random() < preference_density
+            else []
+        )
+        summoners.append(
+            Summoner(
+                id=f"bench_{i:02d}",
+                name=f"Bench {i}",
+                rank=Rank(combined=rank, tier=tier, division=division or "I"),
+                roleProficiency=RoleProficiency(**levels),
+                preferredRoles=preferred,
+            )
+        )
+    return summoners
+
+
+def generate_constraint_groups(
+    rng: random.Random, summoners: Sequence[Summoner], density: float
+) -> List[Dict]:
+    """満たすことのできるチーム制約グループを生成
+
+    互いに重ならない2人組を作り、"same" と "opposite" を交互に割り当てる。
+    density=1.0 で最大4グループ（8人）。
+    """
+    n_groups = round(density * 4)
+    ids = [s.id for s in summoners]
+    rng.shuffle(ids)
+    return [
+        {
+            "id": f"group{g}",
+            "summonerIds": ids[2 * g : 2 * g + 2],
+            "type": "same" if g % 2 == 0 else "opposite",
+        }
+        for g in range(n_groups)
+    ]
+
+
+def _percentile(samples: Sequence[float], q: float) -> float:
+    return float(np.percentile(np.asarray(samples), q))
+
+
+def _timed(fn: Callable[[], object], samples: List[float]) -> object:
+    started_at = time.perf_counter()
+    result = fn()
+    samples.append(time.perf_counter() - started_at)
+    return result
+
+
+def _summarize(samples: List[float], quality: Optional[float] = None) -> Dict:
+    """計測結果を集計（レイテンシはミリ秒、スループットは1秒あたりの呼び出し数）"""
+    summary = {
+        "calls": len(samples),
+        "p50Ms": _percentile(samples, 50) * 1000,
+        "p99Ms": _percentile(samples, 99) * 1000,
+        "meanMs": float(np.mean(samples)) * 1000,
+        "throughput": len(samples) / sum(samples),
+    }
+    if quality is not None:
+        summary["quality"] = quality
+    return summary
+
+
+def _split_objective(team_a: List[Summoner], team_b: List[Summoner]) -> float:
+    """ノイズなしの目的関数値（|ランク差| + |ロール習熟度差|）"""
+    rank_diff = sum(get_rank_score(s.rank.combined) for s in team_a) - sum(
+        get_rank_score(s.rank.combined) for s in team_b
+    )
+    role_diff = sum(sum(s.roleProficiency.model_dump().values()) for s in team_a) - sum(
+        sum(s.roleProficiency.model_dump().values()) for s in team_b
+    )
+    return abs(rank_diff) + abs(role_diff)
+
+
+def run_scenario(
+    rank_spread: str,
+    proficiency: str,
+    preference_density: float,
+    constraint_density: float,
+    n_rosters: int,
+    repeat: int,
+    seed: int,
+) -> Dict:
+    """1シナリオ分の計測
+
+    quality は小さいほど良い（チーム分け: 目的関数値の平均）か、
+    大きいほど良い（ロール割り当て: 割り当てスコア合計の平均）。
+    """
+    rng = random.Random(seed)
+    rosters = [
+        generate_roster(rng, rank_spread, proficiency, preference_density)
+        for _ in range(n_rosters)
+    ]
+    groups = [generate_constraint_groups(rng, r, constraint_density) for r in rosters]
+    events = [
+        {
+            "httpMethod": "POST",
+            "path": "/api/balance-teams",
+            "body": json.dumps(
+                {
+                    "summoners": [s.model_dump() for s in roster],
+                    "randomness": 0,
+                    "teamConstraintGroups": group,
+                }
+            ),
+        }
+        for roster, group in zip(rosters, groups)
+    ]
+
+    balance_samples: List[float] = []
+    role_samples: List[float] = []
+    stats_samples: List[float] = []
+    handler_samples: List[float] = []
+    objectives: List[float] = []
+    role_scores: List[float] = []
+    handler_ok = 0
+
+    for _ in range(repeat):
+        for roster, group, event in zip(rosters, groups, events):
+            team_a, team_b = _timed(
+                lambda: balance_teams(roster, 0.0, group), balance_samples
+            )
+            objectives.append(_split_objective(team_a, team_b))
+
+            team = _timed(lambda: assign_roles_to_team(team_a), role_samples)
+            role_scores.append(sum(get_assignment_score(s, s.assignedRole) for s in team))
+
+            _timed(lambda: calculate_team_stats(team_a), stats_samples)
+
+            # randomness=0 のため2周目以降は結果キャッシュに当たる。毎回解かせる
+            get_result_cache().local.clear()
+            response = _timed(
+                lambda: lambda_function.lambda_handler(event, None), handler_samples
+            )
+            handler_ok += response["statusCode"] == 200
+
+    return {
+        "balance_teams": _summarize(balance_samples, float(np.mean(objectives))),
+        "assign_roles_to_team": _summarize(role_samples, float(np.mean(role_scores))),
+        "calculate_team_stats": _summarize(stats_samples),
+        "lambda_handler": _summarize(handler_samples, handler_ok / len(handler_samples)),
+    }
+
+
+def _legacy_decimal_default(obj):
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError
+
+
+def _dynamodb_payload(roster: List[Summoner]) -> Dict:
+    """/api/load-summoners と同じ形（数値がDecimal）のペイロードを作成"""
+    return {
+        "summoners": [
+            {
+                "id": s.id,
+                "name": s.name,
+                "icon": f"https://example.invalid/icon/{i}.png",
+                "level": decimal.Decimal(100 + i),
+                "rank": s.rank.model_dump(),
+                "roleProficiency": {
+                    role: decimal.Decimal(level)
+                    for role, level in s.roleProficiency.model_dump().items()
+                },
+                "top3Champs": [
+                    [[f"https://example.invalid/champ/{c}.png", f"Champ{c}"], decimal.Decimal(3)]
+                    for c in range(3)
+                ],
+                "isSelected": True,
+                "preferredRoles": s.preferredRoles,
+            }
+            for i, s in enumerate(roster)
+        ]
+    }
+
+
+def run_encoder_scenarios(n_rosters: int, repeat: int, seed: int) -> Dict:
+    """レスポンスのエンコード方式の比較
+
+    legacy は以前の実装（.dict() / Decimal変換で辞書を作ってから json.dumps）。
+    """
+    rng = random.Random(seed)
+    rosters = [generate_roster(rng) for _ in range(n_rosters)]
+    balance_payloads = []
+    for roster in rosters:
+        team_a, team_b = balance_teams(roster)
+        balance_payloads.append(
+            {
+                "teamA": team_a,
+                "teamB": team_b,
+                "teamAStats": calculate_team_stats(team_a),
+                "teamBStats": calculate_team_stats(team_b),
+            }
+        )
+    load_payloads = [_dynamodb_payload(roster) for roster in rosters]
+
+    def legacy_balance(payload: Dict) -> str:
+        return json.dumps(
+            {
+                "teamA": [s.dict() for s in payload["teamA"]],
+                "teamB": [s.dict() for s in payload["teamB"]],
+                "teamAStats": payload["teamAStats"].dict(),
+                "teamBStats": payload["teamBStats"].dict(),
+            },
+            default=_legacy_decimal_default,
+        )
+
+    def legacy_load(payload: Dict) -> str:
+        return json.dumps(serialize_dynamodb_item(payload), default=_legacy_decimal_default)
+
+    encoders = {"legacy": None}
+    for name in json_encoder.ENCODERS:
+        try:
+            encoders[name] = json_encoder.get_encoder(name)
+        except ValueError:
+            continue  # インストールされていないエンコーダー
+
+    results = {}
+    for scenario, payloads, legacy in (
+        ("encoders/balance-teams", balance_payloads, legacy_balance),
+        ("encoders/load-summoners", load_payloads, legacy_load),
+    ):
+        results[scenario] = {}
+        for name, encoder in encoders.items():
+            encode = encoder or legacy
+            samples: List[float] = []
+            for _ in range(repeat):
+                for payload in payloads:
+                    _timed(lambda: encode(payload), samples)
+            results[scenario][name] = _summarize(samples)
+    return results
+
+
+def run_benchmarks(n_rosters: int = 50, repeat: int = 3, seed: int = 0) -> Dict:
+    """全シナリオを計測して結果を返す"""
+    results = {}
+    for index, (spread, proficiency, preference, constraint) in enumerate(
+        DEFAULT_SCENARIOS
+    ):
+        name = f"{spread}/{proficiency}/pref{preference}/groups{constraint}"
+        results[name] = run_scenario(
+            spread, proficiency, preference, constraint, n_rosters, repeat, seed + index
+        )
+    results.update(run_encoder_scenarios(n_rosters, repeat, seed))
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "rosters": n_rosters,
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+# quality が大きいほど良いターゲット（それ以外は小さいほど良い）
+HIGHER_QUALITY_IS_BETTER = ("assign_roles_to_team", "lambda_handler")
+
+
+def compare_with_baseline(
+    current: Dict, baseline: Dict, tolerance: float = DEFAULT_TOLERANCE
+) -> List[str]:
+    """基準値と比較し、悪化した項目のメッセージを返す
+
+    p50レイテンシが (1 + tolerance) 倍を超えた場合と、quality が悪化した場合を報告する。
+    """
+    regressions = []
+    for scenario, targets in current["results"].items():
+        for target, result in targets.items():
+            base = baseline.get("results", {}).get(scenario, {}).get(target)
+            if base is None:
+                continue
+            ratio = result["p50Ms"] / base["p50Ms"]
+            if ratio > 1 + tolerance:
+                regressions.append(
+                    f"{scenario} {target}: p50 {result['p50Ms']:.3f}ms "
+                    f"vs {base['p50Ms']:.3f}ms (x{ratio:.2f})"
+                )
+            if "quality" in result and "quality" in base:
+                if target in HIGHER_QUALITY_IS_BETTER:
+                    worse = result["quality"] < base["quality"] - 1e-9
+                else:
+                    worse = result["quality"] > base["quality"] + 1e-9
+                if worse:
+                    regressions.append(
+                        f"{scenario} {target}: quality {result['quality']:.4f} "
+                        f"vs {base['quality']:.4f}"
+                    )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rosters", type=int, default=50, help="シナリオごとのロスター数")
+    parser.add_argument("--repeat", type=int, default=3, help="各ロスターの繰り返し回数")
+    parser.add_argument("--seed", type=int, default=0, help="ロスター生成の乱数シード")
+    parser.add_argument("--output", help="結果を書き込むJSONファイル")
+    parser.add_argument("--baseline", help="比較する基準値のJSONファイル")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="p50レイテンシの許容悪化率（既定: 0.2 = 20%%）",
+    )
+    args = parser.parse_args(argv)
+
+    # 計測にDynamoDBの結果キャッシュを含めない（プロセス内の層は run_scenario で消す）
+    os.environ.pop("BALANCE_CACHE_TABLE", None)
+    report = run_benchmarks(args.rosters, args.repeat, args.seed)
+
+    for scenario, targets in report["results"].items():
+        print(scenario)
+        for target, result in targets.items():
+            quality = f"  quality={result['quality']:.4f}" if "quality" in result else ""
+            print(
+                f"  {target:<22} p50={result['p50Ms']:8.3f}ms  p99={result['p99Ms']:8.3f}ms"
+                f"  {result['throughput']:10.1f}/s{quality}"
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,32 +1,145 @@
+import json
+import os
+import tempfile
+import threading
 from typing import Dict, Optional
 
-import requests
+import http_session
+
+DDRAGON_BASE_URL = "https://ddragon.leagueoflegends.com/cdn"
+
+# Static data is stored per version under this directory. /tmp is the only
+# writable location on Lambda and survives across warm invocations.
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "ddragon")
+
+
+class ChampionIndex:
+    """Champion lookup tables for a single DataDragon version.
+
+    Built once from champion.json so that id -> key -> icon URL lookups are
+    plain dict accesses.
+    """
+
+    def __init__(self, version: str, champion_data: Dict):
+        self.version = version
+        self.champion_data = champion_data
+        self.id_to_key: Dict[int, str] = {
+            int(champion["key"]): champion["id"] for champion in champion_data.values()
+        }
+        self.id_to_icon_url: Dict[int, str] = {
+            champion_id: f"{DDRAGON_BASE_URL}/{version}/img/champion/{key}.png"
+            for champion_id, key in self.id_to_key.items()
+        }
+
+
+class DDragonStore:
+    """Versioned local cache of DataDragon static data.
+
+    Each version's champion.json is downloaded at most once per container and
+    written to ``<cache_dir>/<version>/champion.json``. The parsed index is
+    kept in memory per version.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir or os.environ.get(
+            "DDRAGON_CACHE_DIR", DEFAULT_CACHE_DIR
+        )
+        self._indexes: Dict[str, ChampionIndex] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, version: str) -> str:
+        return os.path.join(self.cache_dir, version, "champion.json")
+
+    def _read_disk(self, version: str) -> Optional[Dict]:
+        try:
+            with open(self._path(version), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, version: str, champion_data: Dict) -> None:
+        """Write atomically so concurrent readers never see a partial file."""
+        path = self._path(version)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(champion_data, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass  # The disk cache is an optimization only
+
+    def _download(self, version: str) -> Dict:
+        url = f"{DDRAGON_BASE_URL}/{version}/data/en_US/champion.json"
+        response = http_session.get(url)
+        return response.json()["data"]
+
+    def champion_index(self, version: str) -> ChampionIndex:
+        """Get the champion index for a version, loading it on first use.
+
+        Memory first, then the local disk cache, then the network.
+        """
+        index = self._indexes.get(version)
+        if index is not None:
+            return index
+
+        with self._lock:
+            index = self._indexes.get(version)
+            if index is None:
+                champion_data = self._read_disk(version)
+                if champion_data is None:
+                    champion_data = self._download(version)
+                    self._write_disk(version, champion_data)
+                index = self._indexes[version] = ChampionIndex(version, champion_data)
+        return index
+
+
+_default_store: Optional[DDragonStore] = None
+
+
+def get_default_store() -> DDragonStore:
+    """Get the process-wide store shared by all ChampionIconGenerator instances."""
+    global _default_store
+    if _default_store is None:
+        _default_store = DDragonStore()
+    return _default_store
 
 
 class ChampionIconGenerator:
-    def __init__(self):
-        self.base_url = "https://ddragon.leagueoflegends.com/cdn"
-        self.latest_version = self._get_latest_version()
-        self.champion_data = self._get_champion_data()
+    def __init__(self, version: Optional[str] = None, store: Optional[DDragonStore] = None):
+        """
+        Args:
+            version (str, optional): DataDragon version to use. Fetched from
+                versions.json when omitted.
+            store (DDragonStore, optional): Static data cache. Defaults to the
+                process-wide store.
+        """
+        self.base_url = DDRAGON_BASE_URL
+        self.latest_version = version or self._get_latest_version()
+        self.store = store or get_default_store()
+        self._index: Optional[ChampionIndex] = None
 
     def _get_latest_version(self) -> str:
         """Get the latest DataDragon version."""
         versions_url = "https://ddragon.leagueoflegends.com/api/versions.json"
-        response = requests.get(versions_url)
+        response = http_session.get(versions_url)
         return response.json()[0]
 
-    def _get_champion_data(self) -> Dict:
-        """Get champion data from DataDragon."""
-        url = f"{self.base_url}/{self.latest_version}/data/en_US/champion.json"
-        response = requests.get(url)
-        return response.json()["data"]
+    @property
+    def index(self) -> ChampionIndex:
+        """Champion index for this version, loaded lazily."""
+        if self._index is None:
+            self._index = self.store.champion_index(self.latest_version)
+        return self._index
+
+    @property
+    def champion_data(self) -> Dict:
+        """Champion data from DataDragon."""
+        return self.index.champion_data
 
     def get_champion_id_map(self) -> Dict[int, str]:
-        """Create a mapping of champion IDs to champion keys."""
-        champion_map = {}
-        for champion in self.champion_data.values():
-            champion_map[int(champion["key"])] = champion["id"]
-        return champion_map
+        """Get the mapping of champion IDs to champion keys."""
+        return self.index.id_to_key
 
     def get_champion_icon_url(self, champion_id: int) -> Optional[str]:
         """
@@ -38,9 +151,4 @@ class ChampionIconGenerator:
         Returns:
             str: URL of the champion icon, or None if champion not found
         """
-        champion_map = self.get_champion_id_map()
-        if champion_id not in champion_map:
-            return None
-
-        champion_key = champion_map[champion_id]
-        return f"{self.base_url}/{self.latest_version}/img/champion/{champion_key}.png"
+        return self.index.id_to_icon_url.get(champion_id)
@@ -0,0 +1,473 @@
+"""複数サモナーのデータをまとめて取得する asyncio のパイプライン
+
+サモナーごとのコルーチンが account → (summoner / league / マッチID一覧を並行)
+→ マッチ詳細 の順に取得する。マッチ詳細は全サモナー分を1つの FairQueue に入れ、
+決まった数のワーカーがサモナーを順番に回りながら取り出すため、先にマッチIDが
+分かったサモナーだけが独占することは無い。
+
+同じマッチに複数のサモナーが参加している場合、1回の取得（match_cache）で済ませる。
+マッチキャッシュは MATCH_LOOKUP_WINDOW の間に分かったマッチIDをまとめて
+get_many（DynamoDBの batch_get_item）で読み、無かったマッチだけをキューに入れる。
+
+サモナーのキャッシュは最初に batch_get_item でまとめて読み込み、Riot APIから
+取得したサモナーだけを最後に batch_writer でまとめて書き込む。
+
+キャッシュにはPUUIDと集計に使ったマッチの記録を保存しているため、有効期限を
+過ぎたサモナーはサモナー情報・ランク情報・マッチIDの一覧だけを取得し、
+新しいマッチの詳細だけを取得して更新する。マッチIDの一覧はキャッシュの最新の
+マッチより後に始まったものだけを要求し、サモナー情報は SUMMONER_INFO_MAX_AGE_DAYS
+の間キャッシュの値を使うため、新しいマッチが無ければRiot APIの呼び出しは
+ランク情報とマッチIDの一覧の2回。
+
+環境変数 SUMMONER_CACHE_SWR が有効な場合は、期限切れのキャッシュをすぐに返し
+（stale-while-revalidate）、呼び出し側が revalidate() で裏で更新する。
+Lambdaではレスポンスを返すとコンテナが停止して裏の更新が進まないため、
+既定ではLambda以外でのみ有効にする。無効な場合はその場で（差分で）更新してから返す。
+
+HTTPの呼び出し（requests）はブロッキングのため、プロセスで1つのスレッドプール
+（get_executor()、スレッド数は同時リクエスト数の上限）で実行する。同時に動く
+パイプライン（ローカルサーバーの並行リクエストや裏での更新）も同じプールを使うため、
+RIOT_FETCH_CONCURRENCY はプロセス全体の上限になる。送信の間隔は
+RiotAPI.request の rate_limiter が調整する。
+"""
+
+import asyncio
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+import metrics
+from logger import Payload, log
+
+if TYPE_CHECKING:
+    from riot_api import RiotAPI
+
+# 同時に実行するRiot APIのリクエスト数の上限（環境変数 RIOT_FETCH_CONCURRENCY）
+DEFAULT_CONCURRENCY = int(os.environ.get("RIOT_FETCH_CONCURRENCY", 64))
+# マッチ詳細を取得するワーカー数（残りはaccountなどの呼び出しに使う）
+DEFAULT_MATCH_WORKERS = DEFAULT_CONCURRENCY * 3 // 4
+# マッチキャッシュの読み込みをまとめるために待つ時間（秒）。各サモナーのマッチIDの
+# 一覧はほぼ同時に返るため、ロビー全員分を1回の batch_get_item で読める
+MATCH_LOOKUP_WINDOW = 0.01
+# 期限切れのキャッシュをすぐに返すか（環境変数 SUMMONER_CACHE_SWR、
+# 既定はLambda以外で有効）
+SERVE_STALE = os.environ.get(
+    "SUMMONER_CACHE_SWR", "0" if "AWS_LAMBDA_FUNCTION_NAME" in os.environ else "1"
+).lower() in (
+    "1",
+    "true",
+    "yes",
+    "on",
+)
+
+# 取得結果と、次回の差分更新に使う値
+# {"puuid", "match_type", "matches": [[マッチID, 記録], ...]}（新しい順）
+FetchResult = Tuple[Dict, Optional[Dict]]
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """全パイプラインで共有するスレッドプールを返す（初回のみ作成）"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=DEFAULT_CONCURRENCY, thread_name_prefix="riot-fetch"
+                )
+    return _executor
+
+
+class FairQueue:
+    """所有者（サモナー）ごとのキューから順番に1件ずつ取り出すキュー
+
+    イベントループのスレッドからのみ使う。
+    """
+
+    def __init__(self) -> None:
+        self._queues: "OrderedDict[str, Deque[Any]]" = OrderedDict()
+        self._available = asyncio.Semaphore(0)
+
+    def put(self, owner: str, item: Any) -> None:
+        self._queues.setdefault(owner, deque()).append(item)
+        self._available.release()
+
+    async def get(self) -> Tuple[str, Any]:
+        await self._available.acquire()
+        owner, queue = next(iter(self._queues.items()))
+        item = queue.popleft()
+        if queue:
+            # 次はほかのサモナーの番
+            self._queues.move_to_end(owner)
+        else:
+            del self._queues[owner]
+        return owner, item
+
+
+class SummonerFetchPipeline:
+    """RiotAPI を使って複数サモナーのデータを並行して取得する"""
+
+    def __init__(
+        self,
+        riot_api: "RiotAPI",
+        match_workers: int = DEFAULT_MATCH_WORKERS,
+        serve_stale: bool = SERVE_STALE,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ):
+        self.riot_api = riot_api
+        self.match_workers = max(1, min(match_workers, DEFAULT_CONCURRENCY - 1))
+        self.serve_stale = serve_stale
+        # 直前の fetch_all で期限切れのまま返したサモナー（サモナー名 -> キャッシュ）
+        self.stale: Dict[str, Dict] = {}
+        # 指定が無ければ get_executor() の共有プールを使う
+        self._executor = executor
+        self._matches: Optional[FairQueue] = None
+        # マッチID -> 参加者の取得結果（同じバッチ内で同じマッチを2回取得しない）
+        self._match_results: Dict[str, "asyncio.Future"] = {}
+        # マッチキャッシュの読み込みを待っているマッチ（マッチID -> (サモナー, 結果)）
+        self._lookups: Dict[str, Tuple[str, "asyncio.Future"]] = {}
+        self._lookup_task: Optional["asyncio.Future"] = None
+
+    def run(self, summoner_names: List[str]) -> List[Dict]:
+        """同期的に呼び出す（結果は summoner_names の順、取得できなければ {}）"""
+        return asyncio.run(self.fetch_all(summoner_names))
+
+    def revalidate(self, entries: Dict[str, Dict]) -> Dict[str, Dict]:
+        """期限切れのキャッシュ（_read_cache_batch の値）を差分で更新して書き込む
+
+        Returns:
+            サモナー名 -> 更新したデータ（更新できなかったサモナーは含まない）
+        """
+        return asyncio.run(self.revalidate_all(entries))
+
+    async def fetch_all(self, summoner_names: List[str]) -> List[Dict]:
+        """全サモナーのデータを取得（結果は summoner_names の順、取得できなければ {}）"""
+        results: List[Dict] = [{} for _ in summoner_names]
+        self.stale = {}
+        if not summoner_names:
+            return results
+
+        async with self._running():
+            cached = await self._call(self.riot_api._read_cache_batch, summoner_names)
+            # 取得するサモナーの位置 -> 期限切れのキャッシュ（無ければNone）
+            pending: Dict[int, Optional[Dict]] = {}
+            for index, name in enumerate(summoner_names):
+                entry = cached.get(name)
+                if entry is None:
+                    pending[index] = None
+                    continue
+                if not entry["expired"]:
+                    # 有効なキャッシュがあるサモナーは Riot API を呼ばない
+                    log.debug("Cache hit for: %s", name)
+                    metrics.increment("summoner_cache_hit")
+                elif self.serve_stale:
+                    log.debug("Serving stale cache for: %s", name)
+                    metrics.increment("summoner_cache_stale")
+                    self.stale[name] = entry
+                else:
+                    pending[index] = entry
+                    continue
+                results[index] = entry["data"]
+
+            fetched = await self._fetch_and_store(summoner_names, pending)
+            for index, entry in pending.items():
+                if index in fetched:
+                    results[index] = fetched[index]
+                elif entry is not None:
+                    # 更新できなければ期限切れのデータを返す
+                    results[index] = entry["data"]
+        return results
+
+    async def revalidate_all(self, entries: Dict[str, Dict]) -> Dict[str, Dict]:
+        names = list(entries)
+        async with self._running():
+            fetched = await self._fetch_and_store(
+                names, {index: entries[name] for index, name in enumerate(names)}
+            )
+        return {names[index]: data for index, data in fetched.items()}
+
+    @asynccontextmanager
+    async def _running(self) -> AsyncIterator[None]:
+        """マッチ詳細のワーカーを用意する"""
+        if self._executor is None:
+            self._executor = get_executor()
+        self._matches = FairQueue()
+        self._match_results = {}
+        self._lookups = {}
+        workers = [
+            asyncio.ensure_future(self._match_worker())
+            for _ in range(self.match_workers)
+        ]
+        try:
+            yield
+        finally:
+            if self._lookup_task is not None:
+                workers.append(self._lookup_task)
+                self._lookup_task = None
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self._matches = None
+            self._match_results = {}
+            self._lookups = {}
+
+    async def _fetch_and_store(
+        self, summoner_names: List[str], pending: Dict[int, Optional[Dict]]
+    ) -> Dict[int, Dict]:
+        """pending のサモナーを取得（キャッシュがあれば差分で更新）して書き込む
+
+        Args:
+            pending: summoner_names の位置 -> 期限切れのキャッシュ（無ければNone）
+
+        Returns:
+            summoner_names の位置 -> データ（取得できたサモナーのみ）
+        """
+        tasks = [
+            asyncio.ensure_future(
+                self._fetch_indexed(index, summoner_names[index], entry)
+            )
+            for index, entry in pending.items()
+        ]
+        # 終わったサモナーから受け取る
+        results: Dict[int, Dict] = {}
+        fetched: Dict[str, Dict] = {}
+        refresh_states: Dict[str, Dict] = {}
+        for next_done in asyncio.as_completed(tasks):
+            index, (data, refresh_state) = await next_done
+            name = summoner_names[index]
+            if data:
+                log.debug("Successfully fetched data for: %s", name)
+                results[index] = fetched[name] = data
+                if refresh_state is not None:
+                    refresh_states[name] = refresh_state
+            else:
+                log.warning("No data found for: %s", name)
+        await self._call(self.riot_api._write_cache_batch, fetched, refresh_states)
+        return results
+
+    async def _call(self, func: Callable, *args: Any) -> Any:
+        """ブロッキングの呼び出しをスレッドプールで実行"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, metrics.propagate(functools.partial(func, *args))
+        )
+
+    async def _match_worker(self) -> None:
+        assert self._matches is not None
+        while True:
+            _, (match_id, future) = await self._matches.get()
+            try:
+                result = await self._call(
+                    self.riot_api.fetch_match_participants, match_id
+                )
+            except Exception as e:
+                log.warning("Error processing match %s: %s", match_id, e)
+                result = None
+            if not future.done():
+                future.set_result(result)
+
+    async def _lookup_matches(self) -> None:
+        """待っているマッチをキャッシュからまとめて読み、無ければキューに入れる"""
+        assert self._matches is not None
+        await asyncio.sleep(MATCH_LOOKUP_WINDOW)
+        # 読み込み中に分かったマッチは次の読み込みに回す
+        lookups, self._lookups = self._lookups, {}
+        self._lookup_task = None
+        try:
+            cached = await self._call(
+                self.riot_api.match_cache.get_many, list(lookups)
+            )
+        except Exception as e:
+            log.warning("Error reading match cache: %s", e)
+            cached = {}
+        for match_id, (owner, future) in lookups.items():
+            if match_id not in cached:
+                self._matches.put(owner, (match_id, future))
+            elif not future.done():
+                future.set_result(cached[match_id])
+
+    async def _fetch_match_details(
+        self, owner: str, match_ids: List[str], puuid: str
+    ) -> List[Optional[Dict]]:
+        assert self._matches is not None
+        loop = asyncio.get_running_loop()
+        futures = []
+        for match_id in match_ids:
+            future = self._match_results.get(match_id)
+            if future is None:
+                future = self._match_results[match_id] = loop.create_future()
+                self._lookups[match_id] = (owner, future)
+                if self._lookup_task is None:
+                    self._lookup_task = asyncio.ensure_future(self._lookup_matches())
+            else:
+                metrics.increment("match_dedup")
+            futures.append(future)
+        results = []
+        for participants in await asyncio.gather(*futures):
+            results.append(participants.get(puuid) if participants else None)
+        return results
+
+    async def _fetch_indexed(
+        self, index: int, summoner_name: str, entry: Optional[Dict] = None
+    ) -> Tuple[int, FetchResult]:
+        log.debug("Fetching data for: %s", summoner_name)
+        try:
+            if entry is not None and entry.get("refresh_state"):
+                return index, await self._refresh(summoner_name, entry)
+            # 差分更新に使う値が無い古いキャッシュはすべて取得し直す
+            return index, await self._fetch(summoner_name)
+        except Exception:
+            log.exception("Error fetching data for %s", summoner_name)
+            return index, ({}, None)
+
+    async def _fetch(self, summoner_name: str) -> FetchResult:
+        api = self.riot_api
+        metrics.increment("summoner_cache_miss")
+
+        # サモナー名とタグラインを分割
+        sn, tagline = summoner_name.split("#")
+
+        # アカウント情報を取得
+        account_info = await self._call(api.get_account, sn, tagline)
+        log.debug("account_info: %s", Payload(account_info))
+        puuid = account_info["puuid"]
+
+        # PUUIDが分かれば、サモナー情報・ランク情報・マッチ履歴は並行して取得できる
+        match_type: Optional[str] = "ranked"
+        raw_summoner_info, raw_rank_info, match_history = await asyncio.gather(
+            self._call(api.get_summoner_info, puuid),
+            self._call(api.get_rank_info, puuid),
+            self._call(api.get_match_history, puuid, api.match_count, match_type),
+        )
+        log.debug("raw_summoner_info: %s", Payload(raw_summoner_info))
+        if len(match_history) < api.match_count:
+            match_type = None
+            match_history = await self._call(
+                api.get_match_history, puuid, api.match_count
+            )
+
+        # マッチ詳細は全サモナー共通のキューで取得
+        results = await self._fetch_match_details(summoner_name, match_history, puuid)
+
+        data = api.build_summoner_data(
+            summoner_name, raw_summoner_info, raw_rank_info, results
+        )
+        return data, self._refresh_state(
+            puuid,
+            match_type,
+            match_history,
+            results,
+            self._summoner_state(raw_summoner_info, time.time()),
+        )
+
+    async def _refresh(self, summoner_name: str, entry: Dict) -> FetchResult:
+        """期限切れのキャッシュを差分で更新
+
+        PUUIDはキャッシュの値を使い（account の呼び出しを省く）、マッチIDの一覧は
+        最新の記録の開始時刻より後のものだけを要求する。サモナー情報（アイコン・
+        レベル）は取得してから summoner_info_max_age が過ぎるまでキャッシュの値を使う。
+        新しいマッチが無ければRiot APIの呼び出しはランク情報とマッチIDの一覧の2回。
+        アイコンのURLは現在のDDragonのバージョンで作り直す。
+        """
+        api = self.riot_api
+        metrics.increment("summoner_refresh")
+        state = entry["refresh_state"]
+        puuid = state["puuid"]
+        match_type = state.get("match_type")
+        cached_ids = [match_id for match_id, _ in state["matches"]]
+        known = {match_id: record for match_id, record in state["matches"] if record}
+        # 開始時刻を記録していない古いキャッシュは一覧をすべて取得し直す
+        start_times = [record.get("started_at") for record in known.values()]
+        since = (
+            max(start_times) + 1 if start_times and all(start_times) else None
+        )
+
+        now = time.time()
+        summoner = state.get("summoner")
+        calls = [
+            self._call(api.get_rank_info, puuid),
+            self._call(
+                api.get_match_history, puuid, api.match_count, match_type, since
+            ),
+        ]
+        if (
+            summoner is None
+            or now - summoner["checked_at"] >= api.summoner_info_max_age.total_seconds()
+        ):
+            calls.append(self._call(api.get_summoner_info, puuid))
+        raw_rank_info, match_history, *raw_summoner_info = await asyncio.gather(*calls)
+        if raw_summoner_info:
+            summoner = self._summoner_state(raw_summoner_info[0], now)
+
+        if since is not None:
+            # 新しいマッチの後ろにキャッシュの一覧を続けて最新の match_count 件にする
+            match_history = (
+                match_history
+                + [match_id for match_id in cached_ids if match_id not in match_history]
+            )[: api.match_count]
+        elif match_type is not None and len(match_history) < api.match_count:
+            match_type = None
+            match_history = await self._call(
+                api.get_match_history, puuid, api.match_count
+            )
+
+        # 最新の match_count 件のうち、記録が無いマッチだけを取得する
+        new_ids = [match_id for match_id in match_history if match_id not in known]
+        metrics.increment("summoner_refresh_new_matches", len(new_ids))
+        new_records = dict(
+            zip(
+                new_ids,
+                await self._fetch_match_details(summoner_name, new_ids, puuid),
+            )
+        )
+        results = [
+            known[match_id] if match_id in known else new_records[match_id]
+            for match_id in match_history
+        ]
+
+        data = api.build_summoner_data(summoner_name, summoner, raw_rank_info, results)
+        return data, self._refresh_state(
+            puuid, match_type, match_history, results, summoner
+        )
+
+    @staticmethod
+    def _summoner_state(raw_summoner_info: Dict, checked_at: float) -> Dict:
+        """差分更新で使い回すサモナー情報（build_summoner_data が使う項目のみ）"""
+        return {
+            "profileIconId": raw_summoner_info["profileIconId"],
+            "summonerLevel": raw_summoner_info["summonerLevel"],
+            "checked_at": checked_at,
+        }
+
+    @staticmethod
+    def _refresh_state(
+        puuid: str,
+        match_type: Optional[str],
+        match_ids: List[str],
+        results: List[Optional[Dict]],
+        summoner: Dict,
+    ) -> Dict:
+        return {
+            "puuid": puuid,
+            "match_type": match_type,
+            "matches": [list(match) for match in zip(match_ids, results)],
+            "summoner": summoner,
+        }
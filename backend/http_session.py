@@ -0,0 +1,73 @@
+"""ウォームコンテナで再利用するHTTPセッション
+
+requests.get はリクエストのたびに接続（TCP + TLS）を作り直すため、同じホストへの
+呼び出しが多い Riot API / DDragon ではホストごとに requests.Session を保持し、
+keep-aliveの接続プールを使い回す。
+
+- プールの大きさはホストへの同時リクエスト数に合わせる（get(..., pool_size=N)）
+- タイムアウトは環境変数 HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT（秒）で変更できる
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 5.0
+DEFAULT_POOL_SIZE = 10
+
+_lock = threading.Lock()
+_sessions: Dict[str, requests.Session] = {}
+
+
+def default_timeout() -> Tuple[float, float]:
+    """(接続タイムアウト, 読み込みタイムアウト)"""
+    return (
+        float(os.environ.get("HTTP_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)),
+        float(os.environ.get("HTTP_READ_TIMEOUT", DEFAULT_READ_TIMEOUT)),
+    )
+
+
+def get_session(host: str, pool_size: Optional[int] = None) -> requests.Session:
+    """ホストごとのセッションを返す（初回のみ作成）
+
+    Args:
+        host: "scheme://host" 形式（例: "https://asia.api.riotgames.com"）
+        pool_size: 接続プールの大きさ。同時リクエスト数より小さいと、
+            超えた分の接続はプールに戻されずに閉じられる
+    """
+    session = _sessions.get(host)
+    if session is None:
+        with _lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                # リトライは呼び出し側（レート制限）で行う
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=pool_size or DEFAULT_POOL_SIZE,
+                    max_retries=0,
+                )
+                session.mount(host, adapter)
+                _sessions[host] = session
+    return session
+
+
+def get(url: str, pool_size: Optional[int] = None, **kwargs: Any) -> requests.Response:
+    """ホストのセッションでGETする（timeout の既定値は default_timeout()）"""
+    parts = urlsplit(url)
+    session = get_session(f"{parts.scheme}://{parts.netloc}", pool_size)
+    kwargs.setdefault("timeout", default_timeout())
+    return session.get(url, **kwargs)
+
+
+def reset() -> None:
+    """保持しているセッションを閉じる"""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
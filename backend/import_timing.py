@@ -0,0 +1,105 @@
+"""コールドスタート時のimportコストの計測
+
+ルートごとに新しいPythonプロセスで lambda_function と、そのルートが初回に読み込む
+モジュール（lambda_function.ROUTE_MODULES）をimportし、`-X importtime` の出力から
+モジュールごとの初期化時間を集計する。
+
+使い方:
+    python import_timing.py
+    python import_timing.py --route /api/balance-teams --budget-ms 400
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+# インタープリター起動時のimportと区別するため、計測開始時に標準エラーへ出す目印
+_START_MARKER = "import_timing: start"
+
+_IMPORT_SCRIPT = f"""
+import importlib, sys
+print({_START_MARKER!r}, file=sys.stderr, flush=True)
+import lambda_function
+for name in lambda_function.ROUTE_MODULES[sys.argv[1]]:
+    importlib.import_module(name)
+"""
+
+
+def _parse_importtime(stderr: str) -> Dict[str, float]:
+    """`-X importtime` の出力からトップレベルのimportごとの累積時間（ミリ秒）を取り出す"""
+    modules: Dict[str, float] = {}
+    lines = stderr.splitlines()
+    if _START_MARKER in lines:
+        lines = lines[lines.index(_START_MARKER) + 1 :]
+    for line in lines:
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # ヘッダー行
+        # 入れ子のimportは2文字ずつ字下げされる
+        if name.startswith(" ") and not name.startswith("  "):
+            modules[name.strip()] = int(cumulative) / 1000
+    return modules
+
+
+def measure_route(route: str) -> Dict:
+    """1ルート分のコールドスタートのimport時間を計測
+
+    Returns:
+        {"route": ルート, "totalMs": 合計, "modules": {モジュール名: 累積ミリ秒}}
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _IMPORT_SCRIPT, route],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = _parse_importtime(completed.stderr)
+    return {
+        "route": route,
+        "totalMs": sum(modules.values()),
+        "modules": dict(sorted(modules.items(), key=lambda m: -m[1])),
+    }
+
+
+def measure_routes(routes: Optional[List[str]] = None) -> List[Dict]:
+    """全ルート（または指定したルート）のimport時間を計測"""
+    from lambda_function import ROUTE_MODULES
+
+    return [measure_route(route) for route in routes or ROUTE_MODULES]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--route", action="append", help="計測するルート（複数指定可）")
+    parser.add_argument("--budget-ms", type=float, help="ルートごとのimport時間の上限")
+    parser.add_argument("--top", type=int, default=5, help="表示するモジュール数")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args(argv)
+
+    results = measure_routes(args.route)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print(f"{result['route']:<28} {result['totalMs']:8.1f}ms")
+            for name, ms in list(result["modules"].items())[: args.top]:
+                print(f"    {name:<24} {ms:8.1f}ms")
+
+    if args.budget_ms is not None:
+        over = [r for r in results if r["totalMs"] > args.budget_ms]
+        for result in over:
+            print(
+                f"OVER BUDGET {result['route']}: {result['totalMs']:.1f}ms "
+                f"> {args.budget_ms:.1f}ms"
+            )
+        if over:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
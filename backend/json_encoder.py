@@ -0,0 +1,85 @@
+"""レスポンスのJSONエンコーダー
+
+orjsonがインストールされていればそれを使い、無ければ標準ライブラリのjsonを使う。
+pydanticモデルは .dict() で辞書に変換せず、フィールドの値（モデルの __dict__）を
+そのままエンコーダーに渡すため、レスポンスのデータを走査するのは1回だけになる。
+DynamoDBから読み込んだDecimalはfloatとして出力する。
+
+使用するエンコーダーは環境変数 JSON_ENCODER（"orjson" / "stdlib"）で固定できる。
+"""
+
+import decimal
+import json
+import os
+from typing import Any, Callable, Dict, Optional
+
+Encoder = Callable[[Any], str]
+
+
+def _default(obj: Any) -> Any:
+    """エンコーダーがそのまま扱えない型の変換"""
+    if hasattr(obj, "__pydantic_fields__"):
+        # pydanticモデル（コールドスタートを軽くするためpydanticはimportしない）。
+        # フィールドの値は __dict__ に保持されているため、コピーせずに渡す
+        return obj.__dict__
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if hasattr(obj, "item"):
+        # NumPyのスカラー
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _dumps_stdlib(obj: Any) -> str:
+    return json.dumps(obj, default=_default, separators=(",", ":"))
+
+
+def _dumps_orjson(obj: Any) -> str:
+    import orjson
+
+    return orjson.dumps(
+        obj, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    ).decode()
+
+
+ENCODERS: Dict[str, Encoder] = {
+    "orjson": _dumps_orjson,
+    "stdlib": _dumps_stdlib,
+}
+
+
+def _orjson_available() -> bool:
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_encoder(name: Optional[str] = None) -> Encoder:
+    """エンコーダーを取得
+
+    Args:
+        name: "orjson" または "stdlib"。Noneの場合は環境変数 JSON_ENCODER、
+            それも無ければorjsonがインストールされていればorjson
+    """
+    if name is None:
+        name = os.environ.get("JSON_ENCODER")
+    if name is None:
+        name = "orjson" if _orjson_available() else "stdlib"
+    if name not in ENCODERS:
+        raise ValueError(f"Unknown JSON encoder: {name}")
+    if name == "orjson" and not _orjson_available():
+        raise ValueError("orjson is not installed")
+    return ENCODERS[name]
+
+
+_encoder: Optional[Encoder] = None
+
+
+def dumps(obj: Any) -> str:
+    """既定のエンコーダーでJSON文字列に変換（エンコーダーは初回呼び出し時に決定）"""
+    global _encoder
+    if _encoder is None:
+        _encoder = get_encoder()
+    return _encoder(obj)
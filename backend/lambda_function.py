@@ -1,21 +1,29 @@
-import decimal
 import json
+import os
+import random
+import threading
 import traceback
-from typing import Any, Dict, Union
-
-from balance_logic import (
-    Rank,
-    RoleProficiency,
-    Summoner,
-    balance_teams,
-    calculate_team_stats,
-    normalize_rank_format,
-    assign_roles_to_team,
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import json_encoder
+import metrics
+from logger import Payload, log
+from response_format import (
+    compact_option,
+    compact_partition,
+    compact_team,
+    compress_response,
+    factor_url_prefix,
+    response_format,
 )
-from logger import log
-from pydantic import ValidationError
-from riot_api import get_summoners_data
-from summoner_storage import SummonerStorage
+
+# チーム分け（numpy, pydantic）・Riot API（requests, boto3）・DynamoDB（boto3）の
+# モジュールはimportに時間がかかるため、各ルートの初回リクエスト時に読み込む。
+# /api/health や OPTIONS のコールドスタートではどれも読み込まない
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+    from balance_logic import Summoner
 
 # dotenv is only needed for local development
 # In Lambda, environment variables are already loaded by AWS
@@ -25,14 +33,34 @@ try:
 except ImportError:
     pass  # dotenv not available in Lambda, which is fine
 
+# ロビー振り分けの探索時間の上限（秒）。API Gatewayのタイムアウトより十分短くする
+MAX_PARTITION_TIME_BUDGET = 10.0
+
+# バッチでまとめて処理できるロスター数の上限
+MAX_BATCH_ROSTERS = 100
+
+# ルートごとに初回リクエストで読み込むモジュール（import_timing での計測用）
+ROUTE_MODULES = {
+    "/api/summoners": ("riot_api",),
+    "/api/balance-teams": ("balance_logic", "roster", "result_cache"),
+    "/api/balance-teams/batch": ("balance_logic", "roster", "result_cache"),
+    "/api/partition-lobbies": ("balance_logic", "roster", "lobby_partitioner"),
+    "/api/save-summoners": ("summoner_storage",),
+    "/api/load-summoners": ("summoner_storage",),
+    "/api/health": (),
+}
+
 
 def handle_save_summoners(body: Dict) -> Dict:
     """サモナー情報を保存するハンドラー"""
+    from summoner_storage import get_summoner_storage
+
     try:
-        storage = SummonerStorage()
+        storage = get_summoner_storage()
         summoners = body.get("summoners", [])
 
-        log.info(f"Received summoners data: {json.dumps(summoners)}")
+        log.info("Received %d summoners", len(summoners))
+        log.debug("Received summoners data: %s", Payload(summoners))
 
         if not summoners:
             return create_response(400, {"error": "No summoner data provided"})
@@ -53,48 +81,49 @@ def handle_save_summoners(body: Dict) -> Dict:
             }
             cleaned_summoners.append(cleaned_summoner)
 
-        result = storage.save_summoners(
-            cleaned_summoners, passphrase=body.get("passphrase")
-        )
-        log.info(f"Saved summoners data: {json.dumps(result)}")
+        with metrics.timer("dynamodb_save"):
+            result = storage.save_summoners(
+                cleaned_summoners, passphrase=body.get("passphrase")
+            )
+        log.info("Saved summoners data: %s", Payload(result))
         return create_response(200, result)
 
     except Exception as e:
-        log.error(f"Error in handle_save_summoners: {str(e)}")
-        log.error(traceback.format_exc())  # スタックトレースを出力
+        # スタックトレースの整形もログのスレッドで行う
+        log.exception("Error in handle_save_summoners: %s", e)
         return create_response(500, {"error": str(e)})
 
 
 def handle_load_summoners(body: Dict) -> Dict:
     """サモナー情報を読み込むハンドラー"""
+    from summoner_storage import get_summoner_storage
+
     try:
-        storage = SummonerStorage()
+        storage = get_summoner_storage()
         passphrase = body.get("passphrase")
         if not passphrase:
             return create_response(400, {"error": "No passphrase provided"})
 
-        log.debug(f"Loading summoners data with passphrase: {passphrase}")
+        log.debug("Loading summoners data with passphrase: %s", passphrase)
 
-        summoners = storage.load_summoners(passphrase)
+        # Decimalはレスポンスのエンコード時にfloatへ変換する
+        with metrics.timer("dynamodb_load"):
+            summoners = storage.load_summoners(passphrase, convert_decimals=False)
         if summoners is None:
             return create_response(404, {"error": "Invalid or expired passphrase"})
 
-        # Decimalを含むデータを通常の数値型に変換してからレスポンスを作成
-        converted_data = {"summoners": summoners}
-        return create_response(200, converted_data)
+        if response_format(body) == "compact":
+            factored = factor_url_prefix(summoners)
+            return create_response(
+                200, {"urlPrefix": factored["urlPrefix"], "summoners": factored["data"]}
+            )
+        return create_response(200, {"summoners": summoners})
 
     except Exception as e:
-        log.error(f"Error in handle_load_summoners: {traceback.format_exc()}")
+        log.exception("Error in handle_load_summoners: %s", e)
         return create_response(500, {"error": str(e)})
 
 
-def decimal_default(obj: Any) -> Union[float, str]:
-    """JSONシリアライズ時のDecimal型の処理"""
-    if isinstance(obj, decimal.Decimal):
-        return float(obj)
-    raise TypeError
-
-
 def create_response(status_code: int, body: Any) -> Dict[str, Any]:
     """APIGatewayのレスポンス形式を作成（CORS対応）"""
     return {
@@ -105,10 +134,15 @@ def create_response(status_code: int, body: Any) -> Dict[str, Any]:
             "Access-Control-Allow-Methods": "POST,OPTIONS",
             "Access-Control-Allow-Headers": "Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token",
         },
-        "body": json.dumps(body, default=decimal_default),
+        "body": _serialize(body),
     }
 
 
+def _serialize(body: Any) -> str:
+    with metrics.timer("serialize"):
+        return json_encoder.dumps(body)
+
+
 def clean_control_chars(text: str) -> str:
     """制御文字をフィルタリング"""
     return "".join(char for char in text if char.isprintable())
@@ -116,76 +150,337 @@ def clean_control_chars(text: str) -> str:
 
 def handle_summoners_request(body: Dict) -> Dict:
     """サモナー情報を取得するハンドラー"""
+    from riot_api import get_summoners_data
+
     try:
         summoner_names = body.get("summonerNames", [])
+        compact = response_format(body) == "compact"
 
         cleaned_sn_list = [clean_control_chars(sn).strip() for sn in summoner_names]
-        summoners_data = get_summoners_data(cleaned_sn_list)
+        with metrics.timer("riot_fetch"):
+            summoners_data = get_summoners_data(cleaned_sn_list)
+        if compact:
+            factored = factor_url_prefix(summoners_data)
+            return create_response(
+                200, {"urlPrefix": factored["urlPrefix"], "summoners": factored["data"]}
+            )
         return create_response(200, summoners_data)
+    except ValueError as e:
+        return create_response(400, {"error": str(e)})
     except Exception as e:
         return create_response(500, {"error": str(e), "detail": traceback.format_exc()})
 
 
+def parse_summoners(raw_summoners: List[Dict]) -> List["Summoner"]:
+    """リクエストのサモナー情報をSummonerモデルに変換"""
+    from balance_logic import Rank, RoleProficiency, Summoner
+
+    summoners = []
+    for s in raw_summoners:
+        rank_data = s.get("rank", {})
+        role_data = s.get("roleProficiency", {})
+
+        summoner = Summoner(
+            id=s.get("id", ""),
+            name=s.get("name", ""),
+            rank=Rank(
+                combined=rank_data.get("combined", "UNRANKED"),
+                tier=rank_data.get("tier", "UNRANKED"),
+                division=rank_data.get("division", ""),
+            ),
+            roleProficiency=RoleProficiency(
+                TOP=role_data.get("TOP", 0),
+                JUNGLE=role_data.get("JUNGLE", 0),
+                MID=role_data.get("MID", 0),
+                BOT=role_data.get("BOT", 0),
+                SUPPORT=role_data.get("SUPPORT", 0),
+            ),
+            isSelected=s.get("isSelected", True),
+            preferredRoles=s.get("preferredRoles", []),
+        )
+        summoners.append(summoner)
+    return summoners
+
+
+def _balance_response(
+    body: Dict, summoners: List["Summoner"], rng: Optional[random.Random]
+) -> Dict:
+    """正規化済みのサモナーでチーム分けを行い、レスポンスボディを作成"""
+    from balance_logic import (
+        assign_roles_to_teams,
+        balance_teams,
+        balance_teams_top_k,
+        calculate_team_stats,
+    )
+    from roster import CompactRoster
+
+    randomness = float(body.get("randomness", 0.0))
+    auto_assign_roles = body.get("autoAssignRoles", True)
+    team_constraint_groups = body.get("teamConstraintGroups", [])
+    balance_mode = body.get("balanceMode", "standard")
+    top_k = body.get("topK")
+    # コンパクト形式ではチームをサモナーIDと割り当てロールだけで返す
+    compact = response_format(body) == "compact"
+
+    # スコア計算用の配列はリクエストごとに1回だけ作る
+    with metrics.timer("build_roster"):
+        roster = CompactRoster.from_summoners(summoners)
+
+    # 使用したソルバーの情報（レスポンスに含める）
+    solver_report: Dict = {}
+
+    # 複数のチーム分け候補を返す場合（先頭の候補をteamA/teamBにも設定）
+    if top_k is not None:
+        with metrics.timer("balance"):
+            options = balance_teams_top_k(
+                summoners,
+                int(top_k),
+                randomness,
+                team_constraint_groups,
+                mode=balance_mode,
+                diversify=body.get("diversifyOptions", False),
+                assign_roles=auto_assign_roles,
+                report=solver_report,
+                roster=roster,
+                rng=rng,
+            )
+        response_data = {
+            "teamA": options[0].teamA,
+            "teamB": options[0].teamB,
+            "teamAStats": options[0].teamAStats,
+            "teamBStats": options[0].teamBStats,
+            "options": options,
+            "solver": solver_report,
+        }
+        if compact:
+            response_data["options"] = [compact_option(o) for o in options]
+            response_data["teamA"] = response_data["options"][0]["teamA"]
+            response_data["teamB"] = response_data["options"][0]["teamB"]
+        return response_data
+
+    # チーム分け実行（チーム制約付き）
+    with metrics.timer("balance"):
+        team_a, team_b = balance_teams(
+            summoners,
+            randomness,
+            team_constraint_groups,
+            mode=balance_mode,
+            report=solver_report,
+            roster=roster,
+            rng=rng,
+        )
+
+    # ロール割り当て実行（トグルがONの場合のみ）
+    # ジョイントモードではチーム分けと同時に割り当て済み
+    if not auto_assign_roles:
+        for s in team_a + team_b:
+            s.assignedRole = None
+    elif balance_mode != "joint":
+        with metrics.timer("assign_roles"):
+            team_a, team_b = assign_roles_to_teams(
+                [team_a, team_b], report=solver_report, roster=roster
+            )
+
+    # 各チームの統計を計算
+    with metrics.timer("team_stats"):
+        team_a_stats = calculate_team_stats(team_a, roster)
+        team_b_stats = calculate_team_stats(team_b, roster)
+
+    return {
+        "teamA": compact_team(team_a) if compact else team_a,
+        "teamB": compact_team(team_b) if compact else team_b,
+        "teamAStats": team_a_stats,
+        "teamBStats": team_b_stats,
+        "solver": solver_report,
+    }
+
+
+def _cache_key_options(body: Dict) -> Dict:
+    """結果のキャッシュキーに含めるリクエストの値（サモナーと制約グループ以外）
+
+    省略時の既定値と同じ値を明示したリクエストが同じキーになるよう正規化する。
+    """
+    from solvers import resolve_chain
+
+    top_k = body.get("topK")
+    return {
+        "randomness": float(body.get("randomness", 0.0)),
+        "seed": body.get("seed"),
+        "autoAssignRoles": bool(body.get("autoAssignRoles", True)),
+        "balanceMode": body.get("balanceMode") or "standard",
+        "topK": int(top_k) if top_k is not None else None,
+        "diversifyOptions": bool(body.get("diversifyOptions", False)),
+        "responseFormat": response_format(body),
+        "solverChain": resolve_chain(),
+    }
+
+
+def solve_balance_request(body: Dict) -> Tuple[int, Dict]:
+    """1ロスター分のチーム分けを行い (ステータスコード, レスポンスボディ) を返す
+
+    randomness が0、またはシード（"seed"）を指定したリクエストは結果が決まるため、
+    result_cache にキャッシュする。
+    """
+    from balance_logic import normalize_rank_format
+    from pydantic import ValidationError
+    from result_cache import fingerprint, get_result_cache
+
+    try:
+        # 入力データのバリデーション
+        with metrics.timer("parse_summoners"):
+            summoners = parse_summoners(body.get("summoners", []))
+        # ランク形式を標準化
+        with metrics.timer("normalize_ranks"):
+            normalized_summoners = normalize_rank_format(summoners)
+
+        seed = body.get("seed")
+        if seed is not None and (
+            isinstance(seed, bool) or not isinstance(seed, (int, str))
+        ):
+            raise ValueError("seed must be an integer or a string")
+        rng = random.Random(seed) if seed is not None else None
+        cache_key = None
+        if rng is not None or float(body.get("randomness", 0.0)) == 0:
+            cache_key = fingerprint(
+                normalized_summoners,
+                body.get("teamConstraintGroups") or [],
+                _cache_key_options(body),
+            )
+            cached, tier = get_result_cache().get(cache_key)
+            if cached is not None:
+                metrics.increment("balance_cache_hit")
+                return 200, {**cached, "solver": {**cached["solver"], "cache": tier}}
+
+        response_data = _balance_response(body, normalized_summoners, rng)
+        if cache_key is not None:
+            metrics.increment("balance_cache_miss")
+            get_result_cache().put(cache_key, response_data)
+        return 200, response_data
+
+    except ValidationError as e:
+        return 400, {"error": "Invalid request data", "detail": str(e)}
+    except ValueError as e:
+        return 400, {"error": str(e)}
+    except Exception as e:
+        return 500, {"error": str(e), "detail": traceback.format_exc()}
+
+
 def handle_balance_teams_request(body: Dict) -> Dict:
     """チーム分けを行うハンドラー"""
+    return create_response(*solve_balance_request(body))
+
+
+_batch_executor: Optional["ProcessPoolExecutor"] = None
+_batch_executor_lock = threading.Lock()
+
+
+def _get_batch_executor() -> Optional["ProcessPoolExecutor"]:
+    """バッチ用のプロセスプールを返す（BALANCE_BATCH_WORKERS が1以下ならNone）
+
+    プロセスの起動はロスター1件の処理より遅いため、初回に作成したプールを
+    ウォームコンテナ（ローカルサーバー）の間は使い回す。
+    """
+    global _batch_executor
+    workers = int(os.environ.get("BALANCE_BATCH_WORKERS", "1"))
+    if workers <= 1:
+        return None
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+
+            _batch_executor = ProcessPoolExecutor(max_workers=workers)
+        return _batch_executor
+
+
+def _reset_batch_executor(executor: "ProcessPoolExecutor") -> None:
+    """壊れたプールを閉じ、次のリクエストで作り直すようにする"""
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is executor:
+            _batch_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def handle_balance_teams_batch_request(body: Dict) -> Dict:
+    """複数ロスターのチーム分けを1回の呼び出しで行うハンドラー
+
+    各ロスターは /api/balance-teams と同じ形式で、結果とエラーはロスターごとに返す。
+    """
     try:
-        # 入力データのバリデーション
-        summoners = []
-        for s in body.get("summoners", []):
-            rank_data = s.get("rank", {})
-            role_data = s.get("roleProficiency", {})
-
-            summoner = Summoner(
-                id=s.get("id", ""),
-                name=s.get("name", ""),
-                rank=Rank(
-                    combined=rank_data.get("combined", "UNRANKED"),
-                    tier=rank_data.get("tier", "UNRANKED"),
-                    division=rank_data.get("division", ""),
-                ),
-                roleProficiency=RoleProficiency(
-                    TOP=role_data.get("TOP", 0),
-                    JUNGLE=role_data.get("JUNGLE", 0),
-                    MID=role_data.get("MID", 0),
-                    BOT=role_data.get("BOT", 0),
-                    SUPPORT=role_data.get("SUPPORT", 0),
-                ),
-                isSelected=s.get("isSelected", True),
-                preferredRoles=s.get("preferredRoles", []),
+        rosters = body.get("rosters", [])
+        if not isinstance(rosters, list) or not rosters:
+            return create_response(400, {"error": "No rosters provided"})
+        if len(rosters) > MAX_BATCH_ROSTERS:
+            return create_response(
+                400, {"error": f"Too many rosters (max {MAX_BATCH_ROSTERS})"}
             )
-            summoners.append(summoner)
 
-        randomness = float(body.get("randomness", 0.0))
-        auto_assign_roles = body.get("autoAssignRoles", True)
-        team_constraint_groups = body.get("teamConstraintGroups", [])
+        # Lambdaでは/dev/shmが無くプロセスプールを使えないため、既定では逐次実行
+        # （全探索エンジンは1ロスターあたり1ms未満）
+        solved = None
+        executor = _get_batch_executor()
+        if executor is not None:
+            from concurrent.futures.process import BrokenProcessPool
+
+            try:
+                solved = list(executor.map(solve_balance_request, rosters))
+            except BrokenProcessPool:
+                # ワーカーが落ちたプールは使えないため作り直し、今回は逐次実行する
+                log.warning("Batch process pool is broken; recreating it")
+                _reset_batch_executor(executor)
+        if solved is None:
+            solved = [solve_balance_request(roster) for roster in rosters]
+
+        results = []
+        for index, (status_code, result) in enumerate(solved):
+            if status_code == 200:
+                results.append({"index": index, "statusCode": status_code, "result": result})
+            else:
+                results.append({"index": index, "statusCode": status_code, **result})
+
+        return create_response(200, {"results": results})
 
-        # ランク形式を標準化
-        normalized_summoners = normalize_rank_format(summoners)
+    except Exception as e:
+        return create_response(500, {"error": str(e), "detail": traceback.format_exc()})
 
-        # チーム分け実行（チーム制約付き）
-        team_a, team_b = balance_teams(
-            normalized_summoners,
-            randomness,
-            team_constraint_groups
-        )
 
-        # ロール割り当て実行（トグルがONの場合のみ）
-        if auto_assign_roles:
-            team_a = assign_roles_to_team(team_a)
-            team_b = assign_roles_to_team(team_b)
+def handle_partition_lobbies_request(body: Dict) -> Dict:
+    """大人数を複数ロビーに振り分けるハンドラー"""
+    from balance_logic import assign_roles_to_teams, normalize_rank_format
+    from lobby_partitioner import partition_lobbies
+    from pydantic import ValidationError
+    from roster import CompactRoster
 
-        # 各チームの統計を計算
-        team_a_stats = calculate_team_stats(team_a)
-        team_b_stats = calculate_team_stats(team_b)
+    try:
+        with metrics.timer("parse_summoners"):
+            summoners = parse_summoners(body.get("summoners", []))
+        with metrics.timer("normalize_ranks"):
+            summoners = normalize_rank_format(summoners)
+        with metrics.timer("build_roster"):
+            roster = CompactRoster.from_summoners(summoners)
+        auto_assign_roles = body.get("autoAssignRoles", True)
+        lobby_count = body.get("lobbyCount")
+        compact = response_format(body) == "compact"
+
+        with metrics.timer("partition"):
+            result = partition_lobbies(
+                summoners,
+                n_lobbies=int(lobby_count) if lobby_count is not None else None,
+                randomness=float(body.get("randomness", 0.0)),
+                team_constraint_groups=body.get("teamConstraintGroups", []),
+                time_budget=min(
+                    float(body.get("timeBudget", 1.0)), MAX_PARTITION_TIME_BUDGET
+                ),
+                roster=roster,
+            )
 
-        response_data = {
-            "teamA": [s.dict() for s in team_a],
-            "teamB": [s.dict() for s in team_b],
-            "teamAStats": team_a_stats.dict(),
-            "teamBStats": team_b_stats.dict(),
-        }
+        # ロール割り当て実行（トグルがONの場合のみ、全チームを一括で）
+        if auto_assign_roles:
+            teams = [team for lb in result.lobbies for team in (lb.teamA, lb.teamB)]
+            with metrics.timer("assign_roles"):
+                assign_roles_to_teams(teams, roster=roster)
 
-        return create_response(200, response_data)
+        return create_response(200, compact_partition(result) if compact else result)
 
     except ValidationError as e:
         return create_response(400, {"error": "Invalid request data", "detail": str(e)})
@@ -196,13 +491,29 @@ def handle_balance_teams_request(body: Dict) -> Dict:
 
 
 def lambda_handler(event: Dict, context: Any) -> Dict:
-    """Lambda関数のメインハンドラー"""
+    """Lambda関数のメインハンドラー
+
+    クライアントが Accept-Encoding で gzip / deflate を許可していれば、
+    大きいレスポンスは圧縮してbase64で返す。
+    環境変数 METRICS_ENABLED を設定すると、段階ごとの処理時間を metrics で出力する。
+    """
+    with metrics.request_metrics(event.get("path", "")):
+        response = route_request(event)
+        with metrics.timer("compress"):
+            response = compress_response(response, event.get("headers"))
+        metrics.set_property("statusCode", response["statusCode"])
+    return response
+
+
+def route_request(event: Dict) -> Dict:
+    """パスに応じたハンドラーを呼び出す"""
     if event.get("httpMethod") == "OPTIONS":
         return create_response(200, {"message": "OK"})
 
     try:
         try:
-            body = json.loads(event.get("body", "{}"))
+            with metrics.timer("parse_json"):
+                body = json.loads(event.get("body", "{}"))
         # except json.JSONDecodeError:
         #    body = {}
         # except TypeError:
@@ -216,6 +527,10 @@ def lambda_handler(event: Dict, context: Any) -> Dict:
             return handle_summoners_request(body)
         elif path == "/api/balance-teams":
             return handle_balance_teams_request(body)
+        elif path == "/api/balance-teams/batch":
+            return handle_balance_teams_batch_request(body)
+        elif path == "/api/partition-lobbies":
+            return handle_partition_lobbies_request(body)
         elif path == "/api/save-summoners":
             return handle_save_summoners(body)
         elif path == "/api/load-summoners":
@@ -0,0 +1,379 @@
+"""大人数のサモナーを複数の5v5ロビーに振り分けるパーティショナー
+
+10人ちょうどの場合は balance_logic.balance_teams の全探索で厳密解が得られるが、
+20〜80人規模では組み合わせが爆発するため、貪欲法で初期配置を作り
+焼きなまし法（チーム間のプレイヤー入れ替え）で改善する。
+"""
+
+import math
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from balance_logic import Summoner, TeamStats, calculate_team_stats
+from roster import CompactRoster
+from team_constraints import presolve_constraints
+
+TEAM_SIZE = 5
+LOBBY_SIZE = TEAM_SIZE * 2
+
+# 焼きなましでブロックと1人ユニットを入れ替える近傍を選ぶ割合
+BLOCK_MOVE_RATE = 0.2
+
+
+class Lobby(BaseModel):
+    teamA: List[Summoner]
+    teamB: List[Summoner]
+    teamAStats: TeamStats
+    teamBStats: TeamStats
+    rankDiff: float
+    roleDiff: float
+
+
+class PartitionResult(BaseModel):
+    lobbies: List[Lobby]
+    bench: List[Summoner]  # ロビーに入らなかったサモナー
+    objective: float  # 各ロビーの |ランク差| + |ロール差| の合計
+    iterations: int
+    starts: int
+    elapsedSeconds: float
+
+
+def _seed_teams(
+    unit_sizes: List[int],
+    unit_ranks: List[float],
+    components: List[Tuple[List[int], List[int]]],
+    n_teams: int,
+) -> List[int]:
+    """貪欲法で初期配置を作る
+
+    違うチーム制約で繋がったユニットは同じロビーの両チームに分けて配置し、
+    大きい塊・高ランクから順に、ランク合計が最も小さいチームへ入れる。
+
+    Args:
+        components: 違うチーム制約の連結成分ごとの (片側のユニット, 反対側のユニット)
+    """
+    def size_of(units: List[int]) -> int:
+        return sum(unit_sizes[u] for u in units)
+
+    def rank_of(units: List[int]) -> float:
+        return sum(unit_ranks[u] for u in units)
+
+    components = sorted(
+        components,
+        key=lambda c: (-(size_of(c[0]) + size_of(c[1])), -(rank_of(c[0]) + rank_of(c[1]))),
+    )
+
+    team_sizes = [0] * n_teams
+    team_ranks = [0.0] * n_teams
+    team_of_unit = [-1] * len(unit_sizes)
+    for sides in components:
+        best = None
+        for lobby in range(n_teams // 2):
+            for first, second in ((0, 1), (1, 0)):
+                teams = (2 * lobby + first, 2 * lobby + second)
+                if any(
+                    team_sizes[t] + size_of(units) > TEAM_SIZE
+                    for t, units in zip(teams, sides)
+                ):
+                    continue
+                key = max(
+                    team_ranks[t] + rank_of(units) for t, units in zip(teams, sides)
+                )
+                if best is None or key < best[0]:
+                    best = (key, teams)
+        if best is None:
+            raise ValueError("Team constraint groups cannot be seated in the lobbies")
+        for t, units in zip(best[1], sides):
+            for u in units:
+                team_of_unit[u] = t
+                team_sizes[t] += unit_sizes[u]
+                team_ranks[t] += unit_ranks[u]
+
+    return team_of_unit
+
+
+def _anneal(
+    unit_sizes: List[int],
+    unit_ranks: List[float],
+    unit_roles: List[float],
+    components: List[Tuple[List[int], List[int]]],
+    opposite_pairs: List[Tuple[int, int]],
+    n_teams: int,
+    time_budget: float,
+    seed: int,
+) -> Tuple[float, List[int], int]:
+    """焼きなまし法で配置を改善
+
+    近傍は2種類:
+    - 同じ人数のユニット同士を別チームと入れ替える
+    - 2人以上のブロック1つを、別チームの同じ人数分の1人ユニットと入れ替える
+      （これが無いと、同じチーム制約のブロックは初期配置のチームから動けない）
+    違うチーム制約のあるユニットは、入れ替え後も制約を満たす場合のみ動かす。
+
+    Returns:
+        (目的関数値, ユニットごとのチーム番号, 反復回数)
+    """
+    rng = random.Random(seed)
+    deadline = time.perf_counter() + time_budget
+
+    team_of_unit = _seed_teams(unit_sizes, unit_ranks, components, n_teams)
+    team_ranks = [0.0] * n_teams
+    team_roles = [0.0] * n_teams
+    for u, t in enumerate(team_of_unit):
+        team_ranks[t] += unit_ranks[u]
+        team_roles[t] += unit_roles[u]
+
+    def lobby_cost(lobby: int) -> float:
+        a, b = 2 * lobby, 2 * lobby + 1
+        return abs(team_ranks[a] - team_ranks[b]) + abs(team_roles[a] - team_roles[b])
+
+    partners: Dict[int, List[int]] = {}
+    for u, v in opposite_pairs:
+        partners.setdefault(u, []).append(v)
+        partners.setdefault(v, []).append(u)
+
+    buckets: Dict[int, List[int]] = {}
+    for u, size in enumerate(unit_sizes):
+        buckets.setdefault(size, []).append(u)
+    movable = [units for units in buckets.values() if len(units) >= 2]
+    singles = buckets.get(1, [])
+    blocks = [u for u, size in enumerate(unit_sizes) if size >= 2] if singles else []
+
+    cost = sum(lobby_cost(lobby) for lobby in range(n_teams // 2))
+    best_cost, best_assignment = cost, list(team_of_unit)
+    if not movable and not blocks:
+        return best_cost, best_assignment, 0
+
+    # 初期温度は1ユニットあたりのスコアのばらつき程度
+    temperature0 = max(1.0, sum(abs(r) for r in unit_ranks) / len(unit_ranks) / 4)
+    temperature = temperature0
+    iterations = 0
+    while best_cost > 0:
+        if iterations % 256 == 0:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            temperature = temperature0 * remaining / time_budget + 1e-6
+        iterations += 1
+
+        # 動かすユニット u と、u のチーム tu へ移す tv のユニット
+        if blocks and (not movable or rng.random() < BLOCK_MOVE_RATE):
+            u = rng.choice(blocks)
+            tu, tv = team_of_unit[u], rng.randrange(n_teams)
+            if tu == tv:
+                continue
+            candidates = [w for w in singles if team_of_unit[w] == tv]
+            if len(candidates) < unit_sizes[u]:
+                continue
+            others = rng.sample(candidates, unit_sizes[u])
+        else:
+            u, v = rng.sample(rng.choice(movable), 2)
+            tu, tv = team_of_unit[u], team_of_unit[v]
+            if tu == tv:
+                continue
+            others = [v]
+
+        team_of_unit[u] = tv
+        for w in others:
+            team_of_unit[w] = tu
+        if any(
+            team_of_unit[w] != team_of_unit[p] ^ 1
+            for w in [u, *others]
+            for p in partners.get(w, [])
+        ):
+            team_of_unit[u] = tu
+            for w in others:
+                team_of_unit[w] = tv
+            continue
+
+        lobbies = {tu // 2, tv // 2}
+        before = sum(lobby_cost(lobby) for lobby in lobbies)
+        d_rank = sum(unit_ranks[w] for w in others) - unit_ranks[u]
+        d_role = sum(unit_roles[w] for w in others) - unit_roles[u]
+        team_ranks[tu] += d_rank
+        team_roles[tu] += d_role
+        team_ranks[tv] -= d_rank
+        team_roles[tv] -= d_role
+        delta = sum(lobby_cost(lobby) for lobby in lobbies) - before
+
+        if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+            cost += delta
+            if cost < best_cost - 1e-9:
+                best_cost, best_assignment = cost, list(team_of_unit)
+        else:
+            team_of_unit[u] = tu
+            for w in others:
+                team_of_unit[w] = tv
+            team_ranks[tu] -= d_rank
+            team_roles[tu] -= d_role
+            team_ranks[tv] += d_rank
+            team_roles[tv] += d_role
+
+    return best_cost, best_assignment, iterations
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    """マルチスタート用のプロセスプールを返す
+
+    プロセスの起動は探索時間に比べて無視できないため、リクエストごとに作らず
+    使い回す（ワーカー数が変わった場合のみ作り直す）。
+    """
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=workers)
+            _executor_workers = workers
+        return _executor
+
+
+def _reset_executor(executor: ProcessPoolExecutor) -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def partition_lobbies(
+    summoners: List[Summoner],
+    n_lobbies: Optional[int] = None,
+    randomness: float = 0.0,
+    team_constraint_groups: List[Dict] = None,
+    time_budget: float = 1.0,
+    workers: int = 1,
+    seed: Optional[int] = None,
+    roster: Optional[CompactRoster] = None,
+) -> PartitionResult:
+    """サモナーを複数の5v5ロビーに振り分け
+
+    Args:
+        summoners: サモナーリスト（10人以上）
+        n_lobbies: ロビー数（デフォルト: 人数 // 10）。
+            入りきらないサモナーは、チーム制約の無い人からリストの後ろ順にベンチに回る
+        randomness: ランダム性（0-100）
+        team_constraint_groups: チーム制約グループのリスト（balance_teams と同じ形式）
+            "opposite" の2人は同じロビーの別チームに入る
+        time_budget: 探索に使う時間（秒）。各スタートがこの時間だけ探索する
+        workers: マルチスタート数。2以上の場合はプロセスプールで並列に探索する
+        seed: 乱数シード
+        roster: summoners から作成済みのロスター（省略時は作成する）
+    """
+    if n_lobbies is None:
+        n_lobbies = len(summoners) // LOBBY_SIZE
+    if n_lobbies < 1 or len(summoners) < n_lobbies * LOBBY_SIZE:
+        raise ValueError(f"Need at least {LOBBY_SIZE} summoners per lobby")
+    if not 0 <= randomness <= 100:
+        raise ValueError("Randomness must be between 0 and 100")
+    if time_budget <= 0:
+        raise ValueError("Time budget must be positive")
+    if workers < 1:
+        raise ValueError("Workers must be at least 1")
+
+    if team_constraint_groups is None:
+        team_constraint_groups = []
+    if roster is None:
+        roster = CompactRoster.from_summoners(summoners)
+
+    started_at = time.perf_counter()
+    rng = random.Random(seed)
+
+    # チーム制約のあるサモナーを優先して席を埋め、残りはベンチに回す
+    constrained_ids = {
+        sid for group in team_constraint_groups for sid in group.get("summonerIds", [])
+    }
+    n_seats = n_lobbies * LOBBY_SIZE
+    order = sorted(
+        range(len(summoners)), key=lambda i: summoners[i].id not in constrained_ids
+    )
+    seated_indices = sorted(order[:n_seats])
+    seated_roster = roster.take(seated_indices)
+    seated = seated_roster.summoners
+    bench = [summoners[i] for i in sorted(order[n_seats:])]
+
+    # 同じチーム制約のブロックをユニットとして扱う
+    plan = presolve_constraints(
+        [s.id for s in seated],
+        team_constraint_groups,
+        team_size=TEAM_SIZE,
+        n_teams=n_lobbies * 2,
+    )
+    units = plan.blocks
+    components = [
+        tuple(sorted({plan.block_of[i] for i in side}) for side in sides)
+        for sides in plan.components
+    ]
+
+    # ランダム性に基づいてスコアにノイズを追加
+    noise_scale = randomness / 100.0
+    rank_scores = seated_roster.rank_scores + [
+        rng.gauss(0, noise_scale * 10) for _ in seated
+    ]
+    role_scores = seated_roster.role_totals + [
+        rng.gauss(0, noise_scale * 5) for _ in seated
+    ]
+
+    args = (
+        [len(unit) for unit in units],
+        [float(rank_scores[unit].sum()) for unit in units],
+        [float(role_scores[unit].sum()) for unit in units],
+        components,
+        plan.opposite_edges,
+        n_lobbies * 2,
+        time_budget,
+    )
+    seeds = [rng.randrange(2**32) for _ in range(workers)]
+    runs = None
+    if workers > 1:
+        executor = _get_executor(workers)
+        try:
+            futures = [executor.submit(_anneal, *args, s) for s in seeds]
+            runs = [future.result() for future in futures]
+        except BrokenProcessPool:
+            # ワーカーが落ちたプールは作り直し、今回は1スタートだけ探索する
+            _reset_executor(executor)
+    if runs is None:
+        runs = [_anneal(*args, seeds[0])]
+
+    _, team_of_unit, _ = min(runs, key=lambda run: run[0])
+
+    team_indices: List[List[int]] = [[] for _ in range(n_lobbies * 2)]
+    for unit, team in zip(units, team_of_unit):
+        team_indices[team].extend(unit)
+    teams = [seated_roster.take(sorted(indices)) for indices in team_indices]
+
+    lobbies = []
+    for team_a, team_b in zip(teams[0::2], teams[1::2]):
+        rank_diff = float(team_a.rank_scores.sum() - team_b.rank_scores.sum())
+        role_diff = float(team_a.role_totals.sum() - team_b.role_totals.sum())
+        lobbies.append(
+            Lobby(
+                teamA=team_a.summoners,
+                teamB=team_b.summoners,
+                teamAStats=calculate_team_stats(team_a.summoners, team_a),
+                teamBStats=calculate_team_stats(team_b.summoners, team_b),
+                rankDiff=rank_diff,
+                roleDiff=role_diff,
+            )
+        )
+
+    return PartitionResult(
+        lobbies=lobbies,
+        bench=bench,
+        objective=sum(abs(lb.rankDiff) + abs(lb.roleDiff) for lb in lobbies),
+        iterations=sum(run[2] for run in runs),
+        starts=workers,
+        elapsedSeconds=time.perf_counter() - started_at,
+    )
@@ -1,6 +1,26 @@
-from logging import DEBUG, Formatter, LogRecord, StreamHandler, getLogger
-from logging.handlers import RotatingFileHandler
+import json
+import os
+import sys
+import threading
+from logging import (
+    DEBUG,
+    Filter,
+    Formatter,
+    Handler,
+    Logger,
+    LogRecord,
+    StreamHandler,
+    getLevelName,
+    getLogger,
+    makeLogRecord,
+)
 from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# メッセージの最大文字数（超えた部分は省略する）
+DEFAULT_MAX_MESSAGE_CHARS = 4000
+# Payload で出力するデータの最大文字数
+DEFAULT_PAYLOAD_CHARS = 1000
 
 
 class ColorCodes:
@@ -29,7 +49,7 @@ class ColorCodes:
 
 
 class ColoredFormatter(Formatter):
-    """カラー対応のフォーマッター"""
+    """カラー対応のフォーマッター（端末に出力する場合のみ使用）"""
 
     def __init__(self, fmt=None, datefmt=None):
         super().__init__(fmt, datefmt)
@@ -44,26 +64,99 @@ class ColoredFormatter(Formatter):
         }
 
     def format(self, record: LogRecord) -> str:
-        # 元のメッセージを保持
+        # 他のハンドラーにも同じレコードが渡るため、コピーの levelname に色を適用
+        color = self.COLORS.get(record.levelname, "")
+        colored = makeLogRecord(record.__dict__)
+        colored.levelname = f"{color}{record.levelname}{ColorCodes.RESET}"
+        return super().format(colored)
+
+
+class JSONFormatter(Formatter):
+    """1レコードを1行のJSONにするフォーマッター（CloudWatch Logsなど向け）"""
+
+    def format(self, record: LogRecord) -> str:
+        entry = {
+            "level": record.levelname,
+            "time": self.formatTime(record, self.datefmt),
+            "logger": record.name,
+            "location": f"{record.filename}:{record.lineno}",
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TruncateFilter(Filter):
+    """長いメッセージを max_chars 文字で切り詰めるフィルター
+
+    キューを使う場合はバックグラウンドスレッドで実行されるため、
+    メッセージの組み立て（%形式の引数の展開）もリクエストの処理中には行われない。
+    """
+
+    def __init__(self, max_chars: int):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def filter(self, record: LogRecord) -> bool:
         message = record.getMessage()
+        if len(message) > self.max_chars:
+            omitted = len(message) - self.max_chars
+            message = f"{message[: self.max_chars]}... ({omitted} chars truncated)"
+        # 組み立てたメッセージを保持し、フォーマッターで再度組み立てないようにする
+        record.msg = message
+        record.args = None
+        return True
+
+
+class Payload:
+    """ログに出すデータ（JSONへの変換はメッセージを組み立てる時まで遅延する）
+
+    使い方:
+        log.debug("Received summoners data: %s", Payload(summoners))
+
+    ログレベルで出力されない場合は変換されない。max_chars を超える部分は省略する。
+    """
+
+    __slots__ = ("data", "max_chars")
+
+    def __init__(self, data: Any, max_chars: int = DEFAULT_PAYLOAD_CHARS):
+        self.data = data
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        try:
+            text = json.dumps(self.data, ensure_ascii=False, default=str)
+        except (TypeError, ValueError):
+            text = repr(self.data)
+        if len(text) > self.max_chars:
+            return f"{text[: self.max_chars]}... ({len(text)} chars)"
+        return text
 
-        # ログレベルに応じた色を取得
-        color = self.COLORS.get(record.levelname, "")
 
-        # levelname に色を適用
-        colored_levelname = f"{color}{record.levelname}{ColorCodes.RESET}"
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
 
-        # 一時的に levelname を置き換え
-        original_levelname = record.levelname
-        record.levelname = colored_levelname
 
-        # フォーマット適用
-        formatted_message = super().format(record)
+def _default_log_format() -> str:
+    """環境変数 LOG_FORMAT、無ければ端末ならカラー、それ以外はプレーン"""
+    log_format = os.environ.get("LOG_FORMAT")
+    if log_format:
+        return log_format
+    return "color" if sys.stderr.isatty() else "plain"
 
-        # 元の levelname を戻す
-        record.levelname = original_levelname
 
-        return formatted_message
+# ロガー名 -> キューのリスナー
+_listeners: Dict[str, Any] = {}
+
+
+def _stop_listeners() -> None:
+    """終了時にキューに残っているログを書き出す"""
+    while _listeners:
+        _listeners.popitem()[1].stop()
 
 
 def setup_logger(
@@ -72,6 +165,9 @@ def setup_logger(
     log_file=None,
     max_bytes: int = 10_485_760,  # 10MB
     backup_count: int = 5,
+    log_format: Optional[str] = None,
+    use_queue: Optional[bool] = None,
+    max_message_chars: Optional[int] = None,
 ) -> None:
     """ロギングの設定を行う関数
 
@@ -81,33 +177,63 @@ def setup_logger(
         log_file: ログファイルパス (デフォルト: None)
         max_bytes: ログローテーションのサイズ制限 (デフォルト: 10MB)
         backup_count: 保持するバックアップファイル数 (デフォルト: 5)
+        log_format: コンソールの形式 "color" / "plain" / "json"
+            (デフォルト: 環境変数 LOG_FORMAT、無ければ端末ならcolor、それ以外はplain)
+        use_queue: ログの書き出しをバックグラウンドスレッドで行うか
+            (デフォルト: 環境変数 LOG_QUEUE、無ければLambda以外でTrue。
+            Lambdaはハンドラーが返るとコンテナを止めるため、キューに残った
+            ログ（失敗したリクエストのトレースバックなど）が遅れるか失われる)
+        max_message_chars: メッセージの最大文字数
+            (デフォルト: 環境変数 LOG_MAX_MESSAGE_CHARS、無ければ4000)
     """
     logger = getLogger(name)
 
     # 既存のハンドラーをクリア（二重登録防止）
     if logger.hasHandlers():
         logger.handlers.clear()
+    listener = _listeners.pop(name, None)
+    if listener is not None:
+        listener.stop()
+
+    if log_format is None:
+        log_format = _default_log_format()
+    if use_queue is None:
+        use_queue = _env_flag(
+            "LOG_QUEUE", "AWS_LAMBDA_FUNCTION_NAME" not in os.environ
+        )
+    if max_message_chars is None:
+        max_message_chars = int(
+            os.environ.get("LOG_MAX_MESSAGE_CHARS", DEFAULT_MAX_MESSAGE_CHARS)
+        )
 
-    # カラーフォーマッターの設定（コンソール用）
-    console_formatter = ColoredFormatter(
-        fmt="[%(levelname)s] [%(asctime)s] [%(filename)s:%(lineno)d] %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
+    fmt = "[%(levelname)s] [%(asctime)s] [%(filename)s:%(lineno)d] %(message)s"
+    datefmt = "%Y-%m-%d %H:%M:%S"
+    if log_format == "color":
+        console_formatter: Formatter = ColoredFormatter(fmt=fmt, datefmt=datefmt)
+    elif log_format == "json":
+        console_formatter = JSONFormatter(datefmt=datefmt)
+    elif log_format == "plain":
+        console_formatter = Formatter(fmt=fmt, datefmt=datefmt)
+    else:
+        raise ValueError(f"Unknown log format: {log_format}")
 
     # 通常のフォーマッター（ファイル用）
-    file_formatter = Formatter(
-        fmt="[%(levelname)s] [%(asctime)s] [%(filename)s:%(lineno)d] %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
+    file_formatter = Formatter(fmt=fmt, datefmt=datefmt)
+
+    truncate_filter = TruncateFilter(max_message_chars)
+    handlers: List[Handler] = []
 
     # コンソール出力の設定
     console_handler = StreamHandler()
     console_handler.setLevel(log_level)
     console_handler.setFormatter(console_formatter)
-    logger.addHandler(console_handler)
+    handlers.append(console_handler)
 
     # ファイル出力の設定（指定された場合）
     if log_file:
+        # logging.handlers はimportが重いため、ファイル出力する場合のみ読み込む
+        from logging.handlers import RotatingFileHandler
+
         log_file = Path(log_file)
         log_file.parent.mkdir(parents=True, exist_ok=True)
         file_handler = RotatingFileHandler(
@@ -118,13 +244,79 @@ def setup_logger(
         )
         file_handler.setLevel(log_level)
         file_handler.setFormatter(file_formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
+
+    for handler in handlers:
+        handler.addFilter(truncate_filter)
+
+    if use_queue:
+        # 呼び出し元はキューに積むだけで、整形と書き出しはリスナースレッドで行う
+        logger.addHandler(_start_queue_listener(name, handlers))
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
 
     logger.setLevel(log_level)
     logger.propagate = False
 
 
-# デフォルトのロガー設定
-log = getLogger(__name__)
-setup_logger()
-log.info("Logger initialized")
+def _start_queue_listener(name: str, handlers: List[Handler]) -> Handler:
+    import atexit
+    import queue
+    from logging.handlers import QueueHandler, QueueListener
+
+    class _DeferredQueueHandler(QueueHandler):
+        """メッセージを組み立てずにキューに積む QueueHandler
+
+        標準の QueueHandler.prepare() は呼び出し元のスレッドでメッセージを
+        整形するため、レコードをそのまま渡す。%形式の引数はリスナースレッドで
+        展開されるので、ログに渡したオブジェクトは後から変更しないこと。
+        """
+
+        def prepare(self, record: LogRecord) -> LogRecord:
+            return record
+
+    log_queue: "queue.SimpleQueue[LogRecord]" = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    if not _listeners:
+        atexit.register(_stop_listeners)
+    _listeners[name] = listener
+    return _DeferredQueueHandler(log_queue)
+
+
+class _LazyLogger:
+    """初回のログ出力時に setup_logger() を実行するロガー
+
+    import時にハンドラーを作らないため、ログを出さないリクエストでは
+    設定のコストがかからない。ログレベルは環境変数 LOG_LEVEL（既定: INFO）。
+    DEBUGでは Payload で渡したデータの整形がリクエストごとに行われる。
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._logger: Optional[Logger] = None
+        self._lock = threading.Lock()
+
+    def _get(self) -> Logger:
+        if self._logger is None:
+            # 複数のスレッドが同時に最初のログを出しても設定は1回だけ行う
+            with self._lock:
+                if self._logger is None:
+                    setup_logger(
+                        self._name,
+                        log_level=getLevelName(
+                            os.environ.get("LOG_LEVEL", "INFO").upper()
+                        ),
+                    )
+                    logger = getLogger(self._name)
+                    logger.info("Logger initialized")
+                    self._logger = logger
+        return self._logger
+
+    def __getattr__(self, attr: str):
+        return getattr(self._get(), attr)
+
+
+# デフォルトのロガー（設定は初回使用時）
+log = _LazyLogger(__name__)
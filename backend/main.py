@@ -1,5 +1,324 @@
-def main():
-    print("Hello from backend!")
+"""Lambda以外で動かすためのHTTPサーバー
+
+lambda_function のハンドラーを asyncio のHTTP/1.1サーバー（keep-alive対応）に載せる。
+
+- チーム分け・ロビー振り分けなどCPUを使うルートはプロセスプールで実行する
+- Riot APIやDynamoDBを呼ぶルートはスレッドプールで実行し、イベントループを止めない
+- SIGTERM / SIGINT を受けたら新しい接続の受け付けを止め、処理中のリクエストを
+  待ってから終了する
+
+使い方:
+    python main.py --port 8000 --workers 4
+"""
+
+import argparse
+import asyncio
+import base64
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import lambda_function
+from logger import log
+
+# プロセスプールで実行するルート
+CPU_ROUTES = ("/api/balance-teams", "/api/balance-teams/batch", "/api/partition-lobbies")
+# イベントループ上でそのまま処理するルート（外部呼び出しも重い計算も無い）
+INLINE_ROUTES = ("/api/health",)
+
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 8000
+DEFAULT_THREADS = 16
+# リクエストボディの上限（バイト）
+MAX_BODY_BYTES = 1 << 20
+# keep-alive接続で次のリクエストを待つ時間（秒）
+KEEPALIVE_TIMEOUT = 15.0
+# リクエストライン以降のヘッダー・ボディを読み終えるまでの時間（秒）。
+# 少しずつ送り続けるクライアントが接続と終了処理を止め続けないようにする
+HEADER_READ_TIMEOUT = 10.0
+BODY_READ_TIMEOUT = 30.0
+# 終了時に処理中のリクエストを待つ時間（秒）
+SHUTDOWN_GRACE_PERIOD = 30.0
+
+
+class BadRequest(Exception):
+    """HTTPリクエストを解釈できない場合のエラー"""
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _warm_worker() -> None:
+    """プロセスプールのワーカー起動時にチーム分けのモジュールを読み込んでおく"""
+    for name in lambda_function.ROUTE_MODULES["/api/balance-teams"]:
+        __import__(name)
+
+
+async def _readline(reader: asyncio.StreamReader, status: HTTPStatus) -> bytes:
+    """1行読み込む（StreamReader の上限より長い行は status の BadRequest）"""
+    try:
+        return await reader.readline()
+    except (ValueError, asyncio.LimitOverrunError):
+        raise BadRequest(status, "Line too long")
+
+
+async def _read_headers(reader: asyncio.StreamReader) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    while True:
+        line = await _readline(reader, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+        if line in (b"\r\n", b"\n", b""):
+            return headers
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+
+async def read_request(
+    reader: asyncio.StreamReader, timeout: float
+) -> Optional[Tuple[str, str, Dict[str, str], str]]:
+    """HTTPリクエストを1つ読み込む（接続が閉じられた場合はNone）
+
+    Returns:
+        (メソッド, パス, ヘッダー, ボディ)
+    """
+    try:
+        request_line = await asyncio.wait_for(
+            _readline(reader, HTTPStatus.REQUEST_URI_TOO_LONG), timeout
+        )
+    except asyncio.TimeoutError:
+        return None
+    if not request_line:
+        return None
+
+    try:
+        method, target, version = request_line.decode("latin-1").split()
+    except ValueError:
+        raise BadRequest(HTTPStatus.BAD_REQUEST, "Malformed request line")
+    if not version.startswith("HTTP/1."):
+        raise BadRequest(HTTPStatus.HTTP_VERSION_NOT_SUPPORTED, "HTTP/1.x only")
+
+    try:
+        headers = await asyncio.wait_for(_read_headers(reader), HEADER_READ_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise BadRequest(HTTPStatus.REQUEST_TIMEOUT, "Timed out reading headers")
+    if version == "HTTP/1.0" and "connection" not in headers:
+        headers["connection"] = "close"
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise BadRequest(HTTPStatus.LENGTH_REQUIRED, "Chunked bodies are not supported")
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise BadRequest(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise BadRequest(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+    try:
+        body = (
+            await asyncio.wait_for(reader.readexactly(length), BODY_READ_TIMEOUT)
+            if length
+            else b""
+        )
+    except asyncio.TimeoutError:
+        raise BadRequest(HTTPStatus.REQUEST_TIMEOUT, "Timed out reading body")
+    try:
+        text = body.decode("utf-8")
+    except UnicodeDecodeError:
+        raise BadRequest(HTTPStatus.BAD_REQUEST, "Request body is not valid UTF-8")
+
+    return method.upper(), urlsplit(target).path, headers, text
+
+
+def encode_response(response: Dict, keep_alive: bool) -> bytes:
+    """Lambdaのレスポンス形式をHTTPレスポンスに変換"""
+    status = response.get("statusCode", 200)
+    body = response.get("body") or ""
+    if response.get("isBase64Encoded"):
+        payload = base64.b64decode(body)
+    else:
+        payload = body.encode("utf-8")
+
+    try:
+        reason = HTTPStatus(status).phrase
+    except ValueError:
+        reason = ""
+    lines = [f"HTTP/1.1 {status} {reason}"]
+    for name, value in response.get("headers", {}).items():
+        lines.append(f"{name}: {value}")
+    lines.append(f"Content-Length: {len(payload)}")
+    lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + payload
+
+
+class Server:
+    """lambda_function のハンドラーを提供するHTTPサーバー"""
+
+    def __init__(
+        self,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        workers: Optional[int] = None,
+        threads: int = DEFAULT_THREADS,
+    ):
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.threads = threads
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        # プロセスプールに同時に渡すリクエスト数の上限（超えた分はここで待つ）
+        self._cpu_slots = asyncio.Semaphore(self.workers * 2)
+        self._connections: set = set()
+        self._in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._stopping = asyncio.Event()
+
+    async def dispatch(self, event: Dict) -> Dict:
+        """ルートに応じて実行場所を選び、ハンドラーを呼び出す"""
+        loop = asyncio.get_running_loop()
+        path = event["path"]
+        if event["httpMethod"] == "OPTIONS" or path in INLINE_ROUTES:
+            return lambda_function.lambda_handler(event, None)
+        if path in CPU_ROUTES:
+            async with self._cpu_slots:
+                return await loop.run_in_executor(
+                    self._process_pool, lambda_function.lambda_handler, event, None
+                )
+        return await loop.run_in_executor(
+            self._thread_pool, lambda_function.lambda_handler, event, None
+        )
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            keep_alive = True
+            while keep_alive and not self._stopping.is_set():
+                try:
+                    request = await read_request(reader, KEEPALIVE_TIMEOUT)
+                except BadRequest as e:
+                    response = lambda_function.create_response(
+                        e.status.value, {"error": str(e)}
+                    )
+                    writer.write(encode_response(response, keep_alive=False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                event = {
+                    "httpMethod": method,
+                    "path": path,
+                    "headers": headers,
+                    "body": body or "{}",
+                }
+
+                self._in_flight += 1
+                self._idle.clear()
+                try:
+                    response = await self.dispatch(event)
+                except Exception as e:
+                    log.error("Unhandled error for %s %s: %s", method, path, e)
+                    response = lambda_function.create_response(500, {"error": str(e)})
+                finally:
+                    self._in_flight -= 1
+                    if self._in_flight == 0:
+                        self._idle.set()
+
+                keep_alive = keep_alive and not self._stopping.is_set()
+                writer.write(encode_response(response, keep_alive))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def start(self) -> None:
+        self._process_pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            # スレッドを持つ親プロセスをforkしないようspawnで起動する
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_worker,
+        )
+        self._thread_pool = ThreadPoolExecutor(max_workers=self.threads)
+        self._server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port
+        )
+        sockets = self._server.sockets or []
+        if sockets:
+            self.port = sockets[0].getsockname()[1]
+        log.info(
+            "Serving on http://%s:%d (workers=%d, threads=%d)",
+            self.host,
+            self.port,
+            self.workers,
+            self.threads,
+        )
+
+    async def stop(self, grace_period: float = SHUTDOWN_GRACE_PERIOD) -> None:
+        """新しい接続を止め、処理中のリクエストを待ってから終了"""
+        self._stopping.set()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        try:
+            await asyncio.wait_for(self._idle.wait(), grace_period)
+        except asyncio.TimeoutError:
+            log.warning("%d requests still running at shutdown", self._in_flight)
+
+        # keep-aliveで次のリクエストを待っている接続を閉じる
+        for task in list(self._connections):
+            task.cancel()
+        if self._connections:
+            await asyncio.gather(*self._connections, return_exceptions=True)
+
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=True)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=True)
+        log.info("Server stopped")
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self._stopping.set)
+        await self._stopping.wait()
+        await self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="team-balancer API server")
+    parser.add_argument("--host", default=os.environ.get("HOST", DEFAULT_HOST))
+    parser.add_argument(
+        "--port", type=int, default=int(os.environ.get("PORT", DEFAULT_PORT))
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("BALANCE_WORKERS", "0")) or None,
+        help="チーム分けのプロセス数（既定: CPU数）",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=int(os.environ.get("IO_THREADS", DEFAULT_THREADS)),
+        help="Riot API・DynamoDB呼び出しのスレッド数",
+    )
+    args = parser.parse_args()
+
+    server = Server(args.host, args.port, args.workers, args.threads)
+    asyncio.run(server.serve_forever())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,140 @@
+"""マッチ詳細のキャッシュ
+
+終了したマッチの内容は変わらないため、match/v5 のレスポンスから集計に使う
+参加者の項目（チャンピオンとポジション）だけを取り出し、マッチIDをキーに保存する。
+カスタムゲームのロビーでは同じマッチに参加したプレイヤーが多いため、
+1つのマッチを取得すれば参加者全員分に使える。
+
+- プロセス内: 件数上限付きのLRU（環境変数 MATCH_CACHE_SIZE）
+- 永続: Riot APIのキャッシュと同じDynamoDBテーブル（キー "match:<マッチID>"）
+"""
+
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import metrics
+from logger import log
+from result_cache import LRUCache
+
+DEFAULT_CACHE_SIZE = 5000
+DEFAULT_TTL_DAYS = 30
+# DynamoDBのキーの接頭辞（サモナーのキャッシュと同じテーブルを使う）
+KEY_PREFIX = "match:"
+
+# 参加者のPUUID -> {"champion_id", "champion", "role", "started_at"}
+MatchParticipants = Dict[str, Dict[str, Any]]
+
+
+def project_match(match_detail: Dict) -> MatchParticipants:
+    """match/v5 のレスポンスから参加者ごとの集計に使う項目を取り出す
+
+    started_at（試合開始のUNIX秒）はサモナーの差分更新で、それより新しい
+    マッチだけを要求するために使う。
+    """
+    info = match_detail["info"]
+    started_at_ms = info.get("gameStartTimestamp") or info.get("gameCreation")
+    started_at = started_at_ms // 1000 if started_at_ms else None
+    return {
+        participant["puuid"]: {
+            "champion_id": participant["championId"],
+            "champion": participant["championName"],
+            "role": participant["teamPosition"],
+            "started_at": started_at,
+        }
+        for participant in info["participants"]
+    }
+
+
+class MatchCache:
+    """プロセス内LRUとDynamoDBの2層のマッチキャッシュ"""
+
+    def __init__(
+        self,
+        table: Any = None,
+        maxsize: Optional[int] = None,
+        ttl_days: Optional[int] = None,
+    ):
+        if maxsize is None:
+            maxsize = int(os.environ.get("MATCH_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+        if ttl_days is None:
+            ttl_days = int(os.environ.get("MATCH_CACHE_TTL_DAYS", DEFAULT_TTL_DAYS))
+        self.local = LRUCache(maxsize)
+        self.table = table
+        self.ttl_seconds = ttl_days * 24 * 3600
+
+    @staticmethod
+    def _key(match_id: str) -> str:
+        return KEY_PREFIX + match_id
+
+    def get(self, match_id: str) -> Optional[MatchParticipants]:
+        participants = self.local.get(match_id)
+        if participants is not None:
+            metrics.increment("match_cache_hit_memory")
+            return participants
+        if self.table is not None:
+            try:
+                with metrics.timer("dynamodb_match_read"):
+                    item = self.table.get_item(Key={"cache_key": self._key(match_id)})
+                item = item.get("Item")
+                if item is not None:
+                    participants = json.loads(item["data"])
+                    self.local.put(match_id, participants)
+                    metrics.increment("match_cache_hit_dynamodb")
+                    return participants
+            except Exception as e:
+                log.warning("マッチキャッシュの読み込みに失敗: %s", e)
+        metrics.increment("match_cache_miss")
+        return None
+
+    def get_many(self, match_ids: List[str]) -> Dict[str, MatchParticipants]:
+        """複数のマッチをまとめて取得（DynamoDBは batch_get_item で1回に読み込む）
+
+        Returns:
+            マッチID -> 参加者（キャッシュに無いマッチは含まない）
+        """
+        from aws_resources import batch_get_items
+
+        match_ids = list(dict.fromkeys(match_ids))
+        found: Dict[str, MatchParticipants] = {}
+        missing = []
+        for match_id in match_ids:
+            participants = self.local.get(match_id)
+            if participants is not None:
+                found[match_id] = participants
+            else:
+                missing.append(match_id)
+        metrics.increment("match_cache_hit_memory", len(found))
+        if missing and self.table is not None:
+            try:
+                with metrics.timer("dynamodb_match_read"):
+                    items = batch_get_items(
+                        self.table.name, [self._key(match_id) for match_id in missing]
+                    )
+                for item in items:
+                    match_id = item["cache_key"][len(KEY_PREFIX) :]
+                    participants = json.loads(item["data"])
+                    self.local.put(match_id, participants)
+                    found[match_id] = participants
+                metrics.increment("match_cache_hit_dynamodb", len(items))
+            except Exception as e:
+                log.warning("マッチキャッシュの読み込みに失敗: %s", e)
+        metrics.increment("match_cache_miss", len(match_ids) - len(found))
+        return found
+
+    def put(self, match_id: str, participants: MatchParticipants) -> None:
+        self.local.put(match_id, participants)
+        if self.table is None:
+            return
+        try:
+            with metrics.timer("dynamodb_match_write"):
+                self.table.put_item(
+                    Item={
+                        "cache_key": self._key(match_id),
+                        "data": json.dumps(participants),
+                        "ttl": int(time.time()) + self.ttl_seconds,
+                    }
+                )
+        except Exception as e:
+            log.warning("マッチキャッシュの書き込みに失敗: %s", e)
@@ -0,0 +1,196 @@
+"""リクエストごとの処理時間・カウンターの計測
+
+lambda_handler が request_metrics() でリクエストの計測を開始し、各処理は
+timer("段階名") で処理時間を、increment("名前") で回数（キャッシュヒットや
+429のリトライなど）を記録する。リクエストの終了時に CloudWatch Embedded Metric
+Format（EMF）のJSONを1行、ロガー "metrics" に出力する。
+
+環境変数 METRICS_ENABLED が "1" / "true" の場合のみ有効。無効な場合や
+リクエストの外（ベンチマークなど）では timer() / increment() は何もしない
+（ContextVarを1回読むだけ）。
+
+スレッドプールで実行する処理に計測を引き継ぐ場合は propagate(関数) で包む。
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional
+
+DEFAULT_NAMESPACE = "TeamBalancer"
+
+_TRUE_VALUES = ("1", "true", "yes", "on")
+
+_enabled = os.environ.get("METRICS_ENABLED", "").lower() in _TRUE_VALUES
+
+
+class RequestMetrics:
+    """1リクエスト分の計測値（スレッドセーフ）"""
+
+    def __init__(self, route: str):
+        self.route = route
+        self.timings: Dict[str, float] = {}  # 段階名 -> 合計ミリ秒
+        self.counters: Dict[str, int] = {}
+        self.properties: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def add_timing(self, stage: str, elapsed_ms: float) -> None:
+        with self._lock:
+            self.timings[stage] = self.timings.get(stage, 0.0) + elapsed_ms
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_emf(self, namespace: str) -> Dict[str, Any]:
+        """CloudWatch Embedded Metric Format の辞書に変換"""
+        with self._lock:
+            timings = dict(self.timings)
+            counters = dict(self.counters)
+        definitions = [{"Name": name, "Unit": "Milliseconds"} for name in timings]
+        definitions += [{"Name": name, "Unit": "Count"} for name in counters]
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": namespace,
+                        "Dimensions": [["route"]],
+                        "Metrics": definitions,
+                    }
+                ],
+            },
+            "route": self.route,
+            **self.properties,
+            **{name: round(value, 3) for name, value in timings.items()},
+            **counters,
+        }
+
+
+_current: ContextVar[Optional[RequestMetrics]] = ContextVar("metrics", default=None)
+
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics: RequestMetrics, stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.metrics.add_timing(self.stage, (time.perf_counter() - self.start) * 1000)
+
+
+class _NullTimer:
+    """計測しない場合の timer()"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def configure(enabled: bool) -> None:
+    """計測の有効・無効を切り替える（既定は環境変数 METRICS_ENABLED）"""
+    global _enabled
+    _enabled = enabled
+
+
+def timer(stage: str):
+    """with文で囲んだ処理の時間を stage（ミリ秒）として記録"""
+    metrics = _current.get()
+    if metrics is None:
+        return _NULL_TIMER
+    return _Timer(metrics, stage)
+
+
+def increment(name: str, value: int = 1) -> None:
+    """カウンターを加算"""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.increment(name, value)
+
+
+def set_property(name: str, value: Any) -> None:
+    """メトリクスではない値（ステータスコードなど）を出力に含める"""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.properties[name] = value
+
+
+def propagate(func: Callable) -> Callable:
+    """現在のリクエストの計測を別スレッドで実行する関数に引き継ぐ"""
+    metrics = _current.get()
+    if metrics is None:
+        return func
+
+    def run(*args: Any, **kwargs: Any) -> Any:
+        token = _current.set(metrics)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+    return run
+
+
+def emit(metrics: RequestMetrics) -> None:
+    """EMFのJSONを1行出力（CloudWatch Logsがそのまま解釈できるよう装飾しない）"""
+    _get_logger().info(
+        json.dumps(
+            metrics.to_emf(os.environ.get("METRICS_NAMESPACE", DEFAULT_NAMESPACE)),
+            separators=(",", ":"),
+        )
+    )
+
+
+@contextmanager
+def request_metrics(route: str) -> Iterator[Optional[RequestMetrics]]:
+    """リクエストの計測を開始し、終了時に出力する（無効な場合はNone）"""
+    if not _enabled:
+        yield None
+        return
+    metrics = RequestMetrics(route)
+    token = _current.set(metrics)
+    try:
+        with _Timer(metrics, "total"):
+            yield metrics
+    finally:
+        _current.reset(token)
+        emit(metrics)
+
+
+_logger: Optional[logging.Logger] = None
+
+
+def _get_logger() -> logging.Logger:
+    global _logger
+    if _logger is None:
+        logger = logging.getLogger("metrics")
+        if not logger.handlers:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        _logger = logger
+    return _logger
@@ -0,0 +1,268 @@
+"""Riot APIのレート制限
+
+Riot APIはリージョン（ホスト）ごとにアプリケーション全体の制限
+（X-App-Rate-Limit）と、エンドポイントごとの制限（X-Method-Rate-Limit）を
+"件数:秒数" のカンマ区切りでレスポンスヘッダーに返す。
+
+RateLimiter はこのヘッダーから制限を学習し、全スレッドで共有する予約表に
+送信時刻を割り当てる。各スレッドは割り当てられた時刻まで待ってから送信するため、
+並列に呼び出しても制限を超えて429になることは無い。
+
+- どの区間（秒数）を取っても件数が制限以下になるよう予約する（スライディング
+  ウィンドウ）。Riotの集計区間の開始時刻は分からないため、固定区間のどこで
+  区切られても超えないようにしている
+- ヘッダーの使用済み件数（X-*-Rate-Limit-Count）が予約表より多い場合
+  （他のコンテナと同じキーを使っている場合など）は予約表に反映する
+- エンドポイントの制限が分かるまでは、そのエンドポイントには1件ずつしか送らない
+- 429の Retry-After は X-Rate-Limit-Type に応じてアプリ全体またはエンドポイントの
+  予約を止める
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_right, insort
+from typing import Dict, List, Mapping, Optional, Tuple
+
+# 最初のレスポンスを受け取るまで使うアプリケーションの制限（開発用キーの制限）
+DEFAULT_APP_RATE_LIMIT = "20:1,100:120"
+
+# 区間の長さに加える余裕（秒）。スレッドの起床の遅れやネットワークの遅延で
+# 予約より遅れて届いたリクエストが次の区間に数えられても超えないようにする
+WINDOW_MARGIN = 0.05
+
+# 制限を調べるための最初のリクエストの応答を待つ最大時間（秒）
+PROBE_TIMEOUT = 5.0
+
+
+def parse_rate_limits(value: Optional[str]) -> List[Tuple[int, float]]:
+    """"20:1,100:120" 形式のヘッダーを [(件数, 秒数), ...] に変換"""
+    limits = []
+    for item in (value or "").split(","):
+        count, _, seconds = item.strip().partition(":")
+        try:
+            limits.append((int(count), float(seconds)))
+        except ValueError:
+            continue
+    return limits
+
+
+class RateWindow:
+    """「seconds 秒の間に limit 件まで」の制限1つ分の予約表"""
+
+    def __init__(self, limit: int, seconds: float):
+        self.limit = limit
+        self.seconds = seconds + WINDOW_MARGIN
+        self.times: List[float] = []  # 予約済みの送信時刻（昇順）
+
+    def earliest(self, t: float) -> float:
+        """t 以降で、送信しても制限を超えない最初の時刻"""
+        times, limit, seconds = self.times, self.limit, self.seconds
+        if limit <= 0:
+            return float("inf")
+        while True:
+            # t を入れると、t と前後の連続する limit 件が seconds 秒未満に収まる場合は超える
+            k = bisect_right(times, t)
+            moved = False
+            for j in range(max(0, k - limit), min(k, len(times) - limit) + 1):
+                first, last = times[j], times[j + limit - 1]
+                if max(t, last) < min(t, first) + seconds:
+                    t = first + seconds
+                    moved = True
+                    break
+            if not moved:
+                return t
+
+    def reserve(self, t: float) -> None:
+        insort(self.times, t)
+
+    def prune(self, now: float) -> None:
+        """判定に使わなくなった古い予約を削除"""
+        cutoff = bisect_right(self.times, now - self.seconds)
+        if cutoff:
+            del self.times[:cutoff]
+
+    def sync(self, count: int, now: float) -> None:
+        """サーバー側の使用済み件数が予約表より多ければ、差分を now に追加"""
+        start = bisect_right(self.times, now - self.seconds)
+        end = bisect_right(self.times, now)
+        for _ in range(count - (end - start)):
+            insort(self.times, now)
+
+
+class RateBucket:
+    """1つのスコープ（アプリ全体 or エンドポイント）の制限"""
+
+    def __init__(self, limits: Optional[List[Tuple[int, float]]] = None):
+        self.windows: Dict[Tuple[int, float], RateWindow] = {}
+        self.blocked_until = 0.0
+        # 制限が分かっているか、分からない場合は調べるリクエストを送信中か
+        self.learned = bool(limits)
+        self.probing = False
+        if limits:
+            self.set_limits(limits)
+
+    def set_limits(self, limits: List[Tuple[int, float]]) -> None:
+        """ヘッダーの制限に合わせる（同じ制限の予約表はそのまま使う）"""
+        self.learned = True
+        keys = set(limits)
+        if keys == set(self.windows):
+            return
+        self.windows = {
+            key: self.windows.get(key) or RateWindow(*key) for key in limits
+        }
+
+    def earliest(self, t: float) -> float:
+        t = max(t, self.blocked_until)
+        for window in self.windows.values():
+            t = window.earliest(t)
+        return t
+
+    def reserve(self, t: float, now: float) -> None:
+        for window in self.windows.values():
+            window.prune(now)
+            window.reserve(t)
+
+    def sync(self, counts: List[Tuple[int, float]], now: float) -> None:
+        for count, seconds in counts:
+            for (_, window_seconds), window in self.windows.items():
+                if window_seconds == seconds:
+                    window.sync(count, now)
+
+
+class RateLimiter:
+    """全スレッドで共有するRiot APIのレート制限
+
+    使い方:
+        limiter.acquire(host, method)      # 送信してよい時刻まで待つ
+        try:
+            response = requests.get(...)
+        except Exception:
+            limiter.release(host, method)  # 応答が無い場合
+            raise
+        limiter.update(host, method, response.status_code, response.headers)
+    """
+
+    def __init__(self, default_app_limits: Optional[str] = None):
+        if default_app_limits is None:
+            default_app_limits = os.environ.get(
+                "RIOT_APP_RATE_LIMIT", DEFAULT_APP_RATE_LIMIT
+            )
+        self.default_app_limits = parse_rate_limits(default_app_limits)
+        self._app: Dict[str, RateBucket] = {}
+        self._methods: Dict[Tuple[str, str], RateBucket] = {}
+        self._lock = threading.Condition()
+
+    def _buckets(self, host: str, method: str) -> Tuple[RateBucket, RateBucket]:
+        app = self._app.get(host)
+        if app is None:
+            app = self._app[host] = RateBucket(self.default_app_limits)
+        method_bucket = self._methods.get((host, method))
+        if method_bucket is None:
+            # エンドポイントの制限は最初のレスポンスで分かる
+            method_bucket = self._methods[(host, method)] = RateBucket()
+        return app, method_bucket
+
+    def reserve(self, host: str, method: str) -> float:
+        """送信時刻を予約し、その時刻（time.monotonic() 基準）を返す"""
+        with self._lock:
+            method_bucket = self._buckets(host, method)[1]
+            if not method_bucket.learned:
+                # 制限を調べるリクエストの応答を待つ（応答が無ければ自分で調べる）
+                deadline = time.monotonic() + PROBE_TIMEOUT
+                while method_bucket.probing and not method_bucket.learned:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._lock.wait(remaining)
+                if not method_bucket.learned:
+                    method_bucket.probing = True
+
+            now = time.monotonic()
+            buckets = self._buckets(host, method)
+            t = now
+            while True:
+                next_t = t
+                for bucket in buckets:
+                    next_t = bucket.earliest(next_t)
+                if next_t == t:
+                    break
+                t = next_t
+            for bucket in buckets:
+                bucket.reserve(t, now)
+            return t
+
+    def acquire(self, host: str, method: str) -> float:
+        """予約した送信時刻まで待つ（待った秒数を返す）"""
+        delay = self.reserve(host, method) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+            return delay
+        return 0.0
+
+    def release(self, host: str, method: str) -> None:
+        """応答を受け取れなかった（タイムアウト・接続エラー）場合に呼ぶ
+
+        制限を調べるリクエストが失敗したままだと、同じエンドポイントへの
+        リクエストが PROBE_TIMEOUT 待った後に一斉に送られるため、待っている
+        リクエストの1つに調べる役を渡す。
+        """
+        with self._lock:
+            method_bucket = self._buckets(host, method)[1]
+            if method_bucket.probing:
+                method_bucket.probing = False
+                self._lock.notify_all()
+
+    def update(
+        self, host: str, method: str, status_code: int, headers: Mapping[str, str]
+    ) -> Optional[float]:
+        """レスポンスヘッダーから制限を学習する
+
+        Returns:
+            429の場合に Retry-After で指定された待ち時間（秒）。指定が無ければNone
+        """
+        now = time.monotonic()
+        with self._lock:
+            app, method_bucket = self._buckets(host, method)
+            for bucket, prefix in ((app, "X-App"), (method_bucket, "X-Method")):
+                limits = parse_rate_limits(headers.get(f"{prefix}-Rate-Limit"))
+                if limits:
+                    bucket.set_limits(limits)
+                    # 件数が無くても、少なくともこのリクエストは数える
+                    # （制限が分かる前に送ったリクエストは予約表に入っていない）
+                    counts = parse_rate_limits(
+                        headers.get(f"{prefix}-Rate-Limit-Count")
+                    ) or [(1, seconds) for _, seconds in limits]
+                    bucket.sync(counts, now)
+            if method_bucket.probing:
+                # ヘッダーに制限が無かった場合は、待っている別のリクエストが調べる
+                method_bucket.probing = False
+                self._lock.notify_all()
+
+            if status_code != 429:
+                return None
+            retry_after = headers.get("Retry-After")
+            if retry_after is None:
+                return None
+            try:
+                seconds = float(retry_after)
+            except ValueError:
+                return None
+            # application: キー全体、method / service: このエンドポイントだけを止める
+            limit_type = (headers.get("X-Rate-Limit-Type") or "").lower()
+            bucket = app if limit_type == "application" else method_bucket
+            bucket.blocked_until = max(bucket.blocked_until, now + seconds)
+            return seconds
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api_key: str) -> RateLimiter:
+    """APIキーごとにプロセス内で共有する RateLimiter を返す"""
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(api_key)
+        if limiter is None:
+            limiter = _rate_limiters[api_key] = RateLimiter()
+        return limiter
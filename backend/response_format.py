@@ -0,0 +1,168 @@
+"""レスポンスのコンパクト形式と圧縮
+
+コンパクト形式（リクエストの "responseFormat": "compact"）:
+    - チームはサモナー全体ではなく {"id", "assignedRole"} のみを返す
+      （クライアントは送ったサモナー情報とIDで突き合わせる）
+    - アイコンなどのURLの共通部分を "urlPrefix" にまとめ、各URLからは取り除く
+
+圧縮:
+    クライアントの Accept-Encoding が gzip / deflate を許可していれば、
+    一定サイズ以上のボディを圧縮し、API Gatewayのバイナリレスポンス
+    （isBase64Encoded）として返す。
+"""
+
+import base64
+import os
+import zlib
+from typing import Any, Dict, List, Optional
+
+RESPONSE_FORMATS = ("full", "compact")
+
+# これより小さいボディは圧縮しない（バイト）
+DEFAULT_COMPRESSION_MIN_BYTES = 1024
+
+# 対応する圧縮方式（優先順）と zlib の wbits
+_ENCODING_WBITS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+def response_format(body: Dict) -> str:
+    """リクエストボディからレスポンス形式を取得"""
+    value = body.get("responseFormat", "full") if isinstance(body, dict) else "full"
+    if value not in RESPONSE_FORMATS:
+        raise ValueError(f"Unknown response format: {value}")
+    return value
+
+
+def compact_team(team: List[Any]) -> List[Dict]:
+    """チームをサモナーIDと割り当てロールだけにする"""
+    return [{"id": s.id, "assignedRole": s.assignedRole} for s in team]
+
+
+def compact_option(option: Any) -> Dict:
+    """BalanceOption / Lobby のチームをコンパクト形式にする"""
+    return {
+        "teamA": compact_team(option.teamA),
+        "teamB": compact_team(option.teamB),
+        "teamAStats": option.teamAStats,
+        "teamBStats": option.teamBStats,
+        "rankDiff": option.rankDiff,
+        "roleDiff": option.roleDiff,
+    }
+
+
+def compact_partition(result: Any) -> Dict:
+    """PartitionResult をコンパクト形式にする"""
+    return {
+        "lobbies": [compact_option(lobby) for lobby in result.lobbies],
+        "bench": [s.id for s in result.bench],
+        "objective": result.objective,
+        "iterations": result.iterations,
+        "starts": result.starts,
+        "elapsedSeconds": result.elapsedSeconds,
+    }
+
+
+def _collect_urls(data: Any, urls: List[str]) -> None:
+    if isinstance(data, str):
+        if data.startswith(("http://", "https://")):
+            urls.append(data)
+    elif isinstance(data, dict):
+        for value in data.values():
+            _collect_urls(value, urls)
+    elif isinstance(data, (list, tuple)):
+        for value in data:
+            _collect_urls(value, urls)
+
+
+def _strip_prefix(data: Any, prefix: str) -> Any:
+    if isinstance(data, str):
+        return data[len(prefix) :] if data.startswith(prefix) else data
+    if isinstance(data, dict):
+        return {key: _strip_prefix(value, prefix) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [_strip_prefix(value, prefix) for value in data]
+    return data
+
+
+def factor_url_prefix(data: Any) -> Dict:
+    """データ内のURLの共通部分（最後の "/" まで）を取り出す
+
+    Returns:
+        {"urlPrefix": 共通部分, "data": 共通部分を取り除いたデータ}。
+        URLが無い場合 urlPrefix は空文字列
+    """
+    urls: List[str] = []
+    _collect_urls(data, urls)
+    prefix = os.path.commonprefix(urls) if urls else ""
+    prefix = prefix[: prefix.rfind("/") + 1]
+    if not prefix:
+        return {"urlPrefix": "", "data": data}
+    return {"urlPrefix": prefix, "data": _strip_prefix(data, prefix)}
+
+
+def _header(headers: Optional[Dict], name: str) -> str:
+    """大文字小文字を区別せずにヘッダーを取得"""
+    for key, value in (headers or {}).items():
+        if key.lower() == name:
+            return value or ""
+    return ""
+
+
+def negotiate_encoding(headers: Optional[Dict]) -> Optional[str]:
+    """Accept-Encoding から使用する圧縮方式を決める（対応方式が無ければNone）"""
+    accepted: Dict[str, float] = {}
+    for item in _header(headers, "accept-encoding").split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    candidates = [
+        (accepted.get(encoding, accepted.get("*", 0.0)), -order, encoding)
+        for order, encoding in enumerate(_ENCODING_WBITS)
+    ]
+    quality, _, encoding = max(candidates)
+    return encoding if quality > 0 else None
+
+
+def compress_response(
+    response: Dict[str, Any],
+    request_headers: Optional[Dict],
+    min_bytes: Optional[int] = None,
+) -> Dict[str, Any]:
+    """クライアントが対応していればレスポンスボディを圧縮する
+
+    Args:
+        response: create_response で作成したレスポンス
+        request_headers: リクエストのヘッダー（API Gatewayイベントの "headers"）
+        min_bytes: 圧縮する最小サイズ（Noneの場合は環境変数
+            RESPONSE_COMPRESSION_MIN_BYTES、既定1024バイト）
+    """
+    encoding = negotiate_encoding(request_headers)
+    body = response.get("body")
+    if encoding is None or not isinstance(body, str) or response.get("isBase64Encoded"):
+        return response
+
+    if min_bytes is None:
+        min_bytes = int(
+            os.environ.get("RESPONSE_COMPRESSION_MIN_BYTES", DEFAULT_COMPRESSION_MIN_BYTES)
+        )
+    raw = body.encode("utf-8")
+    headers = {**response.get("headers", {}), "Vary": "Accept-Encoding"}
+    if len(raw) < min_bytes:
+        return {**response, "headers": headers}
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, _ENCODING_WBITS[encoding])
+    compressed = compressor.compress(raw) + compressor.flush()
+    headers["Content-Encoding"] = encoding
+    return {
+        **response,
+        "headers": headers,
+        "body": base64.b64encode(compressed).decode("ascii"),
+        "isBase64Encoded": True,
+    }
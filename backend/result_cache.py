@@ -0,0 +1,166 @@
+"""チーム分け結果のキャッシュ
+
+randomness=0、またはシードを指定したリクエストは結果が決まるため、
+正規化したリクエスト内容のハッシュ（フィンガープリント）をキーにレスポンスを保存する。
+
+- プロセス内: 件数上限付きのLRU（環境変数 BALANCE_CACHE_SIZE、0で無効）
+- 共有: 環境変数 BALANCE_CACHE_TABLE を設定した場合のみDynamoDBテーブル
+  （パーティションキー cache_key、TTL属性 ttl）
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# チーム分けのロジックを変えて結果が変わる場合は上げる
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_TTL_SECONDS = 24 * 3600
+
+
+class LRUCache:
+    """スレッドセーフな件数上限付きLRUキャッシュ"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class DynamoDBResultCache:
+    """DynamoDBテーブルを使う共有キャッシュ（失敗してもリクエストは止めない）"""
+
+    def __init__(self, table_name: str, ttl_seconds: int = DEFAULT_TTL_SECONDS):
+        from aws_resources import dynamodb_table
+
+        self.table = dynamodb_table(table_name)
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        """保存したレスポンスのJSON文字列（無い・期限切れの場合はNone）"""
+        try:
+            item = self.table.get_item(Key={"cache_key": key}).get("Item")
+        except Exception:
+            return None
+        if item is None or int(item["ttl"]) < time.time():
+            return None
+        return item["payload"]
+
+    def put(self, key: str, payload_json: str) -> None:
+        try:
+            self.table.put_item(
+                Item={
+                    "cache_key": key,
+                    "payload": payload_json,
+                    "ttl": int(time.time()) + self.ttl_seconds,
+                }
+            )
+        except Exception:
+            pass
+
+
+def fingerprint(
+    summoners: List[Any],
+    team_constraint_groups: Optional[List[Dict]],
+    options: Dict[str, Any],
+) -> str:
+    """正規化したリクエスト内容のハッシュ
+
+    Args:
+        summoners: 正規化済みのSummonerモデル（並び順も結果に影響するため保持する）
+        team_constraint_groups: チーム制約グループ
+        options: 結果に影響するその他の値（autoAssignRoles, randomness, seed など）
+    """
+    canonical = json.dumps(
+        {
+            "version": CACHE_VERSION,
+            "summoners": [s.model_dump() for s in summoners],
+            "groups": team_constraint_groups or [],
+            "options": options,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """プロセス内LRUと任意のDynamoDBを組み合わせたキャッシュ"""
+
+    def __init__(self, maxsize: int, shared: Optional[DynamoDBResultCache] = None):
+        self.local = LRUCache(maxsize)
+        self.shared = shared
+
+    def get(self, key: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """(レスポンス, ヒットした層 "memory" / "dynamodb") を返す
+
+        どちらの層もJSON文字列で保存し、読み込むたびに新しい辞書に変換するため、
+        呼び出し側が返した値を変更してもキャッシュには影響しない。
+        """
+        payload_json = self.local.get(key)
+        if payload_json is not None:
+            return json.loads(payload_json), "memory"
+        if self.shared is not None:
+            payload_json = self.shared.get(key)
+            if payload_json is not None:
+                self.local.put(key, payload_json)
+                return json.loads(payload_json), "dynamodb"
+        return None, None
+
+    def put(self, key: str, payload: Dict) -> None:
+        """レスポンスをJSONに変換して保存（変換は1回で、両方の層で使う）"""
+        import json_encoder
+
+        payload_json = json_encoder.dumps(payload)
+        self.local.put(key, payload_json)
+        if self.shared is not None:
+            self.shared.put(key, payload_json)
+
+
+_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> ResultCache:
+    """環境変数の設定に従ってプロセス共通のキャッシュを返す"""
+    global _cache
+    if _cache is None:
+        table_name = os.environ.get("BALANCE_CACHE_TABLE")
+        shared = None
+        if table_name:
+            shared = DynamoDBResultCache(
+                table_name,
+                int(os.environ.get("BALANCE_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+            )
+        _cache = ResultCache(
+            int(os.environ.get("BALANCE_CACHE_SIZE", DEFAULT_CACHE_SIZE)), shared
+        )
+    return _cache
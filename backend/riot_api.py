@@ -1,82 +1,230 @@
 import json
 import os
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
 
-import boto3
+import http_session
+import metrics
 import requests
+from aws_resources import batch_get_items, dynamodb_table
 from ddragon import ChampionIconGenerator
+from fetch_pipeline import DEFAULT_CONCURRENCY, SummonerFetchPipeline
+from logger import log
+from match_cache import MatchCache, MatchParticipants, project_match
+from rate_limiter import get_rate_limiter
+
+# DDragonのバージョンを確認し直す間隔（秒）
+DEFAULT_DDRAGON_REFRESH_INTERVAL = 3600.0
+
+# レート制限の対象（DDragonは対象外）
+RIOT_API_DOMAIN = ".api.riotgames.com"
+
+# ロールとチャンピオンの集計に使うマッチ数
+MATCH_COUNT = 10
+
+# 有効期限を過ぎたキャッシュを差分更新に使える期間（時間）
+DEFAULT_STALE_HOURS = 24
+# 差分更新でサモナー情報を取得し直す間隔（日）。アイコンとレベルはあまり変わらない
+DEFAULT_SUMMONER_INFO_MAX_AGE_DAYS = 7
+
+# 期限切れのキャッシュを裏で更新するスレッド数
+REFRESH_WORKERS = 2
+
+# ホストごとの接続プールの大きさ（同時リクエスト数の上限に合わせる）
+HTTP_POOL_SIZE = DEFAULT_CONCURRENCY
 
 
 class RiotAPI:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, ddragon_refresh_interval: Optional[float] = None):
         self.api_key = api_key
         self.headers = {"X-Riot-Token": self.api_key}
+        # レート制限はAPIキー単位のため、同じキーの RiotAPI とスレッドで共有する
+        self.rate_limiter = get_rate_limiter(api_key)
         self.region = "jp1"
         self.routing = "asia"
+        self.match_count = MATCH_COUNT
 
-        # DynamoDBクライアントの初期化
-        self.dynamodb = boto3.resource("dynamodb")
-        self.cache_table = self.dynamodb.Table(
+        # DynamoDBテーブル（ウォームコンテナでは作成済みのものを使う）
+        self.cache_table = dynamodb_table(
             os.environ.get("DYNAMODB_CACHE_TABLE", "riot-api-cache")
         )
         self.cache_duration = timedelta(hours=24 * 3)  # キャッシュの有効期限
+        # 有効期限を過ぎてもこの期間はキャッシュを残し、差分だけ更新する
+        # （SUMMONER_CACHE_SWR が有効ならその間は期限切れのデータを返す）
+        self.stale_duration = timedelta(
+            hours=float(
+                os.environ.get("SUMMONER_CACHE_STALE_HOURS", DEFAULT_STALE_HOURS)
+            )
+        )
+        # 差分更新でサモナー情報（アイコン・レベル）を取得し直す間隔
+        self.summoner_info_max_age = timedelta(
+            days=float(
+                os.environ.get(
+                    "SUMMONER_INFO_MAX_AGE_DAYS", DEFAULT_SUMMONER_INFO_MAX_AGE_DAYS
+                )
+            )
+        )
+        # マッチ詳細は変わらないため、サモナーとは別に長期間キャッシュする
+        self.match_cache = MatchCache(self.cache_table)
 
+        if ddragon_refresh_interval is None:
+            ddragon_refresh_interval = float(
+                os.environ.get(
+                    "DDRAGON_REFRESH_INTERVAL", DEFAULT_DDRAGON_REFRESH_INTERVAL
+                )
+            )
+        self.ddragon_refresh_interval = ddragon_refresh_interval
+        self._ddragon_lock = threading.Lock()
         self.ddragon_version = self.get_ddragon_version()
-        self.ddragon = ChampionIconGenerator()
+        self.ddragon = ChampionIconGenerator(self.ddragon_version)
+        self._ddragon_checked_at = time.monotonic()
 
     def _get_cache_key(self, summoner_name: str) -> str:
         """サモナー名からキャッシュキーを生成"""
         return f"summoner:{summoner_name}"
 
-    def _read_cache(self, summoner_name: str) -> Optional[Dict]:
-        """DynamoDBからキャッシュを読み込む"""
-        try:
-            response = self.cache_table.get_item(
-                Key={"cache_key": self._get_cache_key(summoner_name)}
-            )
-
-            if "Item" not in response:
-                return None
-
-            cached_data = response["Item"]
-            cached_time = datetime.fromisoformat(cached_data["cached_at"])
+    def _cache_item(
+        self, summoner_name: str, data: Dict, refresh_state: Optional[Dict] = None
+    ) -> Dict:
+        """キャッシュのアイテムを作成
+
+        refresh_state は差分更新に使う値（PUUIDと集計に使ったマッチの記録）。
+        期限切れのアイテムも stale_duration の間は使うため、TTLはその分長くする。
+        """
+        item = {
+            "cache_key": self._get_cache_key(summoner_name),
+            "data": json.dumps(data),
+            "cached_at": datetime.now().isoformat(),
+            "ttl": int(
+                (datetime.now() + self.cache_duration + self.stale_duration).timestamp()
+            ),
+        }
+        if refresh_state is not None:
+            item["refresh_state"] = json.dumps(refresh_state)
+        return item
+
+    def _parse_cache_entry(self, cached_data: Dict) -> Optional[Dict]:
+        """キャッシュのアイテムを期限切れのものも含めて取り出す
+
+        Returns:
+            {"data", "refresh_state", "expired"}。stale_duration も過ぎていればNone
+        """
+        age = datetime.now() - datetime.fromisoformat(cached_data["cached_at"])
+        if age > self.cache_duration + self.stale_duration:
+            return None
+        refresh_state = cached_data.get("refresh_state")
+        return {
+            "data": json.loads(cached_data["data"]),
+            "refresh_state": json.loads(refresh_state) if refresh_state else None,
+            "expired": age > self.cache_duration,
+        }
 
-            # キャッシュの有効期限をチェック
-            if datetime.now() - cached_time > self.cache_duration:
-                return None
+    def _read_cache_batch(self, summoner_names: List[str]) -> Dict[str, Dict]:
+        """複数サモナーのキャッシュを batch_get_item でまとめて読み込む
 
-            return json.loads(cached_data["data"])
+        Returns:
+            サモナー名 -> {"data", "refresh_state", "expired"}
+            （キャッシュが無いサモナーは含まない。_parse_cache_entry を参照）
+        """
+        key_to_name = {self._get_cache_key(name): name for name in summoner_names}
+        found: Dict[str, Dict] = {}
+        try:
+            with metrics.timer("dynamodb_cache_read"):
+                items = batch_get_items(self.cache_table.name, list(key_to_name))
+            for item in items:
+                entry = self._parse_cache_entry(item)
+                if entry is not None:
+                    found[key_to_name[item["cache_key"]]] = entry
         except Exception as e:
-            print(f"キャッシュの読み込みに失敗: {e}")
-            return None
-
-    def _write_cache(self, summoner_name: str, data: Dict) -> None:
-        """DynamoDBにキャッシュを書き込む"""
+            log.warning("キャッシュの読み込みに失敗: %s", e)
+        return found
+
+    def _write_cache_batch(
+        self,
+        entries: Dict[str, Dict],
+        refresh_states: Optional[Dict[str, Dict]] = None,
+    ) -> None:
+        """複数サモナーのキャッシュを batch_writer でまとめて書き込む
+
+        batch_writer は25件ごとに BatchWriteItem を送り、未処理のアイテムを再送する。
+
+        Args:
+            entries: サモナー名 -> データ
+            refresh_states: サモナー名 -> 差分更新に使う値
+        """
+        if not entries:
+            return
+        refresh_states = refresh_states or {}
         try:
-            cache_item = {
-                "cache_key": self._get_cache_key(summoner_name),
-                "data": json.dumps(data),
-                "cached_at": datetime.now().isoformat(),
-                "ttl": int((datetime.now() + self.cache_duration).timestamp()),
-            }
-            self.cache_table.put_item(Item=cache_item)
+            with metrics.timer("dynamodb_cache_write"):
+                with self.cache_table.batch_writer(
+                    overwrite_by_pkeys=["cache_key"]
+                ) as batch:
+                    for summoner_name, data in entries.items():
+                        batch.put_item(
+                            Item=self._cache_item(
+                                summoner_name, data, refresh_states.get(summoner_name)
+                            )
+                        )
         except Exception as e:
-            print(f"キャッシュの書き込みに失敗: {e}")
+            log.warning("キャッシュの書き込みに失敗: %s", e)
 
     def request(
-        self, url: str, headers: Dict, params: Dict = {}, retry: int = 0
+        self,
+        url: str,
+        headers: Dict,
+        params: Dict = {},
+        retry: int = 0,
+        endpoint: str = "other",
     ) -> requests.Response:
-        """レート制限対応のリクエストラッパー"""
+        """レート制限対応のリクエストラッパー
+
+        Riot APIへのリクエストは全スレッド共有の rate_limiter で送信時刻を予約し、
+        その時刻まで待ってから送る。429の場合は Retry-After の秒数
+        （指定が無ければ 2**retry 秒）待ってから再送する。
+        endpoint はエンドポイントごとの制限の区別とメトリクス名（riot_<endpoint>）に使う。
+        """
+        host = urlsplit(url).hostname or ""
+        rate_limited = host.endswith(RIOT_API_DOMAIN)
         try:
-            response = requests.get(url, headers=headers, params=params, timeout=5)
-            if response.status_code == 429:
+            while True:
+                if rate_limited:
+                    with metrics.timer("riot_rate_limit_wait"):
+                        self.rate_limiter.acquire(host, endpoint)
+                try:
+                    with metrics.timer(f"riot_{endpoint}"):
+                        response = http_session.get(
+                            url,
+                            headers=headers,
+                            params=params,
+                            pool_size=HTTP_POOL_SIZE,
+                        )
+                except Exception:
+                    if rate_limited:
+                        # 応答が無く update() を呼べないため、待っているリクエストを起こす
+                        self.rate_limiter.release(host, endpoint)
+                    raise
+                metrics.increment(f"riot_{endpoint}_requests")
+                retry_after = None
+                if rate_limited:
+                    retry_after = self.rate_limiter.update(
+                        host, endpoint, response.status_code, response.headers
+                    )
+                if response.status_code != 429:
+                    break
                 if retry >= 3:  # 最大リトライ回数
                     raise Exception("Rate limit exceeded after maximum retries")
-                time.sleep(1 * 2**retry)
-                return self.request(url, headers, params, retry + 1)
+                metrics.increment("riot_429_retries")
+                if retry_after is None:
+                    # Retry-After が無い429（サービス側の制限）は指数バックオフ
+                    with metrics.timer("riot_backoff"):
+                        time.sleep(1 * 2**retry)
+                # Retry-After がある場合は rate_limiter が次の予約をその時刻以降にする
+                retry += 1
             response.raise_for_status()
             return response
         except requests.exceptions.Timeout:
@@ -87,36 +235,61 @@ class RiotAPI:
     def get_ddragon_version(self) -> str:
         """DDragonのバージョンを取得"""
         url = "https://ddragon.leagueoflegends.com/api/versions.json"
-        response = self.request(url, headers={})
+        response = self.request(url, headers={}, endpoint="ddragon_versions")
         return response.json()[0]
 
+    def refresh_ddragon(self, force: bool = False) -> None:
+        """前回の確認から refresh_interval 経過していればDDragonのバージョンを確認し、
+        新しいバージョンが出ていればチャンピオンデータを読み直す"""
+        with self._ddragon_lock:
+            elapsed = time.monotonic() - self._ddragon_checked_at
+            if not force and elapsed < self.ddragon_refresh_interval:
+                return
+            try:
+                version = self.get_ddragon_version()
+                if version != self.ddragon_version:
+                    self.ddragon = ChampionIconGenerator(version)
+                    self.ddragon_version = version
+            except Exception as e:
+                # 取得に失敗した場合は現在のバージョンを使い続ける
+                log.warning("DDragonのバージョン確認に失敗: %s", e)
+            self._ddragon_checked_at = time.monotonic()
+
     def get_account(self, summoner_name: str, tagline: str) -> Dict:
         """サモナー名とタグラインからアカウント情報を取得"""
         url = f"https://{self.routing}.api.riotgames.com/riot/account/v1/accounts/by-riot-id/{summoner_name}/{tagline}"
-        response = self.request(url, headers=self.headers)
+        response = self.request(url, headers=self.headers, endpoint="account")
         return response.json()
 
     def get_summoner_info(self, puuid: str) -> Dict:
         """PUUIDからサモナー情報を取得"""
         url = f"https://{self.region}.api.riotgames.com/lol/summoner/v4/summoners/by-puuid/{puuid}"
-        response = self.request(url, headers=self.headers)
+        response = self.request(url, headers=self.headers, endpoint="summoner")
         return response.json()
 
     def get_rank_info(self, puuid: str) -> List[Dict]:
         """PUUIDからランク情報を取得"""
         url = f"https://{self.region}.api.riotgames.com/lol/league/v4/entries/by-puuid/{puuid}"
-        response = self.request(url, headers=self.headers)
+        response = self.request(url, headers=self.headers, endpoint="league")
         return response.json()
 
     def get_match_history(
-        self, puuid: str, count: int = 20, match_type: Optional[str] = None
+        self,
+        puuid: str,
+        count: int = 20,
+        match_type: Optional[str] = None,
+        start_time: Optional[int] = None,
     ) -> List[str]:
-        """マッチ履歴を取得"""
+        """マッチ履歴を取得（start_time を指定するとそれ以降に始まったマッチのみ）"""
         url = f"https://{self.routing}.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids"
         params: Dict = {"count": count}
         if match_type:
             params["type"] = str(match_type)
-        response = self.request(url, headers=self.headers, params=params)
+        if start_time is not None:
+            params["startTime"] = int(start_time)
+        response = self.request(
+            url, headers=self.headers, params=params, endpoint="match_ids"
+        )
         return response.json()
 
     def get_match_detail(self, match_id: str) -> Dict:
@@ -124,23 +297,32 @@ class RiotAPI:
         url = (
             f"https://{self.routing}.api.riotgames.com/lol/match/v5/matches/{match_id}"
         )
-        response = self.request(url, headers=self.headers)
+        response = self.request(url, headers=self.headers, endpoint="match")
         return response.json()
 
-    def get_player_match_detail(self, match_id: str, puuid: str) -> Optional[Dict]:
-        """特定プレイヤーのマッチ詳細を取得"""
+    def get_match_participants(self, match_id: str) -> Optional[MatchParticipants]:
+        """マッチの全参加者のチャンピオンとポジションを取得（キャッシュ優先）"""
+        participants = self.match_cache.get(match_id)
+        if participants is not None:
+            return participants
+        return self.fetch_match_participants(match_id)
+
+    def fetch_match_participants(self, match_id: str) -> Optional[MatchParticipants]:
+        """Riot APIからマッチの参加者を取得してキャッシュに保存（キャッシュは読まない）"""
         try:
-            match_detail = self.get_match_detail(match_id)
-            for participant in match_detail["info"]["participants"]:
-                if participant["puuid"] == puuid:
-                    return {
-                        "champion_id": participant["championId"],
-                        "champion": participant["championName"],
-                        "role": participant["teamPosition"],
-                    }
+            participants = project_match(self.get_match_detail(match_id))
         except Exception as e:
-            print(f"Error processing match {match_id}: {e}")
-        return None
+            log.warning("Error processing match %s: %s", match_id, e)
+            return None
+        self.match_cache.put(match_id, participants)
+        return participants
+
+    def get_player_match_detail(self, match_id: str, puuid: str) -> Optional[Dict]:
+        """特定プレイヤーのマッチ詳細を取得"""
+        participants = self.get_match_participants(match_id)
+        if participants is None:
+            return None
+        return participants.get(puuid)
 
     def calculate_role_proficiency(
         self, champ_roles: List[Dict]
@@ -167,109 +349,114 @@ class RiotAPI:
 
         return role_proficiency, top_champs
 
+    def build_summoner_data(
+        self,
+        summoner_name: str,
+        raw_summoner_info: Dict,
+        raw_rank_info: List[Dict],
+        match_results: List[Optional[Dict]],
+    ) -> Dict:
+        """取得したAPIのレスポンスからサモナーの総合データを作成"""
+        # プロフィールアイコン情報
+        icon_num = raw_summoner_info["profileIconId"]
+        summoner_info = {
+            "name": summoner_name,
+            "icon": f"https://ddragon.leagueoflegends.com/cdn/{self.ddragon_version}/img/profileicon/{icon_num}.png",
+            "level": raw_summoner_info["summonerLevel"],
+        }
+
+        rank_info = {"SOLO": "UNRANKED", "FLEX": "UNRANKED"}
+        for rank_data in raw_rank_info:
+            if rank_data["queueType"] == "RANKED_SOLO_5x5":
+                rank_info["SOLO"] = rank_data["tier"] + " " + rank_data["rank"]
+            elif rank_data["queueType"] == "RANKED_FLEX_SR":
+                rank_info["FLEX"] = rank_data["tier"] + " " + rank_data["rank"]
+
+        # 役割の使用率とチャンピオンの使用率を計算
+        results = list(filter(None, match_results))
+        metrics.increment("matches_fetched", len(results))
+        role_proficiency, top_champs = self.calculate_role_proficiency(results)
+
+        return {
+            "summoner_info": summoner_info,
+            "rank_info": rank_info,
+            "role_proficiency": role_proficiency,
+            "top3_champs": top_champs,
+        }
+
     def get_summoner_data(self, summoner_name: str) -> Dict:
-        """サモナーの総合データを取得"""
-        try:
-            # キャッシュをチェック
-            cached_data = self._read_cache(summoner_name)
-            if cached_data:
-                print(f"Cache hit for: {summoner_name}")
-                return cached_data
-
-            # サモナー名とタグラインを分割
-            sn, tagline = summoner_name.split("#")
-            print("sn:", sn, "tagline:", tagline)
-
-            # アカウント情報を取得
-            account_info = self.get_account(sn, tagline)
-            print("account_info:", account_info)
-            puuid = account_info["puuid"]
-
-            # サモナー情報を取得
-            raw_summoner_info = self.get_summoner_info(puuid)
-            print("raw_summoner_info:", raw_summoner_info)
-
-            # プロフィールアイコン情報
-            icon_num = raw_summoner_info["profileIconId"]
-            summoner_info = {
-                "name": summoner_name,
-                "icon": f"https://ddragon.leagueoflegends.com/cdn/{self.ddragon_version}/img/profileicon/{icon_num}.png",
-                "level": raw_summoner_info["summonerLevel"],
-            }
-
-            # ランク情報を取得（PUUIDを使用）
-            raw_rank_info = self.get_rank_info(puuid)
-            rank_info = {"SOLO": "UNRANKED", "FLEX": "UNRANKED"}
-            for rank_data in raw_rank_info:
-                if rank_data["queueType"] == "RANKED_SOLO_5x5":
-                    rank_info["SOLO"] = rank_data["tier"] + " " + rank_data["rank"]
-                elif rank_data["queueType"] == "RANKED_FLEX_SR":
-                    rank_info["FLEX"] = rank_data["tier"] + " " + rank_data["rank"]
-
-            # マッチヒストリーを取得
-            match_count = 10
-            match_history = self.get_match_history(
-                puuid, match_type="ranked", count=match_count
-            )
-            if len(match_history) < match_count:
-                match_history = self.get_match_history(puuid, count=match_count)
-
-            # マッチ詳細を並列で取得
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                results = list(
-                    executor.map(
-                        lambda match_id: self.get_player_match_detail(match_id, puuid),
-                        match_history,
-                    )
-                )
+        """サモナーの総合データを取得（取得できなければ {}）"""
+        pipeline = SummonerFetchPipeline(self)
+        data = pipeline.run([summoner_name])[0]
+        schedule_refresh(self, pipeline.stale)
+        return data
 
-            # 役割の使用率とチャンピオンの使用率を計算
-            results = list(filter(None, results))
-            role_proficiency, top_champs = self.calculate_role_proficiency(results)
 
-            data = {
-                "summoner_info": summoner_info,
-                "rank_info": rank_info,
-                "role_proficiency": role_proficiency,
-                "top3_champs": top_champs,
-            }
+_refresh_executor = ThreadPoolExecutor(
+    max_workers=REFRESH_WORKERS, thread_name_prefix="summoner-refresh"
+)
+# 更新中のサモナー名（同じサモナーの更新を重ねない）
+_refreshing: set = set()
+_refreshing_lock = threading.Lock()
 
-            # キャッシュに保存
-            self._write_cache(summoner_name, data)
-            return data
 
-        except Exception:
-            import traceback
-            print(f"Error fetching data for {summoner_name}: {traceback.format_exc()}")
-            return {}
+def schedule_refresh(riot_api: RiotAPI, entries: Dict[str, Dict]) -> Optional[Future]:
+    """期限切れのまま返したサモナーのキャッシュを裏で更新する
+
+    Lambdaではレスポンスを返すとコンテナが停止して裏の更新が進まないため、
+    既定では期限切れのデータを返さずにその場で更新する（stale は空になる）。
+
+    Args:
+        entries: サモナー名 -> _read_cache_batch の値（SummonerFetchPipeline.stale）
+    """
+    with _refreshing_lock:
+        entries = {
+            name: entry for name, entry in entries.items() if name not in _refreshing
+        }
+        _refreshing.update(entries)
+    if not entries:
+        return None
+    return _refresh_executor.submit(_refresh_summoners, riot_api, entries)
+
+
+def _refresh_summoners(riot_api: RiotAPI, entries: Dict[str, Dict]) -> None:
+    try:
+        refreshed = SummonerFetchPipeline(riot_api).revalidate(entries)
+        log.info("Refreshed %d/%d stale summoners", len(refreshed), len(entries))
+    except Exception:
+        log.exception("Error refreshing stale summoners")
+    finally:
+        with _refreshing_lock:
+            _refreshing.difference_update(entries)
+
+
+_riot_apis: Dict[str, RiotAPI] = {}
+_riot_apis_lock = threading.Lock()
+
+
+def get_riot_api(api_key: str) -> RiotAPI:
+    """ウォームコンテナで使い回す RiotAPI を返す（APIキーごとに1つ）
+
+    2回目以降はDDragonのバージョン確認を refresh_interval ごとにしか行わないため、
+    準備のためのネットワーク呼び出しは発生しない。
+    """
+    with _riot_apis_lock:
+        riot_api = _riot_apis.get(api_key)
+        if riot_api is None:
+            riot_api = _riot_apis[api_key] = RiotAPI(api_key)
+            return riot_api
+    riot_api.refresh_ddragon()
+    return riot_api
 
 
 def get_summoners_data(summoner_names: List[str]) -> List[Dict]:
-    """複数のサモナーのデータを取得"""
+    """複数のサモナーのデータを取得（取得できたサモナーのみ、summoner_names の順）"""
     api_key = os.environ.get("RIOT_API_KEY")
     if not api_key:
         raise ValueError("RIOT_API_KEY environment variable is not set")
 
-    riot_api = RiotAPI(api_key)
-    summoners_data = []
-
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        future_to_name = {
-            executor.submit(riot_api.get_summoner_data, name): name
-            for name in summoner_names
-        }
-
-        for future in future_to_name:
-            name = future_to_name[future]
-            print(f"Fetching data for: {name}")
-            try:
-                result = future.result()
-                if result:
-                    print(f"Successfully fetched data for: {name}")
-                    summoners_data.append(result)
-                else:
-                    print(f"No data found for: {name}")
-            except Exception as e:
-                print(f"Error fetching data for {name}: {str(e)}")
-
-    return summoners_data
+    riot_api = get_riot_api(api_key)
+    pipeline = SummonerFetchPipeline(riot_api)
+    results = pipeline.run(summoner_names)
+    schedule_refresh(riot_api, pipeline.stale)
+    return [data for data in results if data]
@@ -0,0 +1,157 @@
+"""スコア計算用のコンパクトなロスター表現
+
+pydanticのSummonerモデルはAPIの入出力だけに使い、チーム分け・ロール割り当て・
+統計計算はリクエストごとに1回だけ作る配列（ランクスコア、ロール習熟度、
+希望ロールボーナス）の上で行う。
+"""
+
+from typing import Dict, Sequence
+
+import numpy as np
+
+ROLES = ["TOP", "JUNGLE", "MID", "BOT", "SUPPORT"]
+
+RANK_VALUES = {
+    "IRON": 0,
+    "BRONZE": 4,
+    "SILVER": 8,
+    "GOLD": 12,
+    "PLATINUM": 16,
+    "EMERALD": 20,
+    "DIAMOND": 24,
+    "MASTER": 28,
+    "GRANDMASTER": 30,
+    "CHALLENGER": 31,
+}
+
+# 希望ロールのボーナスと、希望ロール以外に割り当てた場合のペナルティ
+PREFERRED_ROLE_BONUS = 10
+UNPREFERRED_ROLE_PENALTY = -5
+
+
+def _parse_rank_score(rank: str) -> float:
+    """ランク文字列を数値スコアに変換"""
+    if rank == "UNRANKED":
+        return 0
+
+    tier = rank.split(" ")[0]
+    division = rank.split(" ")[1] if " " in rank else "0"
+    division = (
+        division.replace("IV", "4")
+        .replace("III", "3")
+        .replace("II", "2")
+        .replace("I", "1")
+    )
+
+    base_score = RANK_VALUES.get(tier, 0)
+    if division.isdigit():
+        division_score = 4 - int(division)
+        return base_score + division_score
+    return base_score
+
+
+# ランク文字列→スコアの変換表。全ティア・ディビジョンを事前に登録する
+# （クライアントが送る任意の表記で大きくならないよう、以後は追加しない）
+_RANK_SCORE_TABLE: Dict[str, float] = {
+    rank: _parse_rank_score(rank)
+    for rank in ["UNRANKED"]
+    + [
+        f"{tier} {division}"
+        for tier in RANK_VALUES
+        for division in ("I", "II", "III", "IV")
+    ]
+    + list(RANK_VALUES)
+}
+
+
+def rank_score(rank: str) -> float:
+    """ランク文字列を数値スコアに変換（変換表に無い表記はその都度計算する）"""
+    score = _RANK_SCORE_TABLE.get(rank)
+    if score is None:
+        return _parse_rank_score(rank)
+    return score
+
+
+class CompactRoster:
+    """サモナーのスコアを配列で保持するロスター
+
+    Attributes:
+        rank_scores: ランクスコア（n,）
+        proficiency: ロール習熟度（n, 5）。列は ROLES の順
+        preference: 希望ロールボーナス（n, 5）
+    """
+
+    __slots__ = ("summoners", "rank_scores", "proficiency", "preference", "_rows")
+
+    def __init__(
+        self,
+        summoners: Sequence,
+        rank_scores: np.ndarray,
+        proficiency: np.ndarray,
+        preference: np.ndarray,
+    ):
+        self.summoners = list(summoners)
+        self.rank_scores = rank_scores
+        self.proficiency = proficiency
+        self.preference = preference
+        # Summonerオブジェクト→行番号（IDの重複があっても区別できるよう同一性で引く）
+        self._rows = {id(s): i for i, s in enumerate(self.summoners)}
+
+    @classmethod
+    def from_summoners(cls, summoners: Sequence) -> "CompactRoster":
+        """Summonerモデルのリストから作成"""
+        n = len(summoners)
+        rank_scores = np.empty(n)
+        proficiency = np.empty((n, len(ROLES)))
+        preference = np.zeros((n, len(ROLES)))
+        for i, s in enumerate(summoners):
+            rank_scores[i] = rank_score(s.rank.combined)
+            role_proficiency = s.roleProficiency
+            proficiency[i] = [getattr(role_proficiency, role) for role in ROLES]
+            if s.preferredRoles:
+                preference[i] = [
+                    PREFERRED_ROLE_BONUS
+                    if role in s.preferredRoles
+                    else UNPREFERRED_ROLE_PENALTY
+                    for role in ROLES
+                ]
+        return cls(summoners, rank_scores, proficiency, preference)
+
+    def __len__(self) -> int:
+        return len(self.summoners)
+
+    @property
+    def role_totals(self) -> np.ndarray:
+        """プレイヤーごとのロール習熟度の合計（n,）"""
+        return self.proficiency.sum(axis=1)
+
+    @property
+    def assignment_scores(self) -> np.ndarray:
+        """プレイヤーとロールの組み合わせのスコア（n, 5）"""
+        return self.proficiency + self.preference
+
+    def take(self, indices: Sequence[int]) -> "CompactRoster":
+        """行番号で部分ロスターを作成"""
+        indices = list(indices)
+        return CompactRoster(
+            [self.summoners[i] for i in indices],
+            self.rank_scores[indices],
+            self.proficiency[indices],
+            self.preference[indices],
+        )
+
+    def rebind(self, summoners: Sequence) -> "CompactRoster":
+        """同じ並びの別オブジェクト（複製など）に配列を共有したまま付け替える"""
+        return CompactRoster(
+            summoners, self.rank_scores, self.proficiency, self.preference
+        )
+
+    def subset(self, members: Sequence) -> "CompactRoster":
+        """Summonerオブジェクトのリストに対応する部分ロスターを作成
+
+        ロスターに含まれないオブジェクトがある場合は、members から作り直す。
+        """
+        rows = [self._rows.get(id(s)) for s in members]
+        if None in rows:
+            return CompactRoster.from_summoners(members)
+        return self.take(rows)
@@ -0,0 +1,365 @@
+"""チーム分け・ロール割り当てのソルバーレジストリ
+
+同じ問題を複数のバックエンド（全探索エンジン、CBC、HiGHS）で解けるようにし、
+呼び出しごとの制限時間内で、利用できない・時間切れのバックエンドを飛ばして
+次のバックエンドにフォールバックする。
+"""
+
+import os
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+
+import balance_engine
+from team_constraints import ConstraintPlan
+
+# PuLPはimportに時間がかかるため、線形計画法のバックエンドを使う時に読み込む
+if TYPE_CHECKING:
+    import pulp
+
+# 既定のフォールバック順と制限時間（秒）。環境変数で上書きできる
+DEFAULT_SOLVER_CHAIN = ("exact", "cbc", "highs")
+DEFAULT_TIME_LIMIT = 5.0
+
+# 以前のバックエンド名との互換
+SOLVER_ALIASES = {"pulp": "cbc"}
+
+# 1ms未満で終わるため、制限時間を使い切った後でも最後の手段として実行するバックエンド
+INSTANT_SOLVERS = ("exact",)
+
+
+class SolverError(Exception):
+    """バックエンドが問題を解けなかった場合のエラー"""
+
+
+class SolverUnavailableError(SolverError):
+    """バックエンドがこの環境で利用できない場合のエラー"""
+
+
+class SolverTimeoutError(SolverError):
+    """バックエンドが制限時間内に最適解を得られなかった場合のエラー"""
+
+
+class SplitProblem:
+    """チーム分け問題（ノイズ適用済みのスコアと制約）"""
+
+    def __init__(
+        self,
+        rank_scores: np.ndarray,
+        role_scores: np.ndarray,
+        assignment_noise: np.ndarray,
+        plan: ConstraintPlan,
+        rank_limit: float,
+        role_limit: float,
+    ):
+        self.rank_scores = rank_scores
+        self.role_scores = role_scores
+        self.assignment_noise = assignment_noise
+        self.plan = plan
+        self.rank_limit = rank_limit
+        self.role_limit = role_limit
+
+
+def _lp_solver(name: str, time_limit: float) -> "pulp.LpSolver":
+    """PuLPのソルバーを作成（利用できない場合は SolverUnavailableError）"""
+    import pulp
+
+    if name == "cbc":
+        solver = pulp.PULP_CBC_CMD(msg=0, timeLimit=time_limit)
+    else:
+        # highspyがあればAPI経由、無ければhighsコマンドを使う
+        solver = pulp.HiGHS(msg=False, timeLimit=time_limit)
+        if not solver.available():
+            solver = pulp.HiGHS_CMD(msg=False, timeLimit=time_limit)
+
+    if not solver.available():
+        raise SolverUnavailableError(f"{name} is not available")
+    return solver
+
+
+def _check_lp_status(prob: "pulp.LpProblem") -> None:
+    """最適解が得られたかを確認"""
+    import pulp
+
+    if prob.sol_status == pulp.LpSolutionOptimal:
+        return
+    if prob.status == pulp.LpStatusInfeasible:
+        raise SolverError("problem is infeasible")
+    if prob.sol_status in (pulp.LpSolutionIntegerFeasible, pulp.LpSolutionNoSolutionFound):
+        raise SolverTimeoutError("time limit reached before an optimal solution")
+    raise SolverError(f"solver status: {pulp.LpStatus[prob.status]}")
+
+
+def _solve_split_exact(problem: SplitProblem, time_limit: float) -> List[bool]:
+    """全探索エンジンでチーム分けを解く（1ms未満で終わるため中断はしない）"""
+    rank_diff, role_diff, objective = balance_engine.score_splits(
+        np.asarray(problem.rank_scores, dtype=float),
+        np.asarray(problem.role_scores, dtype=float),
+        np.asarray(problem.assignment_noise, dtype=float),
+    )
+    candidates = balance_engine.candidate_mask(
+        rank_diff,
+        role_diff,
+        balance_engine.feasible_mask(problem.plan.components),
+        problem.rank_limit,
+        problem.role_limit,
+    )
+    split_id = balance_engine.rank_splits(objective, candidates, 1)[0]
+    return balance_engine.SPLIT_MASKS[split_id].tolist()
+
+
+def _solve_split_lp(
+    problem: SplitProblem, solver: "pulp.LpSolver", with_limits: bool = True
+) -> List[bool]:
+    """線形計画法でチーム分けを解く
+
+    ランク差・ロール差の上限を満たす分け方が無い場合は、全探索エンジンと同様に
+    上限を外して解き直す。
+    """
+    import pulp
+
+    # PuLPの式にはNumPyのスカラーではなくPythonのfloatを渡す
+    rank_scores = np.asarray(problem.rank_scores, dtype=float).tolist()
+    role_scores = np.asarray(problem.role_scores, dtype=float).tolist()
+    assignment_noise = np.asarray(problem.assignment_noise, dtype=float).tolist()
+
+    prob = pulp.LpProblem("TeamBalancer", pulp.LpMinimize)
+    x = pulp.LpVariable.dicts(
+        "team_assignment",
+        ((i, j) for i in range(10) for j in range(2)),
+        cat="Binary"
+    )
+
+    # 制約条件1: 各プレイヤーは1つのチームのみに所属
+    for i in range(10):
+        prob += pulp.lpSum(x[i, j] for j in range(2)) == 1
+
+    # 制約条件2: 各チーム5人
+    for j in range(2):
+        prob += pulp.lpSum(x[i, j] for i in range(10)) == 5
+
+    # 制約条件3: チーム制約グループの処理（プリソルブ済みのブロックと辺）
+    for constraint_type, group_indices in problem.plan.as_constraints():
+        if constraint_type == "same":
+            # 同じチーム制約: ブロックの最初のメンバーと他のメンバーが同じチームになるように制約
+            first_member = group_indices[0]
+            for member in group_indices[1:]:
+                # x[first, 0] == x[member, 0] を実現
+                prob += x[first_member, 0] == x[member, 0]
+
+        elif constraint_type == "opposite":
+            # 違うチーム制約: 2つのブロックの代表が違うチームに割り当てられる
+            member1, member2 = group_indices
+            # x[member1, 0] + x[member2, 0] == 1 を実現
+            prob += x[member1, 0] + x[member2, 0] == 1
+
+    # チーム間の差分計算
+    rank_diff = pulp.lpSum(
+        rank_scores[i] * x[i, 0] for i in range(10)
+    ) - pulp.lpSum(rank_scores[i] * x[i, 1] for i in range(10))
+
+    role_diff = pulp.lpSum(
+        role_scores[i] * x[i, 0] for i in range(10)
+    ) - pulp.lpSum(role_scores[i] * x[i, 1] for i in range(10))
+
+    if with_limits:
+        # 制約条件4: チーム間のランク差を制限
+        prob += rank_diff <= problem.rank_limit
+        prob += rank_diff >= -problem.rank_limit
+
+        # 制約条件5: チーム間のロール習熟度差を制限
+        prob += role_diff <= problem.role_limit
+        prob += role_diff >= -problem.role_limit
+
+    # 目的関数のための補助変数
+    rank_diff_pos = pulp.LpVariable("rank_diff_pos", 0)
+    rank_diff_neg = pulp.LpVariable("rank_diff_neg", 0)
+    role_diff_pos = pulp.LpVariable("role_diff_pos", 0)
+    role_diff_neg = pulp.LpVariable("role_diff_neg", 0)
+
+    prob += rank_diff == rank_diff_pos - rank_diff_neg
+    prob += role_diff == role_diff_pos - role_diff_neg
+
+    # 目的関数
+    prob += (
+        rank_diff_pos
+        + rank_diff_neg
+        + role_diff_pos
+        + role_diff_neg
+        + pulp.lpSum(
+            assignment_noise[i][j] * x[i, j]
+            for i in range(10) for j in range(2)
+        )
+    )
+
+    # 最適化問題を解く
+    prob.solve(solver)
+    if with_limits and prob.status == pulp.LpStatusInfeasible:
+        return _solve_split_lp(problem, solver, with_limits=False)
+    _check_lp_status(prob)
+
+    # ソルバーは 0.9999999 のような値を返すことがあるため、0.5で丸める
+    return [pulp.value(x[i, 0]) > 0.5 for i in range(10)]
+
+
+def _solve_roles_exact(score_matrices: np.ndarray, time_limit: float) -> List[List[int]]:
+    """120通りの順列表で全チームのロール割り当てを一括で解く"""
+    return balance_engine.best_role_assignments(
+        np.asarray(score_matrices, dtype=float)
+    ).tolist()
+
+
+def _solve_roles_lp(
+    score_matrices: np.ndarray, backend: str, time_limit: float
+) -> List[List[int]]:
+    """線形計画法でチームごとにロール割り当てを解く
+
+    制限時間は全チームで共有し、各チームには残り時間を渡す。
+    """
+    import pulp
+
+    deadline = time.perf_counter() + time_limit
+    assignments = []
+    for score_matrix in np.asarray(score_matrices, dtype=float).tolist():
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            raise SolverTimeoutError("time limit reached before all teams were solved")
+        solver = _lp_solver(backend, remaining)
+
+        n_players = len(score_matrix)
+
+        # 線形計画問題の設定
+        prob = pulp.LpProblem("RoleAssignment", pulp.LpMaximize)
+
+        # 変数定義: x[i, j] = プレイヤーiがロールjに割り当てられるか（0 or 1）
+        x = pulp.LpVariable.dicts(
+            "assignment",
+            ((i, j) for i in range(n_players) for j in range(5)),
+            cat="Binary"
+        )
+
+        # 制約条件1: 各プレイヤーは1つのロールのみ
+        for i in range(n_players):
+            prob += pulp.lpSum(x[i, j] for j in range(5)) == 1
+
+        # 制約条件2: 各ロールに1人のみ
+        for j in range(5):
+            prob += pulp.lpSum(x[i, j] for i in range(n_players)) == 1
+
+        # 目的関数: 総スコアを最大化
+        prob += pulp.lpSum(
+            score_matrix[i][j] * x[i, j]
+            for i in range(n_players)
+            for j in range(5)
+        )
+
+        # 最適化問題を解く
+        prob.solve(solver)
+        _check_lp_status(prob)
+
+        # 値が厳密に1とは限らないため、最大の変数のロールを選ぶ
+        assignments.append(
+            [
+                max(range(5), key=lambda j: pulp.value(x[i, j]))
+                for i in range(n_players)
+            ]
+        )
+    return assignments
+
+
+SolverFn = Callable[[Any, float], Any]
+
+SPLIT_SOLVERS: Dict[str, SolverFn] = {
+    "exact": _solve_split_exact,
+    "cbc": lambda problem, t: _solve_split_lp(problem, _lp_solver("cbc", t)),
+    "highs": lambda problem, t: _solve_split_lp(problem, _lp_solver("highs", t)),
+}
+
+ROLE_SOLVERS: Dict[str, SolverFn] = {
+    "exact": _solve_roles_exact,
+    "cbc": lambda matrices, t: _solve_roles_lp(matrices, "cbc", t),
+    "highs": lambda matrices, t: _solve_roles_lp(matrices, "highs", t),
+}
+
+
+def resolve_chain(backend: Union[str, Sequence[str], None] = None) -> List[str]:
+    """バックエンド指定をフォールバック順のリストに変換
+
+    Args:
+        backend: バックエンド名、カンマ区切りの文字列、またはリスト。
+            Noneの場合は環境変数 BALANCE_SOLVER_CHAIN（既定: exact,cbc,highs）
+    """
+    if backend is None:
+        backend = os.environ.get("BALANCE_SOLVER_CHAIN", ",".join(DEFAULT_SOLVER_CHAIN))
+    if isinstance(backend, str):
+        backend = backend.split(",")
+
+    chain = [SOLVER_ALIASES.get(name.strip(), name.strip()) for name in backend]
+    for name in chain:
+        if name not in SPLIT_SOLVERS:
+            raise ValueError(f"Unknown balance backend: {name}")
+    if not chain:
+        raise ValueError("No balance backend specified")
+    return chain
+
+
+def resolve_time_limit(time_limit: Optional[float] = None) -> float:
+    """制限時間を決定（Noneの場合は環境変数 BALANCE_SOLVER_TIME_LIMIT）"""
+    if time_limit is None:
+        time_limit = float(
+            os.environ.get("BALANCE_SOLVER_TIME_LIMIT", DEFAULT_TIME_LIMIT)
+        )
+    if time_limit <= 0:
+        raise ValueError("Solver time limit must be positive")
+    return time_limit
+
+
+def run_with_fallback(
+    registry: Dict[str, SolverFn],
+    chain: List[str],
+    problem: Any,
+    time_limit: float,
+) -> Tuple[Any, Dict]:
+    """フォールバック順にバックエンドを試し、最初に解けた結果を返す
+
+    各バックエンドには残り時間を制限時間として渡す。
+    INSTANT_SOLVERS は残り時間が無くても実行する。
+
+    Returns:
+        (結果, {"backend": 使用したバックエンド, "elapsedMs": 所要時間,
+                "fallbacks": [{"backend": 飛ばしたバックエンド, "error": 理由}]})
+    """
+    started_at = time.perf_counter()
+    deadline = started_at + time_limit
+    fallbacks = []
+
+    for name in chain:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0 and name not in INSTANT_SOLVERS:
+            fallbacks.append({"backend": name, "error": "deadline exceeded"})
+            continue
+        try:
+            result = registry[name](problem, remaining)
+        except SolverError as e:
+            fallbacks.append({"backend": name, "error": str(e)})
+            continue
+
+        return result, {
+            "backend": name,
+            "elapsedMs": (time.perf_counter() - started_at) * 1000,
+            "fallbacks": fallbacks,
+        }
+
+    details = "; ".join(f"{f['backend']}: {f['error']}" for f in fallbacks)
+    raise SolverError(f"All solver backends failed ({details})")
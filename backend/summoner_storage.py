@@ -3,8 +3,8 @@ import time
 from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional
 
-import boto3
-from logger import log
+from aws_resources import dynamodb_table
+from logger import Payload, log
 
 
 def serialize_dynamodb_item(raw_data: Any) -> Any:
@@ -24,8 +24,7 @@ def serialize_dynamodb_item(raw_data: Any) -> Any:
 
 class SummonerStorage:
     def __init__(self):
-        self.dynamodb = boto3.resource("dynamodb")
-        self.table = self.dynamodb.Table("summoner-storage")
+        self.table = dynamodb_table("summoner-storage")
         self.expiration_days = 14  # 2週間
 
     def save_summoners(
@@ -45,13 +44,21 @@ class SummonerStorage:
                 "ttl": expiration_time,
             }
         )
-        log.info(f"Saved summoners data: {result}")
+        log.debug("put_item response: %s", Payload(result))
 
         return {"passphrase": passphrase, "expiresAt": expiration_time}
 
-    def load_summoners(self, passphrase: str) -> Optional[List[Dict]]:
-        """合言葉を使ってサモナー情報を読み込む"""
-        log.info(f"Loading summoners data with passphrase: {passphrase}")
+    def load_summoners(
+        self, passphrase: str, convert_decimals: bool = True
+    ) -> Optional[List[Dict]]:
+        """合言葉を使ってサモナー情報を読み込む
+
+        Args:
+            passphrase: 合言葉
+            convert_decimals: DynamoDBのDecimalを通常の数値型に変換するか
+                （Falseの場合はDecimalのまま返す）
+        """
+        log.info("Loading summoners data with passphrase: %s", passphrase)
         try:
             response = self.table.get_item(
                 Key={"passphrase": passphrase}, ConsistentRead=True
@@ -68,8 +75,21 @@ class SummonerStorage:
                 log.error("Item expired")
                 return None
 
+            if not convert_decimals:
+                return item["summoners"]
             return serialize_dynamodb_item(item["summoners"])
 
         except Exception as e:
-            log.error(f"Error loading summoners: {str(e)}")
+            log.error("Error loading summoners: %s", e)
             return None
+
+
+_storage: Optional[SummonerStorage] = None
+
+
+def get_summoner_storage() -> SummonerStorage:
+    """ウォームコンテナで使い回す SummonerStorage を返す"""
+    global _storage
+    if _storage is None:
+        _storage = SummonerStorage()
+    return _storage
@@ -0,0 +1,197 @@
+"""チーム制約グループの前処理（プリソルブ）
+
+"same" グループは Union-Find でブロック（同じチームに入るプレイヤーの塊）にまとめ、
+"opposite" グループはブロック間の辺として2色塗り分け問題にする。
+矛盾や人数超過はソルバーに渡す前にエラーとして検出する。
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+CONSTRAINT_TYPES = ("same", "opposite")
+
+
+class ConstraintError(ValueError):
+    """チーム制約グループが満たせない場合のエラー"""
+
+
+class ConstraintPlan:
+    """プリソルブ結果
+
+    Attributes:
+        blocks: ブロックごとのプレイヤーインデックス（全プレイヤーがどれか1つに属する）
+        block_of: プレイヤーごとのブロック番号
+        opposite_edges: 違うチームに入るブロックのペア
+        components: 違うチーム制約で繋がったブロックの連結成分。
+            (片側のプレイヤーインデックス, 反対側のプレイヤーインデックス) のタプル
+    """
+
+    def __init__(
+        self,
+        blocks: List[List[int]],
+        block_of: List[int],
+        opposite_edges: List[Tuple[int, int]],
+        components: List[Tuple[List[int], List[int]]],
+    ):
+        self.blocks = blocks
+        self.block_of = block_of
+        self.opposite_edges = opposite_edges
+        self.components = components
+
+    def as_constraints(self) -> List[Tuple[str, List[int]]]:
+        """(制約タイプ, プレイヤーインデックス) 形式の制約リストに変換"""
+        constraints = [("same", block) for block in self.blocks if len(block) >= 2]
+        constraints.extend(
+            ("opposite", [self.blocks[u][0], self.blocks[v][0]])
+            for u, v in self.opposite_edges
+        )
+        return constraints
+
+
+def _group_label(group: Dict, index: int) -> str:
+    return str(group.get("id", f"#{index}"))
+
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def presolve_constraints(
+    summoner_ids: List[str],
+    team_constraint_groups: Optional[List[Dict]],
+    team_size: int = 5,
+    n_teams: int = 2,
+) -> ConstraintPlan:
+    """チーム制約グループを検証し、ブロックと2色塗り分けの連結成分に変換
+
+    Args:
+        summoner_ids: サモナーIDのリスト（インデックスがプレイヤー番号）
+        team_constraint_groups: チーム制約グループのリスト
+            例: [{"id": "group1", "summonerIds": ["sid_01", "sid_02"], "type": "same"}]
+            存在しないサモナーIDは無視し、有効なメンバーが2人未満のグループはスキップする
+        team_size: 1チームの人数
+        n_teams: チーム数。2の場合は全員を2チームに分けられるかまで検証する
+
+    Raises:
+        ConstraintError: 制約が矛盾している、または人数が収まらない場合
+    """
+    n_players = len(summoner_ids)
+    summoner_id_to_index = {sid: i for i, sid in enumerate(summoner_ids)}
+
+    parent = list(range(n_players))
+    member_groups: Dict[int, List[str]] = {}
+    opposite_pairs: List[Tuple[int, int, str]] = []
+
+    for group_index, group in enumerate(team_constraint_groups or []):
+        label = _group_label(group, group_index)
+        constraint_type = group.get("type", "same")  # デフォルトは"same"
+        if constraint_type not in CONSTRAINT_TYPES:
+            raise ConstraintError(
+                f"Unknown constraint type '{constraint_type}' in group {label}"
+            )
+
+        indices = list(
+            dict.fromkeys(
+                summoner_id_to_index[sid]
+                for sid in group.get("summonerIds", [])
+                if sid in summoner_id_to_index
+            )
+        )
+        if len(indices) < 2:
+            continue  # 有効なサモナーが2人未満の場合はスキップ
+
+        if constraint_type == "same":
+            root = _find(parent, indices[0])
+            for member in indices[1:]:
+                parent[_find(parent, member)] = root
+            for member in indices:
+                member_groups.setdefault(member, []).append(label)
+        else:
+            if len(indices) > 2:
+                raise ConstraintError(
+                    f"Opposite constraint group {label} has {len(indices)} summoners; "
+                    "only 2 summoners can be placed on different teams"
+                )
+            opposite_pairs.append((indices[0], indices[1], label))
+
+    # ブロックを作成
+    block_of_root: Dict[int, int] = {}
+    blocks: List[List[int]] = []
+    block_of = []
+    for i in range(n_players):
+        root = _find(parent, i)
+        if root not in block_of_root:
+            block_of_root[root] = len(blocks)
+            blocks.append([])
+        blocks[block_of_root[root]].append(i)
+        block_of.append(block_of_root[root])
+
+    for block in blocks:
+        if len(block) > team_size:
+            labels = sorted({g for i in block for g in member_groups.get(i, [])})
+            raise ConstraintError(
+                f"Same-team constraint groups {', '.join(labels)} put {len(block)} "
+                f"summoners on one team (max {team_size})"
+            )
+
+    # 違うチーム制約をブロック間の辺にする
+    opposite_edges: List[Tuple[int, int]] = []
+    neighbors: Dict[int, List[Tuple[int, str]]] = {}
+    for a, b, label in opposite_pairs:
+        u, v = block_of[a], block_of[b]
+        if u == v:
+            raise ConstraintError(
+                f"Opposite constraint group {label} contains summoners "
+                "that same-team constraints put together"
+            )
+        opposite_edges.append((u, v))
+        neighbors.setdefault(u, []).append((v, label))
+        neighbors.setdefault(v, []).append((u, label))
+
+    # 2色塗り分け（奇数長の閉路があれば矛盾）
+    side = [-1] * len(blocks)
+    components: List[Tuple[List[int], List[int]]] = []
+    for start in range(len(blocks)):
+        if side[start] != -1:
+            continue
+        side[start] = 0
+        sides: Tuple[List[int], List[int]] = ([], [])
+        stack = [start]
+        while stack:
+            u = stack.pop()
+            sides[side[u]].extend(blocks[u])
+            for v, label in neighbors.get(u, []):
+                if side[v] == -1:
+                    side[v] = 1 - side[u]
+                    stack.append(v)
+                elif side[v] == side[u]:
+                    raise ConstraintError(
+                        f"Opposite constraint group {label} contradicts the other "
+                        "constraints (they cannot be satisfied with two teams)"
+                    )
+        for players in sides:
+            if len(players) > team_size:
+                raise ConstraintError(
+                    f"Constraint groups force {len(players)} summoners onto one team "
+                    f"(max {team_size})"
+                )
+        components.append((sorted(sides[0]), sorted(sides[1])))
+
+    # 2チームの場合、連結成分の向きを選んで team_size 人ずつに分けられるか（部分和）
+    if n_teams == 2 and n_players == team_size * 2:
+        reachable = {0}
+        for side0, side1 in components:
+            reachable = {
+                size + len(players)
+                for size in reachable
+                for players in (side0, side1)
+                if size + len(players) <= team_size
+            }
+        if team_size not in reachable:
+            raise ConstraintError(
+                f"Team constraint groups cannot be split into two teams of {team_size}"
+            )
+
+    return ConstraintPlan(blocks, block_of, opposite_edges, components)
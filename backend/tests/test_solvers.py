@@ -0,0 +1,284 @@
+"""全探索エンジン・CBC・チーム制約のプリソルブ・レート制限のテスト"""
+
+import numpy as np
+import pytest
+
+import balance_engine
+import rate_limiter
+import solvers
+from team_constraints import ConstraintError, presolve_constraints
+
+SUMMONER_IDS = [f"sid_{i:02d}" for i in range(10)]
+
+
+def _cbc_available() -> bool:
+    try:
+        solvers._lp_solver("cbc", 1.0)
+    except (ImportError, solvers.SolverUnavailableError):
+        return False
+    return True
+
+
+requires_cbc = pytest.mark.skipif(not _cbc_available(), reason="CBC is not available")
+
+
+def _split_objective(problem: solvers.SplitProblem, team_a: list) -> float:
+    """チームAのマスクに対する目的関数値（ランク差 + ロール差 + ノイズ）"""
+    mask = np.asarray(team_a, dtype=bool)
+    signs = np.where(mask, 1.0, -1.0)
+    noise = problem.assignment_noise
+    return (
+        abs(signs @ problem.rank_scores)
+        + abs(signs @ problem.role_scores)
+        + noise[mask, 0].sum()
+        + noise[~mask, 1].sum()
+    )
+
+
+def _random_problem(
+    rng: np.random.Generator, groups=None, limit: float = 1e6
+) -> solvers.SplitProblem:
+    return solvers.SplitProblem(
+        rank_scores=rng.uniform(800, 3000, 10),
+        role_scores=rng.uniform(0, 500, 10),
+        assignment_noise=rng.uniform(0, 50, (10, 2)),
+        plan=presolve_constraints(SUMMONER_IDS, groups),
+        rank_limit=limit,
+        role_limit=limit,
+    )
+
+
+@requires_cbc
+@pytest.mark.parametrize("seed", range(8))
+@pytest.mark.parametrize("limit", [1e6, 100.0])
+def test_exact_and_cbc_agree_on_split_objective(seed, limit):
+    problem = _random_problem(np.random.default_rng(seed), limit=limit)
+
+    exact = solvers.SPLIT_SOLVERS["exact"](problem, 5.0)
+    cbc = solvers.SPLIT_SOLVERS["cbc"](problem, 5.0)
+
+    assert sum(exact) == sum(cbc) == 5
+    assert _split_objective(problem, exact) == pytest.approx(
+        _split_objective(problem, cbc), rel=1e-6
+    )
+
+
+@requires_cbc
+@pytest.mark.parametrize("seed", range(4))
+def test_exact_and_cbc_agree_with_team_constraints(seed):
+    groups = [
+        {"id": "duo", "summonerIds": ["sid_00", "sid_01"], "type": "same"},
+        {"id": "rivals", "summonerIds": ["sid_02", "sid_03"], "type": "opposite"},
+    ]
+    problem = _random_problem(np.random.default_rng(seed), groups)
+
+    exact = solvers.SPLIT_SOLVERS["exact"](problem, 5.0)
+    cbc = solvers.SPLIT_SOLVERS["cbc"](problem, 5.0)
+
+    for team_a in (exact, cbc):
+        assert team_a[0] == team_a[1]
+        assert team_a[2] != team_a[3]
+    assert _split_objective(problem, exact) == pytest.approx(
+        _split_objective(problem, cbc), rel=1e-6
+    )
+
+
+@requires_cbc
+@pytest.mark.parametrize("seed", range(4))
+def test_exact_and_cbc_agree_on_role_score(seed):
+    score_matrices = np.random.default_rng(seed).uniform(0, 100, (3, 5, 5))
+    players = np.arange(5)
+
+    exact = solvers.ROLE_SOLVERS["exact"](score_matrices, 5.0)
+    cbc = solvers.ROLE_SOLVERS["cbc"](score_matrices, 5.0)
+
+    for matrix, exact_roles, cbc_roles in zip(score_matrices, exact, cbc):
+        assert sorted(exact_roles) == sorted(cbc_roles) == list(range(5))
+        assert matrix[players, exact_roles].sum() == pytest.approx(
+            matrix[players, cbc_roles].sum(), rel=1e-9
+        )
+
+
+def test_exact_engine_matches_brute_force():
+    problem = _random_problem(np.random.default_rng(42))
+
+    exact = solvers.SPLIT_SOLVERS["exact"](problem, 5.0)
+
+    best = min(
+        _split_objective(problem, mask) for mask in balance_engine.SPLIT_MASKS
+    )
+    assert _split_objective(problem, exact) == pytest.approx(best)
+
+
+@pytest.mark.parametrize(
+    "groups, message",
+    [
+        (
+            [{"id": "g", "summonerIds": ["sid_00", "sid_01"], "type": "both"}],
+            "Unknown constraint type",
+        ),
+        (
+            [{"id": "g", "summonerIds": SUMMONER_IDS[:3], "type": "opposite"}],
+            "only 2 summoners",
+        ),
+        (
+            [{"id": "g", "summonerIds": SUMMONER_IDS[:6], "type": "same"}],
+            "put 6 summoners on one team",
+        ),
+        (
+            [
+                {"id": "duo", "summonerIds": ["sid_00", "sid_01"], "type": "same"},
+                {"id": "g", "summonerIds": ["sid_00", "sid_01"], "type": "opposite"},
+            ],
+            "same-team constraints put together",
+        ),
+        (
+            [
+                {"id": "ab", "summonerIds": ["sid_00", "sid_01"], "type": "opposite"},
+                {"id": "bc", "summonerIds": ["sid_01", "sid_02"], "type": "opposite"},
+                {"id": "ca", "summonerIds": ["sid_02", "sid_00"], "type": "opposite"},
+            ],
+            "cannot be satisfied with two teams",
+        ),
+        (
+            [
+                {"id": f"g{i}", "summonerIds": ["sid_00", sid], "type": "opposite"}
+                for i, sid in enumerate(SUMMONER_IDS[1:7])
+            ],
+            "force 6 summoners onto one team",
+        ),
+        (
+            [
+                {"id": "a", "summonerIds": SUMMONER_IDS[0:3], "type": "same"},
+                {"id": "b", "summonerIds": SUMMONER_IDS[3:6], "type": "same"},
+                {"id": "c", "summonerIds": SUMMONER_IDS[6:9], "type": "same"},
+            ],
+            "cannot be split into two teams of 5",
+        ),
+    ],
+)
+def test_presolve_constraints_errors(groups, message):
+    with pytest.raises(ConstraintError, match=message):
+        presolve_constraints(SUMMONER_IDS, groups)
+
+
+def test_presolve_constraints_error_is_value_error():
+    # APIでは ValueError を400として返す
+    assert issubclass(ConstraintError, ValueError)
+
+
+def test_presolve_constraints_ignores_unknown_summoners():
+    plan = presolve_constraints(
+        SUMMONER_IDS,
+        [
+            {"id": "g", "summonerIds": ["sid_00", "unknown"], "type": "same"},
+            {"id": "h", "summonerIds": ["sid_01", "unknown"], "type": "opposite"},
+        ],
+    )
+
+    assert len(plan.blocks) == 10
+    assert plan.opposite_edges == []
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock)
+    return clock
+
+
+def _learned_limiter(app_limits: str) -> rate_limiter.RateLimiter:
+    """エンドポイントの制限を学習済みのレート制限"""
+    limiter = rate_limiter.RateLimiter(app_limits)
+    limiter.update("host", "match", 200, {"X-Method-Rate-Limit": "1000:10"})
+    return limiter
+
+
+def test_rate_window_limits_any_interval():
+    window = rate_limiter.RateWindow(2, 1.0)
+    seconds = 1.0 + rate_limiter.WINDOW_MARGIN
+
+    window.reserve(0.0)
+    window.reserve(0.0)
+
+    assert window.earliest(0.0) == pytest.approx(seconds)
+    assert window.earliest(0.5) == pytest.approx(seconds)
+    window.reserve(seconds)
+    window.reserve(seconds)
+    assert window.earliest(seconds) == pytest.approx(2 * seconds)
+
+
+def test_rate_window_prune_and_sync():
+    window = rate_limiter.RateWindow(10, 1.0)
+    window.reserve(0.0)
+    window.reserve(0.9)
+
+    window.prune(1.5)
+    assert window.times == [0.9]
+
+    # サーバー側の件数が予約表より多い分だけ now に追加する
+    window.sync(3, 1.5)
+    assert window.times == [0.9, 1.5, 1.5]
+    window.sync(2, 1.5)
+    assert len(window.times) == 3
+
+
+def test_rate_limiter_spaces_reservations(clock):
+    limiter = _learned_limiter("2:1")
+    start = clock.now
+
+    times = [limiter.reserve("host", "match") for _ in range(5)]
+
+    seconds = 1.0 + rate_limiter.WINDOW_MARGIN
+    assert times[0] == times[1] == pytest.approx(start)
+    assert times[2] == pytest.approx(start + seconds)
+    assert times[3] == pytest.approx(start + seconds)
+    assert times[4] == pytest.approx(start + 2 * seconds)
+
+
+def test_rate_limiter_counts_requests_from_headers(clock):
+    limiter = _learned_limiter("3:1")
+
+    # 他のコンテナが同じキーで3件使っている
+    limiter.update(
+        "host",
+        "match",
+        200,
+        {"X-App-Rate-Limit": "3:1", "X-App-Rate-Limit-Count": "3:1"},
+    )
+
+    assert limiter.reserve("host", "match") == pytest.approx(
+        clock.now + 1.0 + rate_limiter.WINDOW_MARGIN
+    )
+
+
+def test_rate_limiter_retry_after_blocks_scope(clock):
+    limiter = _learned_limiter("100:1")
+    limiter.update("host", "other", 200, {"X-Method-Rate-Limit": "1000:10"})
+
+    retry_after = limiter.update(
+        "host",
+        "match",
+        429,
+        {"Retry-After": "3", "X-Rate-Limit-Type": "method"},
+    )
+
+    assert retry_after == 3.0
+    assert limiter.reserve("host", "match") == pytest.approx(clock.now + 3.0)
+    assert limiter.reserve("host", "other") == pytest.approx(clock.now)
+
+    limiter.update(
+        "host",
+        "other",
+        429,
+        {"Retry-After": "5", "X-Rate-Limit-Type": "application"},
+    )
+    assert limiter.reserve("host", "other") == pytest.approx(clock.now + 5.0)